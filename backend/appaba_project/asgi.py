@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'appaba_project.settings')
+# No ASGI usamos as views async de terapia/views_async.py (VIEWS_ASYNC=0 desliga).
+os.environ.setdefault('VIEWS_ASYNC', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,21 +54,42 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'terapia.middleware.InstrumentacaoMiddleware',
+    'terapia.middleware.FixarPrimarioMiddleware',
 ]
 
+# Instrumentação por requisição (terapia/instrumentacao.py), exposta em /metricas/
+INSTRUMENTACAO_ATIVA = os.environ.get("INSTRUMENTACAO_ATIVA", "1") == "1"
+INSTRUMENTACAO_BUFFER = 1000  # amostras recentes mantidas em memória (por processo)
+INSTRUMENTACAO_LIMIAR_DUPLICADAS = 3  # mesma consulta N vezes na requisição = possível N+1
+INSTRUMENTACAO_IPS_PERMITIDOS = ['127.0.0.1', '::1']  # quem pode ler /metricas/ sem ser staff
+
+# Views async do registro de sessão e relatórios (terapia/views_async.py);
+# ligadas por padrão no perfil ASGI (appaba_project/asgi.py).
+VIEWS_ASYNC = os.environ.get("VIEWS_ASYNC", "0") == "1"
+
 ROOT_URLCONF = 'appaba_project.urls'
 
+CARREGADORES_TEMPLATES = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Fora do DEBUG os templates são compilados uma vez por processo;
+            # em desenvolvimento são relidos a cada render. Os fragmentos
+            # {% cache %} usam o cache 'template_fragments' se existir, senão o 'default'.
+            'loaders': CARREGADORES_TEMPLATES if DEBUG else [
+                ('django.template.loaders.cached.Loader', CARREGADORES_TEMPLATES),
+            ],
         },
     },
 ]
@@ -77,13 +99,113 @@ WSGI_APPLICATION = 'appaba_project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite por padrão; DB_ENGINE=postgresql (com DB_NAME, DB_USER, DB_PASSWORD,
+# DB_HOST, DB_PORT) para produção.
+
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite3")
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("DB_NAME", "appaba"),
+            'USER': os.environ.get("DB_USER", ""),
+            'PASSWORD': os.environ.get("DB_PASSWORD", ""),
+            'HOST': os.environ.get("DB_HOST", ""),
+            'PORT': os.environ.get("DB_PORT", ""),
+            # conexões persistentes, verificadas antes de reutilizar
+            'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get("DB_POOL") == "1":
+        # pool do psycopg 3 (pip install "psycopg[pool]"); não combina com CONN_MAX_AGE
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get("DB_POOL_MIN", "2")),
+            'max_size': int(os.environ.get("DB_POOL_MAX", "10")),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # WAL: leitores não bloqueiam o escritor; NORMAL é seguro com WAL
+                'init_command': "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+                # espera o lock em vez de falhar com "database is locked"
+                'timeout': int(os.environ.get("DB_TIMEOUT", "20")),
+                # pega o lock de escrita no início da transação (sem upgrade com deadlock)
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # banco de teste em arquivo (não em memória compartilhada), para
+            # os testes de concorrência exercitarem o WAL e o timeout acima
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Réplica de leitura (opcional): DB_REPLICA_HOST no PostgreSQL ou
+# DB_REPLICA_NAME (outro arquivo) no SQLite. Usada só pelas views marcadas
+# em terapia/replica.py; após uma escrita o usuário lê do principal por
+# REPLICA_FIXAR_SEGUNDOS.
+if os.environ.get("DB_REPLICA_HOST") or os.environ.get("DB_REPLICA_NAME"):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get("DB_REPLICA_NAME", DATABASES['default']['NAME']),
+        'HOST': os.environ.get("DB_REPLICA_HOST", DATABASES['default'].get('HOST', "")),
+        'PORT': os.environ.get("DB_REPLICA_PORT", DATABASES['default'].get('PORT', "")),
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['terapia.replica.RoteadorReplica']
+REPLICA_FIXAR_SEGUNDOS = int(os.environ.get("DB_REPLICA_FIXAR_SEGUNDOS", "5"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Memória local por padrão; defina DJANGO_CACHE_DIR para usar cache em arquivo
+# (compartilhado entre os processos do servidor).
+
+# Com mais de um processo (gunicorn --workers N), DJANGO_CACHE_DIR é
+# obrigatório: os carimbos de versão (terapia/versoes.py) só invalidam o que
+# está em cache se todos os processos lerem o mesmo cache. O cache local
+# (locmem) serve para um processo só.
+if os.environ.get("DJANGO_CACHE_DIR"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ["DJANGO_CACHE_DIR"],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'appaba',
+        }
+    }
+
+# API (Django REST framework)
+# Clientes da API mandam `Authorization: Bearer <acesso>` (terapia/autenticacao.py):
+# validado pela assinatura, sem sessão nem consulta ao usuário. O navegador
+# continua na sessão (com CSRF). Tokens em /api/token/ e /api/token/renovar/.
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'terapia.autenticacao.AcessoAssinadoAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
 }
+API_TOKEN_ACESSO_SEGUNDOS = int(os.environ.get("API_TOKEN_ACESSO_SEGUNDOS", "300"))
+# token de renovação: uso único, trocado a cada /api/token/renovar/
+API_TOKEN_RENOVACAO_SEGUNDOS = int(os.environ.get("API_TOKEN_RENOVACAO_SEGUNDOS", str(60 * 60 * 24 * 30)))
+
+# Snapshot colunar para as análises entre pacientes (comando gerar_snapshot_analise)
+ANALISE_SNAPSHOT = Path(os.environ.get("ANALISE_SNAPSHOT", BASE_DIR / "snapshots" / "atividades.snap"))
 
 
 # Password validation
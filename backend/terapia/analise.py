@@ -0,0 +1,267 @@
+"""
+Análises entre pacientes (coortes) a partir de um snapshot colunar de
+AtividadeSessao, para não disputar o SQLite com as sessões em andamento.
+
+O snapshot é um único arquivo: cabeçalho JSON + uma coluna por bloco, cada
+uma um vetor binário de inteiros (módulo `array`). As linhas vêm ordenadas
+por (terapeuta, dia), então o recorte de um terapeuta e de um período sai por
+busca binária, e a leitura usa mmap: só as páginas tocadas são carregadas e
+o arquivo é compartilhado entre os processos do servidor.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import AtividadeSessao
+
+MAGICO = b"APSNAP1\0"
+ALINHAMENTO = 8
+
+# nome -> typecode do array (i = int32, b = int8)
+COLUNAS = {
+    "terapeuta": "i",
+    "dia": "i",  # date.toordinal()
+    "paciente": "i",
+    "atividade_modelo": "i",
+    "descricao": "i",  # índice no dicionário "descricoes" do cabeçalho
+    "positiva": "b",
+}
+AGRUPAMENTOS = ("atividade", "atividade_modelo", "paciente", "terapeuta", "dia", "mes")
+
+
+class SnapshotIndisponivel(Exception):
+    pass
+
+
+def caminho_snapshot():
+    return Path(settings.ANALISE_SNAPSHOT)
+
+
+# =========================
+# Escrita
+# =========================
+
+def gerar_snapshot(caminho=None, tamanho_lote=5000):
+    """
+    Lê AtividadeSessao (com sessão e atividade) em streaming e grava o
+    snapshot. O arquivo é escrito ao lado e trocado atomicamente no final,
+    então leitores nunca veem um snapshot pela metade. Retorna o nº de linhas.
+    """
+    caminho = Path(caminho or caminho_snapshot())
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    colunas = {nome: array(tipo) for nome, tipo in COLUNAS.items()}
+    descricoes, indice_descricao = [], {}
+
+    registros = (
+        AtividadeSessao.objects.order_by("sessao__terapeuta_id", "data_registro", "id")
+        .values_list(
+            "sessao__terapeuta_id", "data_registro", "sessao__paciente_id",
+            "atividade_modelo_id", "atividade_modelo__descricao", "resposta",
+        )
+        .iterator(chunk_size=tamanho_lote)
+    )
+    for terapeuta, data_registro, paciente, atividade, descricao, resposta in registros:
+        if descricao not in indice_descricao:
+            indice_descricao[descricao] = len(descricoes)
+            descricoes.append(descricao)
+        colunas["terapeuta"].append(terapeuta)
+        colunas["dia"].append(timezone.localdate(data_registro).toordinal())
+        colunas["paciente"].append(paciente)
+        colunas["atividade_modelo"].append(atividade)
+        colunas["descricao"].append(indice_descricao[descricao])
+        colunas["positiva"].append(resposta == "positiva")
+
+    # localdate é crescente em data_registro: as linhas já saem ordenadas por (terapeuta, dia)
+    linhas = len(colunas["dia"])
+
+    cabecalho = {
+        "gerado_em": timezone.now().isoformat(),
+        "linhas": linhas,
+        "descricoes": descricoes,
+        "colunas": {},
+    }
+    # offsets relativos ao início da área de dados (alinhada)
+    deslocamento = 0
+    for nome, valores in colunas.items():
+        tamanho = len(valores) * valores.itemsize
+        cabecalho["colunas"][nome] = {"tipo": valores.typecode, "offset": deslocamento, "bytes": tamanho}
+        deslocamento += _alinhar(tamanho)
+
+    bruto = json.dumps(cabecalho, ensure_ascii=False).encode("utf-8")
+    inicio_dados = _alinhar(len(MAGICO) + 8 + len(bruto))
+    temporario = caminho.with_suffix(caminho.suffix + ".tmp")
+    with open(temporario, "wb") as arquivo:
+        arquivo.write(MAGICO)
+        arquivo.write(struct.pack("<Q", len(bruto)))
+        arquivo.write(bruto)
+        arquivo.write(b"\0" * (inicio_dados - arquivo.tell()))
+        for valores in colunas.values():
+            dados = valores.tobytes()
+            arquivo.write(dados)
+            arquivo.write(b"\0" * (_alinhar(len(dados)) - len(dados)))
+    os.replace(temporario, caminho)
+    return linhas
+
+
+def _alinhar(tamanho):
+    return -(-tamanho // ALINHAMENTO) * ALINHAMENTO
+
+
+# =========================
+# Leitura
+# =========================
+
+class Snapshot:
+    """Snapshot aberto via mmap; as colunas são memoryviews sem cópia."""
+
+    def __init__(self, caminho):
+        with open(caminho, "rb") as arquivo:
+            try:
+                self._mmap = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # arquivo vazio
+                raise SnapshotIndisponivel("Arquivo de snapshot inválido.")
+        if self._mmap[: len(MAGICO)] != MAGICO:
+            raise SnapshotIndisponivel("Arquivo de snapshot inválido.")
+        (tamanho,) = struct.unpack_from("<Q", self._mmap, len(MAGICO))
+        inicio = len(MAGICO) + 8
+        self.cabecalho = json.loads(self._mmap[inicio:inicio + tamanho].decode("utf-8"))
+        inicio_dados = _alinhar(inicio + tamanho)
+        dados = memoryview(self._mmap)
+        self.colunas = {
+            nome: dados[inicio_dados + info["offset"]:inicio_dados + info["offset"] + info["bytes"]].cast(info["tipo"])
+            for nome, info in self.cabecalho["colunas"].items()
+        }
+        self.descricoes = self.cabecalho["descricoes"]
+        self.linhas = self.cabecalho["linhas"]
+
+    def faixa(self, terapeuta_id=None, dia_inicio=None, dia_fim=None):
+        """(início, fim) das linhas do terapeuta no período, por busca binária."""
+        terapeutas, dias = self.colunas["terapeuta"], self.colunas["dia"]
+        if terapeuta_id is None:
+            return 0, self.linhas
+        lo = bisect.bisect_left(terapeutas, terapeuta_id)
+        hi = bisect.bisect_right(terapeutas, terapeuta_id, lo)
+        if dia_inicio is not None:
+            lo = bisect.bisect_left(dias, dia_inicio.toordinal(), lo, hi)
+        if dia_fim is not None:
+            hi = bisect.bisect_right(dias, dia_fim.toordinal(), lo, hi)
+        return lo, hi
+
+
+_aberto = {"chave": None, "snapshot": None}
+_lock = threading.Lock()
+
+
+def abrir_snapshot():
+    """Snapshot atual, reaberto só quando o arquivo é trocado (mtime/tamanho)."""
+    caminho = caminho_snapshot()
+    try:
+        estado = caminho.stat()
+    except FileNotFoundError:
+        raise SnapshotIndisponivel("Snapshot ainda não gerado (rode gerar_snapshot_analise).")
+    chave = (str(caminho), estado.st_mtime_ns, estado.st_size)
+    with _lock:
+        if _aberto["chave"] != chave:
+            _aberto["snapshot"] = Snapshot(caminho)
+            _aberto["chave"] = chave
+        return _aberto["snapshot"]
+
+
+def _chave_grupo(agrupar, snapshot):
+    """Coluna usada para agrupar e função que transforma o código no rótulo."""
+    if agrupar == "atividade":
+        return "descricao", lambda codigo: snapshot.descricoes[codigo]
+    if agrupar in ("dia", "mes"):
+        return "dia", lambda codigo: date.fromordinal(codigo).isoformat()
+    return agrupar, lambda codigo: codigo
+
+
+def consultar(
+    agrupar="atividade",
+    terapeuta_id=None,
+    data_inicio=None,
+    data_fim=None,
+    paciente_id=None,
+    atividade_modelo_id=None,
+    minimo_respostas=1,
+):
+    """
+    Respostas, positivas, taxa de acerto e nº de pacientes por grupo, lidos
+    do snapshot. Sem `terapeuta_id` considera a clínica inteira.
+    """
+    if agrupar not in AGRUPAMENTOS:
+        raise ValueError(f"agrupar deve ser um de: {', '.join(AGRUPAMENTOS)}")
+    snapshot = abrir_snapshot()
+    lo, hi = snapshot.faixa(terapeuta_id, data_inicio, data_fim)
+    coluna, rotulo = _chave_grupo(agrupar, snapshot)
+    grupos = snapshot.colunas[coluna][lo:hi]
+    positivas = snapshot.colunas["positiva"][lo:hi]
+    pacientes = snapshot.colunas["paciente"][lo:hi]
+    dias = snapshot.colunas["dia"][lo:hi]
+    atividades = snapshot.colunas["atividade_modelo"][lo:hi]
+
+    # o recorte por terapeuta já limita o período; na clínica inteira filtra linha a linha
+    filtros = []
+    if terapeuta_id is None and data_inicio is not None:
+        filtros.append(lambda i, minimo=data_inicio.toordinal(): dias[i] >= minimo)
+    if terapeuta_id is None and data_fim is not None:
+        filtros.append(lambda i, maximo=data_fim.toordinal(): dias[i] <= maximo)
+    if paciente_id is not None:
+        filtros.append(lambda i: pacientes[i] == paciente_id)
+    if atividade_modelo_id is not None:
+        filtros.append(lambda i: atividades[i] == atividade_modelo_id)
+
+    totais = defaultdict(lambda: [0, 0])
+    pacientes_por_grupo = defaultdict(set)
+    indices = range(hi - lo)
+    if filtros:
+        indices = (i for i in indices if all(filtro(i) for filtro in filtros))
+    for i in indices:
+        total = totais[grupos[i]]
+        total[0] += 1
+        total[1] += positivas[i]
+        pacientes_por_grupo[grupos[i]].add(pacientes[i])
+
+    if agrupar == "mes":
+        totais, pacientes_por_grupo = _por_mes(totais, pacientes_por_grupo)
+        rotulo = lambda codigo: codigo  # noqa: E731
+
+    resultado = [
+        {
+            "grupo": rotulo(codigo),
+            "respostas": respostas,
+            "positivas": positivas_grupo,
+            "taxa_positiva": round(positivas_grupo / respostas, 3),
+            "pacientes": len(pacientes_por_grupo[codigo]),
+        }
+        for codigo, (respostas, positivas_grupo) in totais.items()
+        if respostas >= minimo_respostas
+    ]
+    ordem = (lambda item: item["grupo"]) if agrupar in ("dia", "mes") else (
+        lambda item: (-item["taxa_positiva"], -item["respostas"])
+    )
+    return {
+        "gerado_em": snapshot.cabecalho["gerado_em"],
+        "agrupar": agrupar,
+        "grupos": sorted(resultado, key=ordem),
+    }
+
+
+def _por_mes(totais, pacientes_por_grupo):
+    meses, pacientes_mes = defaultdict(lambda: [0, 0]), defaultdict(set)
+    for dia, (respostas, positivas) in totais.items():
+        mes = date.fromordinal(dia).strftime("%Y-%m")
+        meses[mes][0] += respostas
+        meses[mes][1] += positivas
+        pacientes_mes[mes] |= pacientes_por_grupo[dia]
+    return meses, pacientes_mes
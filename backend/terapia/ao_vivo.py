@@ -0,0 +1,137 @@
+"""
+Atualizações ao vivo de uma sessão via Server-Sent Events (SSE).
+
+Cada conexão acompanha o carimbo de versão da sessão (cache_relatorios, já
+trocado pelos sinais a cada gravação em AtividadeSessao/Sessao) e só consulta
+o banco quando ele muda, enviando apenas as linhas alteradas desde o último
+envio (`atualizado_em`) e as removidas. Como o carimbo vive no cache, sem um
+cache compartilhado (DJANGO_CACHE_DIR) outros processos só são percebidos
+pela verificação periódica no banco (VERIFICAR_BANCO_A_CADA).
+
+Só existe no perfil ASGI (VIEWS_ASYNC): o gerador async espera no event
+loop, que atende muitas conexões; no WSGI cada conexão prenderia uma
+thread, e a tela usa polling (views.linhas_sessao). O fluxo encerra após
+DURACAO_MAXIMA e o EventSource reconecta sozinho com Last-Event-ID.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+
+from . import cache_relatorios
+from .models import AtividadeSessao, Sessao
+
+INTERVALO = 1.0  # segundos entre verificações do carimbo
+VERIFICAR_BANCO_A_CADA = 10.0
+HEARTBEAT_A_CADA = 15.0
+DURACAO_MAXIMA = 300.0
+RETRY_MS = 3000
+
+
+class EstadoFluxo:
+    """O que o cliente já recebeu: carimbo da sessão, último atualizado_em e ids na tela."""
+
+    def __init__(self, sessao_id, desde):
+        self.sessao_id = sessao_id
+        self.desde = desde
+        self.versao = None
+        self.ids = None
+        self.verificado_em = 0.0
+        self.encerrada = False
+
+
+def _evento(nome, dados, id_evento=None):
+    linhas = []
+    if id_evento is not None:
+        linhas.append(f"id: {id_evento}")
+    linhas.append(f"event: {nome}")
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False)}")
+    return "\n".join(linhas) + "\n\n"
+
+
+def _em_ms(momento):
+    return int(momento.timestamp() * 1000)
+
+
+def ponto_de_partida(last_event_id=None, desde=None):
+    """
+    A partir de quando enviar alterações: Last-Event-ID (ms do último
+    atualizado_em recebido, na reconexão), senão ?desde= (segundos, hora em
+    que a página foi renderizada), senão agora.
+    """
+    for valor, escala in ((last_event_id, 1000), (desde, 1)):
+        try:
+            return datetime.fromtimestamp(int(valor) / escala, tz=dt_timezone.utc)
+        except (TypeError, ValueError):
+            continue
+    return datetime.now(tz=dt_timezone.utc)
+
+
+def novos_eventos(estado):
+    """
+    Eventos pendentes para o cliente (lista de strings SSE). Barato quando
+    nada mudou: só lê o carimbo no cache, salvo a verificação periódica.
+    """
+    versao = cache_relatorios.versao_relatorio(estado.sessao_id)
+    agora = time.monotonic()
+    if versao == estado.versao and agora - estado.verificado_em < VERIFICAR_BANCO_A_CADA:
+        return []
+    estado.versao, estado.verificado_em = versao, agora
+
+    eventos = []
+    atividades = AtividadeSessao.objects.filter(sessao_id=estado.sessao_id)
+    alteradas = (
+        atividades.filter(atualizado_em__gt=estado.desde)
+        .select_related("atividade_modelo")
+        .order_by("atualizado_em", "id")
+    )
+    for atividade in alteradas:
+        html = render_to_string("terapia/_atividade_sessao.html", {"atividade": atividade})
+        eventos.append(
+            _evento("atividade", {"id": atividade.id, "html": html}, _em_ms(atividade.atualizado_em))
+        )
+        estado.desde = atividade.atualizado_em
+
+    ids = set(atividades.values_list("id", flat=True))
+    if estado.ids is not None:
+        eventos.extend(_evento("removida", {"id": removida}) for removida in sorted(estado.ids - ids))
+    estado.ids = ids
+
+    if Sessao.objects.filter(pk=estado.sessao_id, encerrada=True).exists():
+        estado.encerrada = True
+        eventos.append(_evento("encerrada", {"sessao": estado.sessao_id}))
+    return eventos
+
+
+def resposta_sse(eventos):
+    response = StreamingHttpResponse(eventos, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: não acumular o stream
+    return response
+
+
+def _inicio():
+    return f"retry: {RETRY_MS}\n\n"
+
+
+async def afluxo(estado):
+    """Gerador async (ASGI): espera no event loop sem prender uma thread."""
+    yield _inicio()
+    verificar = sync_to_async(novos_eventos)
+    inicio = ultimo_envio = time.monotonic()
+    while time.monotonic() - inicio < DURACAO_MAXIMA:
+        eventos = await verificar(estado)
+        for evento in eventos:
+            yield evento
+        if estado.encerrada:
+            return
+        if eventos:
+            ultimo_envio = time.monotonic()
+        elif time.monotonic() - ultimo_envio >= HEARTBEAT_A_CADA:
+            ultimo_envio = time.monotonic()
+            yield ": ping\n\n"  # mantém proxies/conexão abertos
+        await asyncio.sleep(INTERVALO)
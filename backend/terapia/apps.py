@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class TerapiaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'terapia'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        if getattr(settings, "INSTRUMENTACAO_ATIVA", True):
+            from . import instrumentacao
+
+            instrumentacao.instrumentar_templates()
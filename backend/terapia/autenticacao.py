@@ -0,0 +1,114 @@
+"""
+Autenticação sem estado da API: tokens de acesso assinados e de vida curta.
+
+O cliente (app móvel) troca usuário e senha por um par em /api/token/: o
+token de acesso, assinado com a SECRET_KEY (django.core.signing) e válido
+por API_TOKEN_ACESSO_SEGUNDOS, e o token de renovação (o Token do
+rest_framework.authtoken, guardado no banco). Cada requisição manda
+`Authorization: Bearer <acesso>`, validado só pela assinatura: sem linha de
+sessão, sem consulta ao usuário e sem CSRF. Quando o acesso expira,
+/api/token/renovar/ confere o token de renovação no banco e emite outro par.
+
+O token de renovação é de uso único (cada renovação devolve um novo) e vale
+por API_TOKEN_RENOVACAO_SEGUNDOS. O Token do authtoken é um por usuário:
+um novo login ou renovação invalida o anterior.
+
+Desativar o usuário ou excluir o Token dele vale na próxima renovação; um
+token de acesso já emitido segue válido até expirar.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+SALT = "terapia.api.acesso"
+PREFIXO = b"bearer"
+
+
+def segundos_acesso():
+    return getattr(settings, "API_TOKEN_ACESSO_SEGUNDOS", 300)
+
+
+def segundos_renovacao():
+    return getattr(settings, "API_TOKEN_RENOVACAO_SEGUNDOS", 60 * 60 * 24 * 30)
+
+
+def emitir_acesso(usuario):
+    """Token de acesso assinado com o que a API precisa do usuário (id, username, is_staff)."""
+    return signing.dumps(
+        {"u": usuario.pk, "n": usuario.get_username(), "s": usuario.is_staff},
+        salt=SALT,
+        compress=False,
+    )
+
+
+def emitir_par(usuario):
+    """
+    Resposta do login/renovação: acesso, renovação (um Token novo, que
+    substitui o anterior do usuário) e validade de cada um em segundos.
+    """
+    Token.objects.filter(user=usuario).delete()
+    renovacao = Token.objects.create(user=usuario)
+    return {
+        "acesso": emitir_acesso(usuario),
+        "renovacao": renovacao.key,
+        "tipo": "Bearer",
+        "expira_em": segundos_acesso(),
+        "renovacao_expira_em": segundos_renovacao(),
+    }
+
+
+def usuario_da_renovacao(chave):
+    """
+    Usuário ativo dono do token de renovação, ou None (consulta o banco). O
+    token é consumido aqui, mesmo vencido: de duas renovações simultâneas
+    com o mesmo token, só a que conseguiu apagá-lo vale.
+    """
+    if not isinstance(chave, str):
+        return None
+    renovacao = Token.objects.select_related("user").filter(key=chave).first()
+    if renovacao is None:
+        return None
+    apagados, _ = Token.objects.filter(key=chave).delete()
+    if not apagados or renovacao.created < timezone.now() - timedelta(seconds=segundos_renovacao()):
+        return None
+    return renovacao.user if renovacao.user.is_active else None
+
+
+def usuario_do_acesso(token):
+    """
+    Usuário do token de acesso sem ir ao banco: uma instância de User não
+    salva, só com id, username e is_staff (serve para filtros e FKs).
+    """
+    try:
+        dados = signing.loads(token, salt=SALT, max_age=segundos_acesso())
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed("Token de acesso expirado.")
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed("Token de acesso inválido.")
+    return User(id=dados["u"], username=dados["n"], is_staff=dados["s"], is_active=True)
+
+
+class AcessoAssinadoAuthentication(BaseAuthentication):
+    """`Authorization: Bearer <acesso>`; sem o cabeçalho, passa para a próxima classe (sessão)."""
+
+    def authenticate(self, request):
+        partes = get_authorization_header(request).split()
+        if not partes or partes[0].lower() != PREFIXO:
+            return None
+        if len(partes) != 2:
+            raise exceptions.AuthenticationFailed("Cabeçalho Authorization inválido.")
+        try:
+            token = partes[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed("Cabeçalho Authorization inválido.")
+        return usuario_do_acesso(token), token
+
+    def authenticate_header(self, request):
+        # 401 (com WWW-Authenticate) em vez de 403 quando falta autenticação
+        return 'Bearer realm="api"'
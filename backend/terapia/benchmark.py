@@ -0,0 +1,87 @@
+"""
+Medição de latência, consultas e memória das views via django.test.Client.
+
+Usado pelo comando `benchmark`; os resultados são dicionários simples para
+serem gravados em JSON e comparados entre commits.
+"""
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+class _Desfazer(Exception):
+    pass
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    k = (len(ordenados) - 1) * p / 100
+    inferior = int(k)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (k - inferior)
+
+
+def _executar(client, metodo, url, dados):
+    resposta = getattr(client, metodo)(url, dados or {})
+    if resposta.streaming:
+        tamanho = sum(len(parte) for parte in resposta.streaming_content)
+    else:
+        tamanho = len(resposta.content)
+    return resposta.status_code, tamanho
+
+
+def medir(client, url, repeticoes=20, metodo="get", dados=None, desfazer=False):
+    """
+    Executa a requisição `repeticoes` vezes (mais um aquecimento) e devolve
+    percentis de latência (ms), número de consultas SQL, pico de memória
+    alocada (KiB) e tamanho da resposta. Com `desfazer`, cada execução roda
+    em uma transação revertida (para medir POSTs sem alterar os dados).
+    """
+    def uma_vez():
+        if not desfazer:
+            return _executar(client, metodo, url, dados)
+        resultado = None
+        try:
+            with transaction.atomic():
+                resultado = _executar(client, metodo, url, dados)
+                raise _Desfazer
+        except _Desfazer:
+            pass
+        return resultado
+
+    uma_vez()  # aquecimento (templates, caches)
+    latencias, consultas = [], []
+    status = tamanho = None
+    for _ in range(repeticoes):
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            status, tamanho = uma_vez()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(len(capturadas))
+
+    tracemalloc.start()
+    uma_vez()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "url": url,
+        "metodo": metodo.upper(),
+        "status": status,
+        "repeticoes": repeticoes,
+        "latencia_ms": {
+            "p50": round(percentil(latencias, 50), 3),
+            "p90": round(percentil(latencias, 90), 3),
+            "p99": round(percentil(latencias, 99), 3),
+            "max": round(max(latencias), 3),
+            "media": round(statistics.mean(latencias), 3),
+        },
+        "consultas": {"min": min(consultas), "max": max(consultas)},
+        "memoria_pico_kib": round(pico / 1024, 1),
+        "bytes_resposta": tamanho,
+    }
@@ -0,0 +1,175 @@
+"""
+Busca (typeahead) de pacientes e atividades modelo do terapeuta.
+
+O texto é normalizado (sem acentos, minúsculo) e quebrado em trigramas
+("maria" -> " ma", "mar", "ari", "ria", "ia "), guardados em TrigramaBusca
+com o terapeuta e o tipo na frente do índice: o custo da consulta depende da
+carteira do terapeuta e dos trigramas do termo, não do tamanho da tabela.
+
+Um termo casa com uma entrada quando ela tem ao menos LIMIAR_SIMILARIDADE
+dos trigramas do termo; com todos os trigramas é um prefixo de palavra
+("silv" em "Maria Silva"), com parte deles é um casamento aproximado
+("Gonçalvs" -> "Gonçalves"). Os candidatos são reordenados aqui:
+prefixo do texto, prefixo de palavra, trecho, similaridade.
+
+As tabelas são mantidas pelos sinais (signals.py); `reconstruir_indice`
+refaz tudo, para cargas feitas com bulk_create.
+"""
+import math
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import AtividadeModelo, EntradaBusca, Paciente, TrigramaBusca
+
+TIPOS = {"paciente": (Paciente, "nome"), "atividade_modelo": (AtividadeModelo, "descricao")}
+LIMIAR_SIMILARIDADE = 0.5
+CANDIDATOS = 50  # entradas lidas do banco antes de reordenar
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+LOTE = 1000
+
+
+def normalizar(texto):
+    """'  Conceição  ARAÚJO' -> 'conceicao araujo'."""
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return " ".join(sem_acentos.casefold().split())
+
+
+def trigramas(texto, prefixo=False):
+    """
+    Trigramas de cada palavra, com espaço antes (marca o início da palavra)
+    e depois. Com `prefixo`, a última palavra fica sem o espaço final, pois
+    o usuário ainda pode estar digitando.
+    """
+    palavras = texto.split()
+    resultado = set()
+    for posicao, palavra in enumerate(palavras):
+        fim = "" if prefixo and posicao == len(palavras) - 1 else " "
+        palavra = f" {palavra}{fim}"
+        resultado.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return resultado
+
+
+# =========================
+# Manutenção do índice
+# =========================
+
+def _trigramas_da_entrada(entrada):
+    return [
+        TrigramaBusca(entrada=entrada, terapeuta_id=entrada.terapeuta_id, tipo=entrada.tipo, trigrama=trigrama)
+        for trigrama in trigramas(entrada.texto)
+    ]
+
+
+def indexar(tipo, objeto_id, terapeuta_id, texto):
+    """Cria ou atualiza a entrada do objeto; salvar sem mudar o texto custa uma consulta."""
+    normalizado = normalizar(texto)
+    entrada = EntradaBusca.objects.filter(tipo=tipo, objeto_id=objeto_id).first()
+    if entrada and entrada.texto == normalizado and entrada.terapeuta_id == terapeuta_id:
+        if entrada.rotulo != texto:
+            EntradaBusca.objects.filter(pk=entrada.pk).update(rotulo=texto)
+        return entrada
+
+    with transaction.atomic():
+        if entrada is None:
+            entrada = EntradaBusca(tipo=tipo, objeto_id=objeto_id)
+        else:
+            entrada.trigramas.all().delete()
+        entrada.terapeuta_id, entrada.texto, entrada.rotulo = terapeuta_id, normalizado, texto
+        entrada.save()
+        TrigramaBusca.objects.bulk_create(_trigramas_da_entrada(entrada))
+    return entrada
+
+
+def remover(tipo, objeto_id):
+    EntradaBusca.objects.filter(tipo=tipo, objeto_id=objeto_id).delete()
+
+
+@transaction.atomic
+def reconstruir_indice():
+    """Refaz as entradas e trigramas a partir de Paciente e AtividadeModelo."""
+    TrigramaBusca.objects.all().delete()
+    EntradaBusca.objects.all().delete()
+    total = 0
+    for tipo, (modelo, campo) in TIPOS.items():
+        linhas = modelo.objects.values_list("id", "terapeuta_id", campo).order_by("id")
+        for inicio in range(0, linhas.count(), LOTE):
+            entradas = EntradaBusca.objects.bulk_create(
+                EntradaBusca(
+                    tipo=tipo, objeto_id=objeto_id, terapeuta_id=terapeuta_id,
+                    texto=normalizar(texto), rotulo=texto,
+                )
+                for objeto_id, terapeuta_id, texto in linhas[inicio:inicio + LOTE]
+            )
+            TrigramaBusca.objects.bulk_create(
+                [trigrama for entrada in entradas for trigrama in _trigramas_da_entrada(entrada)],
+                batch_size=LOTE,
+            )
+            total += len(entradas)
+    return total
+
+
+# =========================
+# Consulta
+# =========================
+
+def _ordem(termo, palavras_termo, entrada, similaridade):
+    texto = entrada["texto"]
+    palavras = texto.split()
+    if texto.startswith(termo):
+        classe = 0
+    elif all(any(p.startswith(t) for p in palavras) for t in palavras_termo):
+        classe = 1
+    elif termo in texto:
+        classe = 2
+    else:
+        classe = 3
+    return (classe, -similaridade, texto)
+
+
+def buscar(terapeuta_id, termo, tipos=None, limite=LIMITE_PADRAO):
+    """
+    Até `limite` resultados {"tipo", "id", "texto", "similaridade"} do
+    terapeuta, melhores primeiro. Termos de uma letra usam o prefixo do texto.
+    """
+    termo = normalizar(termo)
+    tipos = list(tipos or TIPOS)
+    if not termo:
+        return []
+
+    chaves = trigramas(termo, prefixo=True)
+    if not chaves:
+        candidatos = {
+            entrada_id: 1.0
+            for entrada_id in EntradaBusca.objects.filter(
+                terapeuta_id=terapeuta_id, tipo__in=tipos, texto__gte=termo, texto__lt=termo + "\uffff"
+            ).order_by("texto").values_list("id", flat=True)[:limite]
+        }
+    else:
+        minimo = max(1, math.ceil(len(chaves) * LIMIAR_SIMILARIDADE))
+        candidatos = {
+            linha["entrada"]: linha["comuns"] / len(chaves)
+            for linha in TrigramaBusca.objects.filter(
+                terapeuta_id=terapeuta_id, tipo__in=tipos, trigrama__in=chaves
+            )
+            .values("entrada")
+            .annotate(comuns=Count("entrada"))
+            .filter(comuns__gte=minimo)
+            .order_by("-comuns", "entrada")[:CANDIDATOS]
+        }
+
+    entradas = EntradaBusca.objects.filter(id__in=candidatos).values("id", "tipo", "objeto_id", "texto", "rotulo")
+    palavras_termo = termo.split()
+    ordenadas = sorted(entradas, key=lambda e: _ordem(termo, palavras_termo, e, candidatos[e["id"]]))
+    return [
+        {
+            "tipo": entrada["tipo"],
+            "id": entrada["objeto_id"],
+            "texto": entrada["rotulo"],
+            "similaridade": round(candidatos[entrada["id"]], 2),
+        }
+        for entrada in ordenadas[:limite]
+    ]
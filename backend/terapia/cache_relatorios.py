@@ -0,0 +1,56 @@
+"""
+Cache do HTML de relatorio_sessao.
+
+Cada sessão tem um carimbo de versão (versoes.py) guardado no cache; ele
+compõe a chave do HTML e o ETag. Os sinais trocam o carimbo quando a sessão
+ou suas atividades mudam, então entradas antigas simplesmente deixam de ser
+lidas. O Last-Modified vem do banco (atualizado_em da sessão e dos
+registros); exclusões não o movem, mas o ETag muda e tem precedência
+(If-None-Match) nos navegadores, que enviam os dois.
+"""
+from django.core.cache import cache
+from django.db.models import Max
+
+from . import versoes
+from .models import Sessao
+
+TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _chave_versao(sessao_id):
+    return f"relatorio_sessao:versao:{sessao_id}"
+
+
+def versao_relatorio(sessao_id):
+    """Carimbo atual da sessão; criado na primeira consulta."""
+    return versoes.atual(_chave_versao(sessao_id))
+
+
+def invalidar_relatorios(sessao_ids):
+    """Troca o carimbo das sessões (o HTML em cache deixa de valer)."""
+    versoes.trocar(_chave_versao(sessao_id) for sessao_id in sessao_ids)
+
+
+def etag_relatorio(sessao_id):
+    return f'"sessao-{sessao_id}-v{versao_relatorio(sessao_id)}"'
+
+
+def ultima_modificacao(sessao_id):
+    """Maior atualizado_em entre a sessão e seus registros (None se a sessão não existe)."""
+    linha = (
+        Sessao.objects.filter(pk=sessao_id)
+        .annotate(ultimo_registro=Max("atividadesessao__atualizado_em"))
+        .values_list("atualizado_em", "ultimo_registro")
+        .first()
+    )
+    return max(instante for instante in linha if instante) if linha else None
+
+
+def html_relatorio(sessao_id, renderizar):
+    """HTML do relatório a partir do cache; `renderizar()` é chamado só na falta."""
+    chave = f"relatorio_sessao:{sessao_id}:{versao_relatorio(sessao_id)}"
+    html = cache.get(chave)
+    if html is None:
+        html = renderizar()
+        cache.set(chave, html, TIMEOUT)
+    return html
@@ -0,0 +1,73 @@
+"""
+Catálogo de atividades modelo de cada terapeuta (id -> descrição e a lista
+ordenada por descrição), para as telas e APIs que só exibem as atividades.
+
+Dois níveis: o cache compartilhado guarda as linhas sob um carimbo de versão
+e cada processo mantém a última versão já montada em memória, então uma
+leitura quente custa uma ida ao cache (o carimbo) e nenhuma consulta. Os
+sinais trocam o carimbo ao criar, editar ou excluir uma AtividadeModelo.
+
+Validações de escrita (sessoes.validar_atividades, formulários no POST)
+continuam consultando o banco: com cache por processo (locmem) outro
+processo pode ainda não ter visto uma exclusão.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from . import versoes
+from .models import AtividadeModelo
+
+TIMEOUT = 60 * 60 * 24 * 30
+
+ItemCatalogo = namedtuple("ItemCatalogo", ["id", "descricao"])
+
+
+class Catalogo:
+    """Atividades de um terapeuta: `descricoes` (id -> descrição) e `ordenadas` (ItemCatalogo por descrição)."""
+
+    def __init__(self, linhas):
+        self.ordenadas = [ItemCatalogo(*linha) for linha in linhas]
+        self.descricoes = dict(linhas)
+
+    def disponiveis(self, excluir_ids):
+        """Itens ordenados, sem os ids informados (ex.: já vinculados à sessão)."""
+        excluir_ids = set(excluir_ids)
+        return [item for item in self.ordenadas if item.id not in excluir_ids]
+
+    def __len__(self):
+        return len(self.ordenadas)
+
+
+# terapeuta_id -> (versão, Catalogo) já montado neste processo
+_locais = {}
+
+
+def _chave_versao(terapeuta_id):
+    return f"catalogo:{terapeuta_id}:versao"
+
+
+def catalogo_do_terapeuta(terapeuta_id):
+    versao = versoes.atual(_chave_versao(terapeuta_id))
+    local = _locais.get(terapeuta_id)
+    if local and local[0] == versao:
+        return local[1]
+
+    chave = f"catalogo:{terapeuta_id}:{versao}"
+    linhas = cache.get(chave)
+    if linhas is None:
+        linhas = list(
+            AtividadeModelo.objects.filter(terapeuta_id=terapeuta_id)
+            .order_by("descricao", "id")
+            .values_list("id", "descricao")
+        )
+        cache.set(chave, linhas, TIMEOUT)
+    catalogo = Catalogo(linhas)
+    _locais[terapeuta_id] = (versao, catalogo)
+    return catalogo
+
+
+def invalidar(terapeuta_id):
+    """Troca o carimbo: todos os processos remontam o catálogo na próxima leitura."""
+    versoes.trocar([_chave_versao(terapeuta_id)])
+    _locais.pop(terapeuta_id, None)
@@ -0,0 +1,96 @@
+"""Geradores para exportações em streaming (memória constante, qualquer volume)."""
+import csv
+import json
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+TAMANHO_LOTE = 2000
+
+
+class Echo:
+    """Pseudo-buffer: o csv.writer escreve e recebemos a linha de volta."""
+
+    def write(self, value):
+        return value
+
+
+def linhas_csv(cabecalho, linhas):
+    """Gera o CSV linha a linha a partir de qualquer iterável de tuplas."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(cabecalho)
+    for linha in linhas:
+        yield writer.writerow(linha)
+
+
+class ParametroInvalido(ValueError):
+    """Filtro da exportação mal formado (a view responde 400)."""
+
+
+def ler_data(valor, nome):
+    """Data aaaa-mm-dd de um parâmetro GET (None se vazio)."""
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ParametroInvalido(f"{nome} inválida: use aaaa-mm-dd.")
+
+
+def ler_id(valor, nome):
+    """Id numérico de um parâmetro GET (None se vazio)."""
+    if not valor:
+        return None
+    if not valor.isdigit():
+        raise ParametroInvalido(f"{nome} inválido: informe o id numérico.")
+    return int(valor)
+
+
+def filtrar_periodo(queryset, campo, data_inicio=None, data_fim=None):
+    """
+    Aplica filtros opcionais de data (aaaa-mm-dd) sobre um campo DateTimeField.
+    Levanta ParametroInvalido antes de montar a resposta em streaming.
+    """
+    data_inicio = ler_data(data_inicio, "data_inicio")
+    data_fim = ler_data(data_fim, "data_fim")
+    if data_inicio:
+        queryset = queryset.filter(**{f"{campo}__date__gte": data_inicio})
+    if data_fim:
+        queryset = queryset.filter(**{f"{campo}__date__lte": data_fim})
+    return queryset
+
+
+def linhas_ndjson(colunas, linhas):
+    """Gera um objeto JSON por linha (NDJSON)."""
+    for linha in linhas:
+        yield json.dumps(dict(zip(colunas, linha)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def lotes_colunares(colunas, linhas, tamanho=TAMANHO_LOTE):
+    """
+    Gera lotes em formato colunar (um objeto JSON por linha de saída, com uma
+    lista por coluna), no espírito de um "record batch" do Arrow. Cada lote
+    tem no máximo `tamanho` registros e pode ser lido independentemente.
+    """
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) == tamanho:
+            yield _serializar_lote(colunas, lote)
+            lote = []
+    if lote:
+        yield _serializar_lote(colunas, lote)
+
+
+def _serializar_lote(colunas, lote):
+    dados = {coluna: list(valores) for coluna, valores in zip(colunas, zip(*lote))}
+    return json.dumps(
+        {"linhas": len(lote), "colunas": dados}, cls=DjangoJSONEncoder, ensure_ascii=False
+    ) + "\n"
+
+
+FORMATOS = {
+    "csv": ("text/csv", "csv", linhas_csv),
+    "ndjson": ("application/x-ndjson", "ndjson", linhas_ndjson),
+    "colunar": ("application/x-ndjson", "colunar.ndjson", lotes_colunares),
+}
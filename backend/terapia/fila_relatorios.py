@@ -0,0 +1,131 @@
+"""
+Fila local (tabela RelatorioSessaoJob) para gerar os relatórios HTML das
+sessões fora do request. O worker é o comando `processar_relatorios`.
+
+Os arquivos são gravados como MEDIA_ROOT/reports/<sha256>.html: conteúdo
+igual gera o mesmo arquivo, que só é escrito uma vez.
+"""
+import hashlib
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import cache_relatorios
+from .models import AtividadeSessao, RelatorioSessaoJob
+
+MAX_TENTATIVAS = 3
+PASTA_RELATORIOS = "reports"
+
+
+def enfileirar_relatorio(sessao, gerado_por=None):
+    """
+    Pede a geração do relatório da sessão. Idempotente enquanto a sessão não
+    muda: devolve o pedido existente, e um pedido com erro volta para a fila.
+    Se a sessão mudou desde o último pedido (carimbo de versão diferente), o
+    relatório gerado ou em geração ficou velho e entra um pedido novo.
+    """
+    versao = cache_relatorios.versao_relatorio(sessao.id)
+    with transaction.atomic():
+        job = (
+            RelatorioSessaoJob.objects.select_for_update()
+            .filter(sessao=sessao)
+            .order_by("-criado_em", "-id")
+            .first()
+        )
+        if job is None:
+            return RelatorioSessaoJob.objects.create(sessao=sessao, gerado_por=gerado_por, versao=versao)
+        if job.versao != versao:
+            if job.status == "pendente":
+                # ainda não começou: já vai renderizar o conteúdo atual
+                job.versao = versao
+                job.save(update_fields=["versao", "atualizado_em"])
+                return job
+            return RelatorioSessaoJob.objects.create(sessao=sessao, gerado_por=gerado_por, versao=versao)
+        if job.status == "erro":
+            job.status = "pendente"
+            job.tentativas = 0
+            job.erro = ""
+            job.save(update_fields=["status", "tentativas", "erro", "atualizado_em"])
+        return job
+
+
+def reivindicar_jobs(limite):
+    """
+    Marca até `limite` pedidos pendentes como "processando" e devolve seus ids.
+    O UPDATE condicional garante que dois workers não peguem o mesmo pedido.
+    """
+    candidatos = (
+        RelatorioSessaoJob.objects.filter(status="pendente")
+        .order_by("criado_em")
+        .values_list("id", flat=True)[:limite]
+    )
+    reivindicados = []
+    for job_id in candidatos:
+        if RelatorioSessaoJob.objects.filter(id=job_id, status="pendente").update(
+            status="processando", atualizado_em=timezone.now()
+        ):
+            reivindicados.append(job_id)
+    return reivindicados
+
+
+def liberar_jobs_travados(minutos):
+    """Devolve à fila pedidos "processando" há mais de `minutos` (worker interrompido)."""
+    limite = timezone.now() - timedelta(minutes=minutos)
+    return RelatorioSessaoJob.objects.filter(
+        status="processando", atualizado_em__lt=limite
+    ).update(status="pendente", atualizado_em=timezone.now())
+
+
+def renderizar_relatorio(job_id):
+    """Renderiza e grava o relatório de um pedido. Executado nos processos do worker."""
+    job = RelatorioSessaoJob.objects.select_related(
+        "sessao__paciente", "sessao__terapeuta", "gerado_por"
+    ).get(id=job_id)
+    try:
+        atividades = (
+            AtividadeSessao.objects.filter(sessao=job.sessao)
+            .select_related("atividade_modelo")
+            .order_by("-data_registro")
+        )
+        html = render_to_string(
+            "terapia/relatorio_sessao.html",
+            {"sessao": job.sessao, "atividades": atividades, "gerado_por": job.gerado_por},
+        )
+        conteudo = html.encode("utf-8")
+        hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+        arquivo = f"{PASTA_RELATORIOS}/{hash_conteudo}.html"
+        _gravar_se_ausente(Path(settings.MEDIA_ROOT) / arquivo, conteudo)
+    except Exception as exc:
+        job.tentativas += 1
+        job.status = "erro" if job.tentativas >= MAX_TENTATIVAS else "pendente"
+        job.erro = f"{type(exc).__name__}: {exc}"
+        job.save(update_fields=["status", "tentativas", "erro", "atualizado_em"])
+        return job.status
+
+    job.status = "concluido"
+    job.hash_conteudo = hash_conteudo
+    job.arquivo = arquivo
+    job.erro = ""
+    job.save(update_fields=["status", "hash_conteudo", "arquivo", "erro", "atualizado_em"])
+    return job.status
+
+
+def url_relatorio(job):
+    """URL pública do arquivo gerado (ou None se ainda não concluído)."""
+    if job.status != "concluido":
+        return None
+    return f"{settings.MEDIA_URL.rstrip('/')}/{job.arquivo}"
+
+
+def _gravar_se_ausente(caminho, conteudo):
+    if caminho.exists():
+        return
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho.with_suffix(f".{os.getpid()}.tmp")
+    temporario.write_bytes(conteudo)
+    os.replace(temporario, caminho)
@@ -1,4 +1,5 @@
 from django import forms
+from . import catalogo
 from .models import Paciente, Sessao, AtividadeModelo, AtividadeSessao
 
 class SelecionarAtividadeForm(forms.ModelForm):
@@ -41,9 +42,17 @@ class AtividadeSessaoForm(forms.ModelForm):
         model = AtividadeSessao
         fields = ['atividade_modelo', 'resposta']  # mantém só o que o usuário deve escolher
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, terapeuta=None, **kwargs):
         super().__init__(*args, **kwargs)
-        # carrega apenas atividades modelo
-        self.fields['atividade_modelo'].queryset = AtividadeModelo.objects.all()
+        # só as atividades modelo do terapeuta; as opções exibidas vêm do
+        # catálogo em cache e a validação continua no banco (queryset)
+        campo = self.fields['atividade_modelo']
+        if terapeuta is None:
+            campo.queryset = AtividadeModelo.objects.none()
+        else:
+            campo.queryset = AtividadeModelo.objects.filter(terapeuta=terapeuta)
+            campo.choices = [("", campo.empty_label)] + [
+                (item.id, item.descricao) for item in catalogo.catalogo_do_terapeuta(terapeuta.id).ordenadas
+            ]
         self.fields['atividade_modelo'].label = "Selecione a atividade"
         self.fields['resposta'].label = "Resposta (P/N)"
\ No newline at end of file
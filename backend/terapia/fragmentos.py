@@ -0,0 +1,31 @@
+"""
+Versões dos fragmentos de template em cache ({% cache %} na lista de
+pacientes, no seletor de atividades e nas tabelas do relatório do paciente).
+
+Escopos: "pacientes" (pacientes do terapeuta e suas contagens de sessões),
+"atividades" (atividades modelo do terapeuta) e "registros" (sessões e
+registros do paciente). Cada escopo tem um carimbo (versoes.py) no cache,
+que entra na chave do fragmento junto com o dono (terapeuta ou paciente). Os
+sinais trocam o carimbo, e fragmentos antigos deixam de ser lidos e expiram
+sozinhos.
+"""
+from . import versoes
+
+
+def _chave(escopo, dono_id):
+    return f"fragmento:{escopo}:{dono_id}"
+
+
+def versao(**escopos):
+    """
+    Carimbo combinado dos escopos em uma ida ao cache, para usar como
+    vary_on do {% cache %}: versao(registros=paciente.id, atividades=terapeuta.id).
+    """
+    chaves = [_chave(escopo, escopos[escopo]) for escopo in sorted(escopos)]
+    valores = versoes.atuais(chaves)
+    return ".".join(str(valores[chave]) for chave in chaves)
+
+
+def invalidar(escopo, dono_ids):
+    """Troca o carimbo do escopo para cada dono (terapeuta ou paciente)."""
+    versoes.trocar(_chave(escopo, dono_id) for dono_id in dono_ids)
@@ -0,0 +1,182 @@
+"""
+Métricas por requisição: número de consultas, tempo de banco, consultas
+repetidas (assinatura de N+1), tempo de renderização de templates e tamanho
+da resposta, agrupados pelo nome da URL.
+
+As amostras recentes ficam em um buffer circular em memória (por processo) e
+os totais acumulados são expostos no formato texto do Prometheus.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger("terapia.instrumentacao")
+
+_coletor_atual = ContextVar("coletor_instrumentacao", default=None)
+_lock = threading.Lock()
+_amostras = deque(maxlen=getattr(settings, "INSTRUMENTACAO_BUFFER", 1000))
+_totais = defaultdict(Counter)
+
+
+def limiar_duplicadas():
+    return getattr(settings, "INSTRUMENTACAO_LIMIAR_DUPLICADAS", 3)
+
+
+class ColetorRequisicao:
+    """Acumula os dados de uma requisição; também é o execute_wrapper das conexões."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempo_template = 0.0
+        self.sqls = Counter()
+        self._profundidade_template = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo_banco += time.perf_counter() - inicio
+            self.consultas += 1
+            # O SQL ainda tem os placeholders: consultas iguais com parâmetros
+            # diferentes caem no mesmo padrão (o sintoma do N+1).
+            self.sqls[sql] += 1
+
+    def padroes_duplicados(self):
+        limiar = limiar_duplicadas()
+        return [(sql, n) for sql, n in self.sqls.most_common() if n >= limiar]
+
+
+def coletor_atual():
+    return _coletor_atual.get()
+
+
+def iniciar_coleta():
+    coletor = ColetorRequisicao()
+    return coletor, _coletor_atual.set(coletor)
+
+
+def encerrar_coleta(token):
+    _coletor_atual.reset(token)
+
+
+def instrumentar_templates():
+    """
+    Envolve Template.render do backend Django uma única vez para medir o tempo
+    de render. Chamada no ready() do app (apps.py) quando INSTRUMENTACAO_ATIVA.
+    """
+    if getattr(DjangoTemplate.render, "instrumentado", False):
+        return
+    original = DjangoTemplate.render
+
+    def render(self, context=None, request=None):
+        coletor = _coletor_atual.get()
+        if coletor is None or coletor._profundidade_template:
+            return original(self, context, request)
+        coletor._profundidade_template += 1
+        inicio = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            coletor.tempo_template += time.perf_counter() - inicio
+            coletor._profundidade_template -= 1
+
+    render.instrumentado = True
+    DjangoTemplate.render = render
+
+
+def registrar(view, metodo, status, duracao, coletor, bytes_resposta):
+    duplicados = coletor.padroes_duplicados()
+    amostra = {
+        "view": view,
+        "metodo": metodo,
+        "status": status,
+        "duracao": duracao,
+        "consultas": coletor.consultas,
+        "tempo_banco": coletor.tempo_banco,
+        "tempo_template": coletor.tempo_template,
+        "bytes": bytes_resposta,
+        "duplicadas": sum(n - 1 for _, n in duplicados),
+        "padrao_duplicado": duplicados[0][0][:300] if duplicados else None,
+    }
+    with _lock:
+        _amostras.append(amostra)
+        totais = _totais[view]
+        totais["requisicoes"] += 1
+        totais["duracao"] += duracao
+        totais["consultas"] += coletor.consultas
+        totais["tempo_banco"] += coletor.tempo_banco
+        totais["tempo_template"] += coletor.tempo_template
+        totais["bytes"] += bytes_resposta or 0
+        totais["duplicadas"] += amostra["duplicadas"]
+        if duplicados:
+            totais["requisicoes_com_duplicadas"] += 1
+    if duplicados:
+        sql, vezes = duplicados[0]
+        logger.warning("Possível N+1 em %s: consulta repetida %d vezes: %s", view, vezes, sql[:300])
+    return amostra
+
+
+def amostras_recentes():
+    with _lock:
+        return list(_amostras)
+
+
+def _quantil(valores, q):
+    ordenados = sorted(valores)
+    return ordenados[min(int(q * len(ordenados)), len(ordenados) - 1)]
+
+
+def _rotulo(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def texto_prometheus():
+    """Totais acumulados (counters) e quantis das amostras recentes, no formato do Prometheus."""
+    with _lock:
+        totais = {view: dict(c) for view, c in _totais.items()}
+        recentes = list(_amostras)
+
+    contadores = [
+        ("appaba_requisicoes_total", "requisicoes", "Requisições atendidas."),
+        ("appaba_requisicao_segundos_total", "duracao", "Tempo total de resposta."),
+        ("appaba_consultas_sql_total", "consultas", "Consultas SQL executadas."),
+        ("appaba_banco_segundos_total", "tempo_banco", "Tempo gasto no banco."),
+        ("appaba_template_segundos_total", "tempo_template", "Tempo de renderização de templates."),
+        ("appaba_resposta_bytes_total", "bytes", "Bytes de resposta (sem streaming)."),
+        ("appaba_consultas_duplicadas_total", "duplicadas", "Consultas repetidas (padrão N+1)."),
+        (
+            "appaba_requisicoes_com_duplicadas_total",
+            "requisicoes_com_duplicadas",
+            "Requisições com consultas repetidas acima do limiar.",
+        ),
+    ]
+    linhas = []
+    for nome, chave, ajuda in contadores:
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} counter")
+        for view in sorted(totais):
+            linhas.append(f'{nome}{{view="{_rotulo(view)}"}} {totais[view].get(chave, 0)}')
+
+    por_view = defaultdict(list)
+    for amostra in recentes:
+        por_view[amostra["view"]].append(amostra)
+    for nome, chave, ajuda in [
+        ("appaba_requisicao_segundos", "duracao", "Duração das requisições recentes."),
+        ("appaba_consultas_sql", "consultas", "Consultas por requisição (recentes)."),
+    ]:
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} summary")
+        for view in sorted(por_view):
+            valores = [a[chave] for a in por_view[view]]
+            for q in (0.5, 0.9, 0.99):
+                linhas.append(f'{nome}{{view="{_rotulo(view)}",quantile="{q}"}} {_quantil(valores, q)}')
+            linhas.append(f'{nome}_count{{view="{_rotulo(view)}"}} {len(valores)}')
+            linhas.append(f'{nome}_sum{{view="{_rotulo(view)}"}} {sum(valores)}')
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,149 @@
+import json
+import platform
+import subprocess
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from terapia import autenticacao
+from terapia.benchmark import medir
+from terapia.models import AtividadeModelo, AtividadeSessao, Paciente, Sessao
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede latência (p50/p90/p99), consultas SQL e memória das principais views "
+        "e endpoints da API com o django.test.Client e grava o resultado em JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuario", help="Terapeuta usado nas requisições (padrão: o com mais sessões).")
+        parser.add_argument("--repeticoes", type=int, default=20)
+        parser.add_argument("--saida", default="benchmark.json", help="Arquivo JSON de saída.")
+        parser.add_argument("--apenas", nargs="*", help="Mede só os alvos com estes nomes.")
+        parser.add_argument(
+            "--autenticacao", choices=["sessao", "token"], default="sessao",
+            help="token: requisições com Authorization: Bearer (só faz sentido nos alvos api_*).",
+        )
+
+    def handle(self, *args, **opts):
+        terapeuta = self._terapeuta(opts["usuario"])
+        alvos = self._alvos(terapeuta)
+        if opts["apenas"]:
+            alvos = [alvo for alvo in alvos if alvo[0] in opts["apenas"]]
+
+        if opts["autenticacao"] == "token":
+            client = Client(headers={"Authorization": f"Bearer {autenticacao.emitir_acesso(terapeuta)}"})
+        else:
+            client = Client()
+            client.force_login(terapeuta)
+        resultados = {}
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            for nome, url, kwargs in alvos:
+                resultado = medir(client, url, repeticoes=opts["repeticoes"], **kwargs)
+                resultados[nome] = resultado
+                latencia = resultado["latencia_ms"]
+                self.stdout.write(
+                    f"{nome:32} {resultado['status']} p50={latencia['p50']:8.2f}ms "
+                    f"p99={latencia['p99']:8.2f}ms consultas={resultado['consultas']['max']:4} "
+                    f"mem={resultado['memoria_pico_kib']:9.1f}KiB"
+                )
+
+        relatorio = {
+            "commit": _commit_atual(),
+            "gerado_em": timezone.now().isoformat(),
+            "ambiente": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "banco": settings.DATABASES["default"]["ENGINE"],
+            },
+            "dados": {
+                "terapeuta": terapeuta.username,
+                "pacientes": Paciente.objects.filter(terapeuta=terapeuta).count(),
+                "sessoes": Sessao.objects.filter(terapeuta=terapeuta).count(),
+                "atividades_sessao": AtividadeSessao.objects.filter(sessao__terapeuta=terapeuta).count(),
+            },
+            "repeticoes": opts["repeticoes"],
+            "autenticacao": opts["autenticacao"],
+            "resultados": resultados,
+        }
+        Path(opts["saida"]).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {opts['saida']}."))
+
+    def _terapeuta(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário '{username}' não encontrado.")
+        terapeuta = (
+            User.objects.annotate(total=Count("sessao")).filter(total__gt=0).order_by("-total").first()
+        )
+        if terapeuta is None:
+            raise CommandError("Nenhum terapeuta com sessões. Rode gerar_dados_benchmark antes.")
+        return terapeuta
+
+    def _alvos(self, terapeuta):
+        """(nome, url, kwargs de medir) para cada view/endpoint medido."""
+        paciente = (
+            Paciente.objects.filter(terapeuta=terapeuta)
+            .annotate(total=Count("sessao"))
+            .order_by("-total")
+            .first()
+        )
+        sessao = Sessao.objects.filter(terapeuta=terapeuta, encerrada=True).order_by("-data_inicio").first()
+        aberta = Sessao.objects.filter(terapeuta=terapeuta, encerrada=False).order_by("-data_inicio").first()
+
+        alvos = [
+            ("dashboard", reverse("dashboard"), {}),
+            ("lista_pacientes", reverse("lista_pacientes"), {}),
+            ("exportar_sessoes", reverse("exportar_sessoes"), {}),
+            ("exportar_atividades", reverse("exportar_atividades"), {}),
+            ("api_pacientes", "/api/pacientes/", {}),
+            ("api_sessoes", "/api/sessoes/", {}),
+            ("api_atividades_modelo", "/api/atividades-modelo/", {}),
+            ("api_atividades_sessao", "/api/atividades-sessao/", {}),
+            ("api_sync", reverse("sincronizar"), {}),
+        ]
+        if paciente:
+            alvos += [
+                ("relatorio_paciente", reverse("relatorio_paciente", args=[paciente.id]), {}),
+                ("historico_sessoes", reverse("historico_sessoes", args=[paciente.id]), {}),
+                # typeahead: prefixo do nome e o nome com uma letra a menos (aproximada)
+                ("api_busca_prefixo", f"{reverse('buscar')}?{urlencode({'q': paciente.nome[:3]})}", {}),
+                ("api_busca_aproximada", f"{reverse('buscar')}?{urlencode({'q': paciente.nome[:4] + paciente.nome[5:]})}", {}),
+            ]
+        if sessao:
+            alvos.append(("relatorio_sessao", reverse("relatorio_sessao", args=[sessao.id]), {}))
+        if aberta:
+            url = reverse("registrar_atividades_sessao", args=[aberta.id])
+            alvos.append(("registrar_atividades_sessao", url, {}))
+            ids = list(
+                AtividadeModelo.objects.filter(terapeuta=terapeuta)
+                .exclude(atividadesessao__sessao=aberta)
+                .values_list("id", flat=True)
+            )
+            if ids:
+                alvos.append(
+                    ("registrar_atividades_sessao_post", url,
+                     {"metodo": "post", "dados": {"atividades": ids}, "desfazer": True})
+                )
+        return alvos
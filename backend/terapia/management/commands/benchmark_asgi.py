@@ -0,0 +1,176 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from terapia.benchmark import percentil
+from terapia.models import AtividadeSessao, Paciente, Sessao
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a vazão (req/s) do perfil WSGI (views síncronas, uma thread por "
+        "requisição simultânea) com o perfil ASGI (views async, um único event loop) "
+        "no registro de sessão e nos relatórios. Cada perfil roda em um processo próprio."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concorrencia", type=int, default=32, help="Requisições simultâneas.")
+        parser.add_argument("--requisicoes", type=int, default=400, help="Requisições por alvo.")
+        parser.add_argument("--usuario", help="Terapeuta usado (padrão: o com mais sessões).")
+        parser.add_argument("--saida", default="benchmark_asgi.json")
+        parser.add_argument("--perfil", choices=["wsgi", "asgi"], help="Uso interno: mede só este perfil.")
+
+    def handle(self, *args, **opts):
+        if opts["perfil"]:
+            # processo filho: mede um perfil e devolve o JSON no stdout
+            self.stdout.write(json.dumps(self._medir_perfil(opts)))
+            return
+
+        resultados = {}
+        for perfil in ("wsgi", "asgi"):
+            ambiente = {**os.environ, "VIEWS_ASYNC": "1" if perfil == "asgi" else "0"}
+            comando = [
+                sys.executable, "manage.py", "benchmark_asgi", "--perfil", perfil,
+                "--concorrencia", str(opts["concorrencia"]), "--requisicoes", str(opts["requisicoes"]),
+            ]
+            if opts["usuario"]:
+                comando += ["--usuario", opts["usuario"]]
+            saida = subprocess.run(
+                comando, cwd=settings.BASE_DIR, env=ambiente, capture_output=True, text=True
+            )
+            if saida.returncode:
+                raise CommandError(f"Perfil {perfil} falhou:\n{saida.stderr}")
+            resultados[perfil] = json.loads(saida.stdout.strip().splitlines()[-1])
+
+        for alvo in resultados["wsgi"]:
+            wsgi, asgi = resultados["wsgi"][alvo], resultados["asgi"][alvo]
+            self.stdout.write(
+                f"{alvo:30} WSGI {wsgi['req_s']:8.1f} req/s p99={wsgi['p99_ms']:8.1f}ms | "
+                f"ASGI {asgi['req_s']:8.1f} req/s p99={asgi['p99_ms']:8.1f}ms "
+                f"({asgi['req_s'] / wsgi['req_s']:.2f}x, erros {wsgi['erros']}/{asgi['erros']})"
+            )
+        relatorio = {
+            "gerado_em": timezone.now().isoformat(),
+            "banco": settings.DATABASES["default"]["ENGINE"],
+            "concorrencia": opts["concorrencia"],
+            "requisicoes": opts["requisicoes"],
+            "resultados": resultados,
+        }
+        Path(opts["saida"]).write_text(json.dumps(relatorio, indent=2), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {opts['saida']}."))
+
+    # -------------------------
+    # Processo filho
+    # -------------------------
+
+    def _medir_perfil(self, opts):
+        terapeuta = self._terapeuta(opts["usuario"])
+        alvos = self._alvos(terapeuta)
+        medir = self._medir_asgi if opts["perfil"] == "asgi" else self._medir_wsgi
+        resultados = {}
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            for nome, metodo, url, dados in alvos:
+                resultados[nome] = medir(terapeuta, metodo, url, dados, opts["concorrencia"], opts["requisicoes"])
+        return resultados
+
+    def _terapeuta(self, username):
+        if username:
+            return User.objects.get(username=username)
+        terapeuta = (
+            User.objects.annotate(total=Count("sessao")).filter(total__gt=0).order_by("-total").first()
+        )
+        if terapeuta is None:
+            raise CommandError("Nenhum terapeuta com sessões. Rode gerar_dados_benchmark antes.")
+        return terapeuta
+
+    def _alvos(self, terapeuta):
+        """(nome, método, url, dados) das views com variante async."""
+        paciente = (
+            Paciente.objects.filter(terapeuta=terapeuta).annotate(total=Count("sessao")).order_by("-total").first()
+        )
+        aberta = Sessao.objects.filter(terapeuta=terapeuta, encerrada=False).order_by("-data_inicio").first()
+        alvos = [
+            ("historico_sessoes", "get", reverse("historico_sessoes", args=[paciente.id]), None),
+            ("relatorio_paciente", "get", reverse("relatorio_paciente", args=[paciente.id]), None),
+        ]
+        if aberta:
+            alvos.append(("registrar_atividades_sessao", "get", reverse("registrar_atividades_sessao", args=[aberta.id]), None))
+            atividade = AtividadeSessao.objects.filter(sessao=aberta).first()
+            if atividade:
+                # grava os mesmos valores: exercita a escrita sem alterar os dados
+                alvos.append((
+                    "registrar_detalhes_atividade_post", "post",
+                    reverse("registrar_detalhes_atividade", args=[atividade.id]),
+                    {"resposta": atividade.resposta, "detalhes": atividade.detalhes or ""},
+                ))
+        return alvos
+
+    def _medir_wsgi(self, terapeuta, metodo, url, dados, concorrencia, requisicoes):
+        clientes = []
+        for _ in range(concorrencia):
+            client = Client()
+            client.force_login(terapeuta)
+            clientes.append(client)
+
+        def trabalhador(indice):
+            client, latencias = clientes[indice], []
+            try:
+                for _ in range(indice, requisicoes, concorrencia):
+                    inicio = time.perf_counter()
+                    status = getattr(client, metodo)(url, dados or {}).status_code
+                    latencias.append(((time.perf_counter() - inicio) * 1000, status))
+            finally:
+                connection.close()
+            return latencias
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(concorrencia) as executor:
+            latencias = [ms for parcial in executor.map(trabalhador, range(concorrencia)) for ms in parcial]
+        return self._resumo(latencias, time.perf_counter() - inicio)
+
+    def _medir_asgi(self, terapeuta, metodo, url, dados, concorrencia, requisicoes):
+        async def executar():
+            clientes = []
+            for _ in range(concorrencia):
+                client = AsyncClient()
+                await client.aforce_login(terapeuta)
+                clientes.append(client)
+
+            async def trabalhador(indice):
+                client, latencias = clientes[indice], []
+                for _ in range(indice, requisicoes, concorrencia):
+                    inicio = time.perf_counter()
+                    status = (await getattr(client, metodo)(url, dados or {})).status_code
+                    latencias.append(((time.perf_counter() - inicio) * 1000, status))
+                return latencias
+
+            inicio = time.perf_counter()
+            parciais = await asyncio.gather(*(trabalhador(i) for i in range(concorrencia)))
+            return [ms for parcial in parciais for ms in parcial], time.perf_counter() - inicio
+
+        latencias, duracao = asyncio.run(executar())
+        return self._resumo(latencias, duracao)
+
+    def _resumo(self, medidas, duracao):
+        latencias = [ms for ms, _ in medidas]
+        return {
+            "requisicoes": len(medidas),
+            "erros": sum(1 for _, status in medidas if status >= 400),
+            "req_s": round(len(medidas) / duracao, 1),
+            "p50_ms": round(percentil(latencias, 50), 2),
+            "p99_ms": round(percentil(latencias, 99), 2),
+        }
@@ -0,0 +1,102 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from terapia.benchmark import medir
+from terapia.models import Paciente
+
+SEM_FRAGMENTOS = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+COM_FRAGMENTOS = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark-fragmentos"}
+
+
+def _templates(cacheado):
+    config = {**settings.TEMPLATES[0], "OPTIONS": dict(settings.TEMPLATES[0]["OPTIONS"])}
+    carregadores = settings.CARREGADORES_TEMPLATES
+    config["OPTIONS"]["loaders"] = (
+        [("django.template.loaders.cached.Loader", carregadores)] if cacheado else carregadores
+    )
+    return [config]
+
+
+# perfil -> (loader em cache, cache dos fragmentos)
+PERFIS = {
+    "sem_cache": (False, SEM_FRAGMENTOS),
+    "loader": (True, SEM_FRAGMENTOS),
+    "loader_fragmentos": (True, COM_FRAGMENTOS),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o tempo de render das páginas com fragmentos em cache (lista de pacientes, "
+        "seletor de atividades, relatório do paciente) sem cache de templates, só com o "
+        "loader em cache e com loader + fragmentos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuario", help="Terapeuta usado (padrão: o com mais pacientes).")
+        parser.add_argument("--repeticoes", type=int, default=20)
+        parser.add_argument("--saida", default="benchmark_templates.json")
+
+    def handle(self, *args, **opts):
+        terapeuta = self._terapeuta(opts["usuario"])
+        paciente = (
+            Paciente.objects.filter(terapeuta=terapeuta).annotate(total=Count("sessao")).order_by("-total").first()
+        )
+        alvos = {
+            "lista_pacientes": reverse("lista_pacientes"),
+            "relatorio_paciente": reverse("relatorio_paciente", args=[paciente.id]),
+        }
+        # iniciar_sessao só mostra o seletor para paciente sem sessão aberta
+        temporario = Paciente.objects.create(nome="Paciente benchmark de templates", terapeuta=terapeuta)
+        alvos["selecionar_atividades"] = reverse("iniciar_sessao", args=[temporario.id])
+
+        client = Client()
+        client.force_login(terapeuta)
+        resultados = {}
+        try:
+            for perfil, (loader_cacheado, fragmentos) in PERFIS.items():
+                cache = {**settings.CACHES, "template_fragments": fragmentos}
+                with override_settings(ALLOWED_HOSTS=["testserver"], TEMPLATES=_templates(loader_cacheado), CACHES=cache):
+                    resultados[perfil] = {
+                        nome: medir(client, url, repeticoes=opts["repeticoes"]) for nome, url in alvos.items()
+                    }
+        finally:
+            temporario.delete()
+
+        for nome in alvos:
+            base = resultados["sem_cache"][nome]["latencia_ms"]["p50"]
+            linha = [f"{nome:24}"]
+            for perfil in PERFIS:
+                medida = resultados[perfil][nome]
+                p50 = medida["latencia_ms"]["p50"]
+                linha.append(
+                    f"{perfil} p50={p50:7.2f}ms ({base / p50:4.1f}x, {medida['consultas']['max']} consultas)"
+                )
+            self.stdout.write(" | ".join(linha))
+
+        relatorio = {
+            "gerado_em": timezone.now().isoformat(),
+            "terapeuta": terapeuta.username,
+            "repeticoes": opts["repeticoes"],
+            "resultados": resultados,
+        }
+        Path(opts["saida"]).write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {opts['saida']}."))
+
+    def _terapeuta(self, username):
+        if username:
+            return User.objects.get(username=username)
+        terapeuta = (
+            User.objects.annotate(total=Count("paciente")).filter(total__gt=0).order_by("-total").first()
+        )
+        if terapeuta is None:
+            raise CommandError("Nenhum terapeuta com pacientes. Rode gerar_dados_benchmark antes.")
+        return terapeuta
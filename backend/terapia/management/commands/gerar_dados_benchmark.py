@@ -0,0 +1,103 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from terapia.busca import reconstruir_indice
+from terapia.models import AtividadeModelo, AtividadeSessao, Paciente, Sessao
+from terapia.resumos import reconstruir_resumos
+
+NOMES = ["Ana", "João", "Lúcia", "Márcio", "Beatriz", "Conceição", "Luís", "Otávio", "Íris", "Caio"]
+SOBRENOMES = ["Souza", "Santos", "Araújo", "Gonçalves", "Lima", "Câmara", "Pereira", "Simões"]
+ATIVIDADES = [
+    "Contato visual", "Imitação motora", "Nomear objetos", "Seguir instrução simples",
+    "Encaixe de formas", "Pareamento de cores", "Esperar a vez", "Pedir ajuda",
+]
+LOTE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera dados sintéticos para benchmark: terapeutas, pacientes, sessões e "
+        "registros de atividade espalhados pelos últimos dias."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--terapeutas", type=int, default=5)
+        parser.add_argument("--pacientes", type=int, default=20, help="Pacientes por terapeuta.")
+        parser.add_argument("--modelos", type=int, default=15, help="Atividades modelo por terapeuta.")
+        parser.add_argument("--sessoes", type=int, default=50, help="Sessões por paciente.")
+        parser.add_argument("--atividades", type=int, default=10, help="Registros por sessão.")
+        parser.add_argument("--dias", type=int, default=365, help="Janela de histórico, em dias.")
+        parser.add_argument("--prefixo", default="bench", help="Prefixo dos usuários criados.")
+        parser.add_argument("--senha", default="bench12345")
+        parser.add_argument("--semente", type=int, default=42)
+
+    @transaction.atomic
+    def handle(self, *args, **opts):
+        aleatorio = random.Random(opts["semente"])
+        agora = timezone.now()
+        inicio = User.objects.filter(username__startswith=f"{opts['prefixo']}_").count()
+
+        for t in range(inicio, inicio + opts["terapeutas"]):
+            terapeuta = User.objects.create_user(
+                f"{opts['prefixo']}_{t}", password=opts["senha"]
+            )
+            modelos = AtividadeModelo.objects.bulk_create(
+                AtividadeModelo(
+                    terapeuta=terapeuta,
+                    descricao=f"{ATIVIDADES[i % len(ATIVIDADES)]} {i // len(ATIVIDADES) + 1}",
+                )
+                for i in range(opts["modelos"])
+            )
+            pacientes = Paciente.objects.bulk_create(
+                Paciente(
+                    terapeuta=terapeuta,
+                    nome=f"{aleatorio.choice(NOMES)} {aleatorio.choice(SOBRENOMES)} {p}",
+                )
+                for p in range(opts["pacientes"])
+            )
+            for paciente in pacientes:
+                self._gerar_historico(paciente, terapeuta, modelos, agora, aleatorio, opts)
+            self.stdout.write(f"Terapeuta {terapeuta.username}: {len(pacientes)} pacientes.")
+
+        diarios, resumos_pacientes = reconstruir_resumos()
+        entradas = reconstruir_indice()  # bulk_create não dispara os sinais da busca
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Dados gerados. Resumos: {diarios} diários, {resumos_pacientes} pacientes. "
+                f"Busca: {entradas} entradas."
+            )
+        )
+
+    def _gerar_historico(self, paciente, terapeuta, modelos, agora, aleatorio, opts):
+        sessoes = Sessao.objects.bulk_create(
+            Sessao(paciente=paciente, terapeuta=terapeuta, encerrada=True)
+            for _ in range(opts["sessoes"])
+        )
+        # auto_now_add ignora o valor informado; bulk_update grava as datas históricas
+        for sessao in sessoes:
+            sessao.data_inicio = agora - timedelta(
+                days=aleatorio.randrange(opts["dias"]), minutes=aleatorio.randrange(600)
+            )
+        if sessoes:
+            sessoes[-1].encerrada = False
+        Sessao.objects.bulk_update(sessoes, ["data_inicio", "encerrada"], batch_size=LOTE)
+
+        registros = []
+        for sessao in sessoes:
+            for i in range(opts["atividades"]):
+                registros.append(
+                    AtividadeSessao(
+                        sessao=sessao,
+                        atividade_modelo=aleatorio.choice(modelos),
+                        resposta="positiva" if aleatorio.random() < 0.6 else "negativa",
+                    )
+                )
+        AtividadeSessao.objects.bulk_create(registros, batch_size=LOTE)
+        for registro in registros:
+            registro.data_registro = registro.sessao.data_inicio + timedelta(minutes=aleatorio.randrange(60))
+        AtividadeSessao.objects.bulk_update(registros, ["data_registro"], batch_size=LOTE)
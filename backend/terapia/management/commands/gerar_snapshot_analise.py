@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from terapia.analise import caminho_snapshot, gerar_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera o snapshot colunar de AtividadeSessao usado pela API de análises "
+        "(/api/analise/). Rode periodicamente (ex.: cron a cada hora)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--saida", help="Arquivo de saída (padrão: settings.ANALISE_SNAPSHOT).")
+
+    def handle(self, *args, **opts):
+        caminho = opts["saida"] or caminho_snapshot()
+        inicio = time.perf_counter()
+        linhas = gerar_snapshot(caminho)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Snapshot com {linhas} linhas gravado em {caminho} "
+                f"({time.perf_counter() - inicio:.1f}s)."
+            )
+        )
@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from terapia.fila_relatorios import liberar_jobs_travados, reivindicar_jobs, renderizar_relatorio
+
+
+def _iniciar_processo():
+    # Cada processo abre as próprias conexões; as herdadas do pai não podem ser reusadas.
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Processa a fila de relatórios de sessão (RelatorioSessaoJob) com um pool de processos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processos", type=int, default=2, help="Tamanho do pool de processos.")
+        parser.add_argument("--lote", type=int, default=20, help="Pedidos reivindicados por rodada.")
+        parser.add_argument(
+            "--continuo",
+            action="store_true",
+            help="Continua consultando a fila em vez de sair quando ela esvaziar.",
+        )
+        parser.add_argument("--intervalo", type=float, default=2.0, help="Segundos entre consultas (modo contínuo).")
+        parser.add_argument(
+            "--liberar-apos",
+            type=int,
+            default=10,
+            help="Minutos após os quais um pedido 'processando' volta para a fila.",
+        )
+
+    def handle(self, *args, **options):
+        liberados = liberar_jobs_travados(options["liberar_apos"])
+        if liberados:
+            self.stdout.write(f"{liberados} pedido(s) travado(s) devolvido(s) à fila.")
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options["processos"], initializer=_iniciar_processo) as pool:
+            while True:
+                ids = reivindicar_jobs(options["lote"])
+                if ids:
+                    futuros = {job_id: pool.submit(renderizar_relatorio, job_id) for job_id in ids}
+                    for job_id, futuro in futuros.items():
+                        try:
+                            self.stdout.write(f"Pedido {job_id}: {futuro.result()}")
+                        except Exception as exc:
+                            # Fica "processando" e é devolvido à fila por --liberar-apos.
+                            self.stderr.write(f"Pedido {job_id}: falha no worker ({exc})")
+                    continue
+                if not options["continuo"]:
+                    break
+                time.sleep(options["intervalo"])
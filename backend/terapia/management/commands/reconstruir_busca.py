@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from terapia.busca import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = "Recria o índice de busca (EntradaBusca e TrigramaBusca) a partir de pacientes e atividades modelo."
+
+    def handle(self, *args, **options):
+        total = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f"Índice de busca reconstruído: {total} entradas."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from terapia.resumos import reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = "Recria as tabelas de resumo (ResumoDiarioAtividade e ResumoPaciente) a partir dos registros."
+
+    def handle(self, *args, **options):
+        diarios, pacientes = reconstruir_resumos()
+        self.stdout.write(
+            self.style.SUCCESS(f"Resumos reconstruídos: {diarios} diários, {pacientes} pacientes.")
+        )
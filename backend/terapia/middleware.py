@@ -0,0 +1,115 @@
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import instrumentacao, replica
+
+
+def _instalar_coletor(coletor):
+    for conexao in connections.all():
+        conexao.execute_wrappers.append(coletor)
+
+
+def _remover_coletor(coletor):
+    for conexao in connections.all():
+        if coletor in conexao.execute_wrappers:
+            conexao.execute_wrappers.remove(coletor)
+
+
+class InstrumentacaoMiddleware:
+    """
+    Registra, por nome de URL, consultas SQL, tempo de banco, consultas
+    repetidas, tempo de template e tamanho da resposta (ver instrumentacao.py).
+    Desative com INSTRUMENTACAO_ATIVA = False.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "INSTRUMENTACAO_ATIVA", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        coletor, token = instrumentacao.iniciar_coleta()
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conexao in connections.all():
+                    stack.enter_context(conexao.execute_wrapper(coletor))
+                response = self.get_response(request)
+        finally:
+            instrumentacao.encerrar_coleta(token)
+        self._registrar(request, response, time.perf_counter() - inicio, coletor)
+        return response
+
+    async def __acall__(self, request):
+        coletor, token = instrumentacao.iniciar_coleta()
+        inicio = time.perf_counter()
+        # No ASGI as consultas rodam na thread do sync_to_async da requisição
+        # (conexões são por thread): o coletor é instalado lá.
+        await sync_to_async(_instalar_coletor)(coletor)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remover_coletor)(coletor)
+            instrumentacao.encerrar_coleta(token)
+        self._registrar(request, response, time.perf_counter() - inicio, coletor)
+        return response
+
+    def _registrar(self, request, response, duracao, coletor):
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name if match else None) or "<sem_rota>"
+        # Respostas em streaming são geradas depois do middleware: só o tempo até o 1º byte conta.
+        tamanho = None if response.streaming else len(response.content)
+        instrumentacao.registrar(view, request.method, response.status_code, duracao, coletor, tamanho)
+
+
+class FixarPrimarioMiddleware:
+    """
+    Após uma escrita (POST/PUT/PATCH/DELETE) marca o navegador com um cookie
+    curto e o usuário autenticado (sessão ou Bearer) no cache; enquanto um
+    dos dois existir, as views de leitura não usam a réplica.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica.replica_configurada():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        return self._fixar(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if request.method in replica.METODOS_SEGUROS:
+            return response
+        # request.user pode ser o usuário lazy da sessão, que consulta o banco
+        return await sync_to_async(self._fixar)(request, response)
+
+    def _fixar(self, request, response):
+        if request.method not in replica.METODOS_SEGUROS:
+            response.set_cookie(
+                replica.COOKIE_FIXAR, "1", max_age=replica.segundos_fixado(), httponly=True, samesite="Lax"
+            )
+            # o DRF grava em request.user o usuário autenticado pelo Bearer
+            replica.fixar_usuario(getattr(request, "user", None))
+        return response
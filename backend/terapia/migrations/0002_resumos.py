@@ -0,0 +1,75 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+from django.db.models.functions import TruncDate
+
+
+def popular_resumos(apps, schema_editor):
+    AtividadeSessao = apps.get_model('terapia', 'AtividadeSessao')
+    Sessao = apps.get_model('terapia', 'Sessao')
+    ResumoDiarioAtividade = apps.get_model('terapia', 'ResumoDiarioAtividade')
+    ResumoPaciente = apps.get_model('terapia', 'ResumoPaciente')
+
+    diarios = (
+        AtividadeSessao.objects.annotate(dia=TruncDate('data_registro'))
+        .values('sessao__paciente_id', 'atividade_modelo_id', 'dia')
+        .annotate(
+            positivas=Count('id', filter=Q(resposta='positiva')),
+            negativas=Count('id', filter=Q(resposta='negativa')),
+        )
+        .order_by()
+    )
+    ResumoDiarioAtividade.objects.bulk_create(
+        [
+            ResumoDiarioAtividade(
+                paciente_id=d['sessao__paciente_id'],
+                atividade_modelo_id=d['atividade_modelo_id'],
+                dia=d['dia'],
+                positivas=d['positivas'],
+                negativas=d['negativas'],
+            )
+            for d in diarios
+        ],
+        batch_size=1000,
+    )
+    pacientes = (
+        Sessao.objects.values('paciente_id')
+        .annotate(sessoes_count=Count('id'), ultima_sessao=Max('data_inicio'))
+        .order_by()
+    )
+    ResumoPaciente.objects.bulk_create([ResumoPaciente(**p) for p in pacientes], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapia', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoPaciente',
+            fields=[
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo', serialize=False, to='terapia.paciente')),
+                ('sessoes_count', models.PositiveIntegerField(default=0)),
+                ('ultima_sessao', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumoDiarioAtividade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('positivas', models.PositiveIntegerField(default=0)),
+                ('negativas', models.PositiveIntegerField(default=0)),
+                ('atividade_modelo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='terapia.atividademodelo')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='terapia.paciente')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('paciente', 'atividade_modelo', 'dia'), name='resumo_diario_unico')],
+            },
+        ),
+        migrations.RunPython(popular_resumos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapia', '0002_resumos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='atividademodelo',
+            index=models.Index(fields=['terapeuta', 'descricao'], name='modelo_terapeuta_descricao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='atividadesessao',
+            index=models.Index(fields=['sessao', '-data_registro'], name='ativsessao_sessao_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['terapeuta', 'nome'], name='paciente_terapeuta_nome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resumodiarioatividade',
+            index=models.Index(fields=['paciente', 'dia'], name='resumo_paciente_dia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessao',
+            index=models.Index(fields=['terapeuta', 'encerrada', '-data_inicio'], name='sessao_terapeuta_ativa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessao',
+            index=models.Index(fields=['paciente', '-data_inicio'], name='sessao_paciente_data_idx'),
+        ),
+    ]
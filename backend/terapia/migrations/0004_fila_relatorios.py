@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapia', '0003_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatorioSessaoJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=12)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('hash_conteudo', models.CharField(blank=True, max_length=64)),
+                ('arquivo', models.CharField(blank=True, max_length=255)),
+                ('erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('gerado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('sessao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='relatorio_jobs', to='terapia.sessao')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'criado_em'], name='relatoriojob_fila_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapia', '0004_fila_relatorios'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Exclusao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('paciente', 'Paciente'), ('sessao', 'Sessão'), ('atividade_modelo', 'Atividade modelo'), ('atividade_sessao', 'Atividade da sessão')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('excluido_em', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='atividademodelo',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='atividadesessao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='sessao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='atividademodelo',
+            index=models.Index(fields=['terapeuta', 'atualizado_em'], name='modelo_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='atividadesessao',
+            index=models.Index(fields=['atualizado_em'], name='ativsessao_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['terapeuta', 'atualizado_em'], name='paciente_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessao',
+            index=models.Index(fields=['terapeuta', 'atualizado_em'], name='sessao_sync_idx'),
+        ),
+        migrations.AddField(
+            model_name='exclusao',
+            name='terapeuta',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='exclusao',
+            index=models.Index(fields=['terapeuta', 'excluido_em'], name='exclusao_sync_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapia', '0005_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='atividadesessao',
+            name='chave_idempotencia',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:52
+
+import django.db.models.deletion
+from django.conf import settings
+import unicodedata
+
+from django.db import migrations, models
+
+
+def _normalizar(texto):
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ' '.join(''.join(c for c in decomposto if not unicodedata.combining(c)).casefold().split())
+
+
+def _trigramas(texto):
+    resultado = set()
+    for palavra in texto.split():
+        palavra = f' {palavra} '
+        resultado.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return resultado
+
+
+def popular_busca(apps, schema_editor):
+    EntradaBusca = apps.get_model('terapia', 'EntradaBusca')
+    TrigramaBusca = apps.get_model('terapia', 'TrigramaBusca')
+    origens = [
+        ('paciente', apps.get_model('terapia', 'Paciente'), 'nome'),
+        ('atividade_modelo', apps.get_model('terapia', 'AtividadeModelo'), 'descricao'),
+    ]
+    for tipo, modelo, campo in origens:
+        entradas = EntradaBusca.objects.bulk_create(
+            [
+                EntradaBusca(
+                    tipo=tipo, objeto_id=objeto_id, terapeuta_id=terapeuta_id,
+                    texto=_normalizar(texto), rotulo=texto,
+                )
+                for objeto_id, terapeuta_id, texto in modelo.objects.values_list('id', 'terapeuta_id', campo)
+            ],
+            batch_size=1000,
+        )
+        TrigramaBusca.objects.bulk_create(
+            [
+                TrigramaBusca(entrada_id=entrada.id, terapeuta_id=entrada.terapeuta_id, tipo=tipo, trigrama=trigrama)
+                for entrada in entradas
+                for trigrama in _trigramas(entrada.texto)
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapia', '0006_chave_idempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntradaBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('paciente', 'Paciente'), ('atividade_modelo', 'Atividade modelo')], max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('texto', models.CharField(max_length=200)),
+                ('rotulo', models.CharField(max_length=200)),
+                ('terapeuta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrigramaBusca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terapeuta_id', models.IntegerField()),
+                ('tipo', models.CharField(max_length=20)),
+                ('trigrama', models.CharField(max_length=3)),
+                ('entrada', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigramas', to='terapia.entradabusca')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='entradabusca',
+            index=models.Index(fields=['terapeuta', 'tipo', 'texto'], name='busca_prefixo_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='entradabusca',
+            constraint=models.UniqueConstraint(fields=('tipo', 'objeto_id'), name='entrada_busca_unica'),
+        ),
+        migrations.AddIndex(
+            model_name='trigramabusca',
+            index=models.Index(fields=['terapeuta_id', 'tipo', 'trigrama', 'entrada'], name='busca_trigrama_idx'),
+        ),
+        migrations.RunPython(popular_busca, migrations.RunPython.noop),
+    ]
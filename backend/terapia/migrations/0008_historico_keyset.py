@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapia', '0007_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='sessao',
+            name='sessao_paciente_data_idx',
+        ),
+        migrations.AddIndex(
+            model_name='sessao',
+            index=models.Index(fields=['paciente', '-data_inicio', '-id'], name='sessao_paciente_data_id_idx'),
+        ),
+    ]
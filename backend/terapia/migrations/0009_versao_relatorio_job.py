@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terapia', '0008_historico_keyset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relatoriosessaojob',
+            name='versao',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
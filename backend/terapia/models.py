@@ -5,6 +5,13 @@ class Paciente(models.Model):
     nome = models.CharField(max_length=100)
     data_nascimento = models.DateField(null=True, blank=True)
     terapeuta = models.ForeignKey(User, on_delete=models.CASCADE)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["terapeuta", "nome"], name="paciente_terapeuta_nome_idx"),
+            models.Index(fields=["terapeuta", "atualizado_em"], name="paciente_sync_idx"),
+        ]
 
     def __str__(self):
         return self.nome
@@ -15,6 +22,17 @@ class Sessao(models.Model):
     terapeuta = models.ForeignKey(User, on_delete=models.CASCADE)
     data_inicio = models.DateTimeField(auto_now_add=True)
     encerrada = models.BooleanField(default=False)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # dashboard: sessões ativas do terapeuta, mais recentes primeiro
+            models.Index(fields=["terapeuta", "encerrada", "-data_inicio"], name="sessao_terapeuta_ativa_idx"),
+            # histórico e relatório do paciente
+            # (id no fim: desempate da paginação por keyset do histórico)
+            models.Index(fields=["paciente", "-data_inicio", "-id"], name="sessao_paciente_data_id_idx"),
+            models.Index(fields=["terapeuta", "atualizado_em"], name="sessao_sync_idx"),
+        ]
 
     def __str__(self):
         return f"Sessão de {self.paciente.nome} em {self.data_inicio.strftime('%d/%m/%Y')}"
@@ -24,6 +42,13 @@ class AtividadeModelo(models.Model):
     """Atividades que o terapeuta cadastra para selecionar nas sessões."""
     descricao = models.CharField(max_length=200)
     terapeuta = models.ForeignKey(User, on_delete=models.CASCADE)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["terapeuta", "descricao"], name="modelo_terapeuta_descricao_idx"),
+            models.Index(fields=["terapeuta", "atualizado_em"], name="modelo_sync_idx"),
+        ]
 
     def __str__(self):
         return self.descricao
@@ -41,6 +66,145 @@ class AtividadeSessao(models.Model):
         ('negativa', 'Negativa'),
     ]
     resposta = models.CharField(max_length=10, choices=RESPOSTAS_CHOICES, default='positiva')
+    atualizado_em = models.DateTimeField(auto_now=True)
+    # gerada pelo app para que reenvios do lote offline não dupliquem registros
+    chave_idempotencia = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # registrar/relatório da sessão e filtro por período do paciente
+            # (sessao__paciente resolve pela sessão, depois faixa de data_registro)
+            models.Index(fields=["sessao", "-data_registro"], name="ativsessao_sessao_data_idx"),
+            models.Index(fields=["atualizado_em"], name="ativsessao_sync_idx"),
+        ]
 
     def __str__(self):
         return f"{self.sessao.paciente.nome} - {self.atividade_modelo.descricao} ({self.resposta})"
+
+
+class ResumoDiarioAtividade(models.Model):
+    """Contagem diária de respostas por paciente e atividade (mantida por sinais)."""
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE)
+    atividade_modelo = models.ForeignKey(AtividadeModelo, on_delete=models.CASCADE)
+    dia = models.DateField()
+    positivas = models.PositiveIntegerField(default=0)
+    negativas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["paciente", "atividade_modelo", "dia"],
+                name="resumo_diario_unico",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["paciente", "dia"], name="resumo_paciente_dia_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.paciente_id}/{self.atividade_modelo_id} em {self.dia}: +{self.positivas} -{self.negativas}"
+
+
+class ResumoPaciente(models.Model):
+    """Totais de sessões do paciente (mantido por sinais)."""
+    paciente = models.OneToOneField(
+        Paciente, on_delete=models.CASCADE, primary_key=True, related_name="resumo"
+    )
+    sessoes_count = models.PositiveIntegerField(default=0)
+    ultima_sessao = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.paciente_id}: {self.sessoes_count} sessões"
+
+
+class RelatorioSessaoJob(models.Model):
+    """Pedido de geração do relatório HTML de uma sessão (fila processada em segundo plano)."""
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+    sessao = models.ForeignKey(Sessao, on_delete=models.CASCADE, related_name="relatorio_jobs")
+    gerado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    hash_conteudo = models.CharField(max_length=64, blank=True)
+    arquivo = models.CharField(max_length=255, blank=True)  # relativo a MEDIA_ROOT
+    erro = models.TextField(blank=True)
+    # carimbo de versão da sessão (cache_relatorios) quando o pedido foi feito
+    versao = models.BigIntegerField(null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "criado_em"], name="relatoriojob_fila_idx"),
+        ]
+
+    def __str__(self):
+        return f"Relatório da sessão {self.sessao_id} ({self.status})"
+
+
+class Exclusao(models.Model):
+    """Registro (tombstone) de um objeto excluído, para a sincronização incremental."""
+    MODELOS_CHOICES = [
+        ('paciente', 'Paciente'),
+        ('sessao', 'Sessão'),
+        ('atividade_modelo', 'Atividade modelo'),
+        ('atividade_sessao', 'Atividade da sessão'),
+    ]
+    modelo = models.CharField(max_length=20, choices=MODELOS_CHOICES)
+    objeto_id = models.BigIntegerField()
+    # sem constraint: a exclusão do próprio terapeuta também gera tombstones em cascata
+    terapeuta = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+    excluido_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["terapeuta", "excluido_em"], name="exclusao_sync_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.modelo} {self.objeto_id} excluído em {self.excluido_em}"
+
+
+class EntradaBusca(models.Model):
+    """Texto normalizado (sem acentos, minúsculo) de um paciente ou atividade modelo, para a busca."""
+    TIPOS_CHOICES = [
+        ('paciente', 'Paciente'),
+        ('atividade_modelo', 'Atividade modelo'),
+    ]
+    tipo = models.CharField(max_length=20, choices=TIPOS_CHOICES)
+    objeto_id = models.BigIntegerField()
+    terapeuta = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    texto = models.CharField(max_length=200)
+    rotulo = models.CharField(max_length=200)  # texto original, exibido no resultado
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tipo", "objeto_id"], name="entrada_busca_unica"),
+        ]
+        indexes = [
+            # consultas de 1 letra: prefixo do texto
+            models.Index(fields=["terapeuta", "tipo", "texto"], name="busca_prefixo_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.objeto_id}: {self.texto}"
+
+
+class TrigramaBusca(models.Model):
+    """Índice invertido de trigramas das entradas de busca (mantido por sinais)."""
+    entrada = models.ForeignKey(EntradaBusca, on_delete=models.CASCADE, related_name="trigramas")
+    terapeuta_id = models.IntegerField()  # copiado da entrada: a consulta não precisa do join
+    tipo = models.CharField(max_length=20)
+    trigrama = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            # cobre a consulta inteira (filtro + agrupamento por entrada)
+            models.Index(fields=["terapeuta_id", "tipo", "trigrama", "entrada"], name="busca_trigrama_idx"),
+        ]
@@ -0,0 +1,73 @@
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination
+
+from .sincronizacao import TokenInvalido, gerar_token, ler_token
+
+
+class CursorPaginacao(CursorPagination):
+    """Paginação por cursor: custo constante por página, estável com inserções."""
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+class PacientePaginacao(CursorPaginacao):
+    ordering = ("nome", "id")
+
+
+class SessaoPaginacao(CursorPaginacao):
+    ordering = ("-data_inicio", "-id")
+
+
+class AtividadeModeloPaginacao(CursorPaginacao):
+    ordering = ("descricao", "id")
+
+
+class AtividadeSessaoPaginacao(CursorPaginacao):
+    ordering = ("-data_registro", "-id")
+
+
+# =========================
+# Keyset para as páginas HTML
+# =========================
+
+TAMANHO_PAGINA_HISTORICO = 25
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def gerar_cursor(instante, pk):
+    """'<microssegundos desde a época>.<id>' do último item entregue."""
+    return f"{gerar_token(instante)}.{pk}"
+
+
+def apos_cursor(queryset, campo, cursor):
+    """
+    `queryset` em ordem (-campo, -id), a partir do item seguinte ao cursor.
+    A condição é escrita como faixa em `campo` para o banco seguir o índice
+    (..., -campo, -id) sem ordenar as linhas anteriores.
+    """
+    queryset = queryset.order_by(f"-{campo}", "-id")
+    if not cursor:
+        return queryset
+    try:
+        token, pk = cursor.split(".")
+        instante, pk = ler_token(token), int(pk)
+    except (TokenInvalido, ValueError):
+        raise CursorInvalido("Cursor de paginação inválido.")
+    return queryset.filter(**{f"{campo}__lte": instante}).exclude(
+        Q(**{campo: instante}) & Q(id__gte=pk)
+    )
+
+
+def fechar_pagina(itens, campo, tamanho):
+    """
+    `itens` é o resultado de `apos_cursor(...)[:tamanho + 1]`; o item extra só
+    indica que há mais. Retorna (itens da página, cursor da próxima ou None).
+    """
+    if len(itens) <= tamanho:
+        return itens, None
+    ultimo = itens[tamanho - 1]
+    return itens[:tamanho], gerar_cursor(getattr(ultimo, campo), ultimo.pk)
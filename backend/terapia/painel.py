@@ -0,0 +1,123 @@
+"""
+Resumo do dia por terapeuta (sessões, respostas positivas/negativas e
+pacientes sem sessão recente), servido a partir de contadores no cache.
+
+Os sinais incrementam os contadores a cada sessão/registro; se uma chave não
+existir (cache reiniciado, primeiro acesso do dia) ela é recalculada uma vez
+a partir do banco. Assim a leitura não depende do tamanho do histórico.
+"""
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import AtividadeSessao, Paciente, Sessao
+
+CONTADORES = ("sessoes", "positivas", "negativas")
+TIMEOUT = 60 * 60 * 36
+DIAS_SEM_SESSAO_PADRAO = 7
+LIMITE_LISTA = 20
+
+
+def _chave(terapeuta_id, dia, contador):
+    return f"painel:{terapeuta_id}:{dia.isoformat()}:{contador}"
+
+
+def _chave_versao_pacientes(terapeuta_id):
+    return f"painel:{terapeuta_id}:pacientes:versao"
+
+
+def _limites_do_dia(dia):
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    return inicio, inicio + timedelta(days=1)
+
+
+def _contar_no_banco(terapeuta_id, dia):
+    inicio, fim = _limites_do_dia(dia)
+    sessoes = Sessao.objects.filter(
+        terapeuta_id=terapeuta_id, data_inicio__gte=inicio, data_inicio__lt=fim
+    ).count()
+    respostas = AtividadeSessao.objects.filter(
+        sessao__terapeuta_id=terapeuta_id, data_registro__gte=inicio, data_registro__lt=fim
+    ).aggregate(
+        positivas=Count("id", filter=Q(resposta="positiva")),
+        negativas=Count("id", filter=Q(resposta="negativa")),
+    )
+    return {"sessoes": sessoes, **respostas}
+
+
+def contadores_do_dia(terapeuta_id, dia=None):
+    dia = dia or timezone.localdate()
+    chaves = {contador: _chave(terapeuta_id, dia, contador) for contador in CONTADORES}
+    valores = cache.get_many(chaves.values())
+    if len(valores) == len(chaves):
+        return {contador: valores[chave] for contador, chave in chaves.items()}
+
+    contagem = _contar_no_banco(terapeuta_id, dia)
+    for contador, chave in chaves.items():
+        # add: não sobrescreve um incremento feito enquanto contávamos
+        cache.add(chave, contagem[contador], TIMEOUT)
+    return contagem
+
+
+def alterar_contador(terapeuta_id, momento, contador, delta):
+    """Soma `delta` ao contador do dia de `momento` (se já estiver no cache)."""
+    dia = timezone.localdate(momento)
+    if dia != timezone.localdate():
+        return  # só o dia corrente é mantido em contadores
+    try:
+        cache.incr(_chave(terapeuta_id, dia, contador), delta)
+    except ValueError:
+        pass  # chave ausente: será recalculada na próxima leitura
+
+
+def invalidar(terapeuta_id):
+    """Descarta os contadores do dia e a lista de pacientes (recalculados na leitura)."""
+    dia = timezone.localdate()
+    cache.delete_many([_chave(terapeuta_id, dia, contador) for contador in CONTADORES])
+    invalidar_pacientes(terapeuta_id)
+
+
+def invalidar_pacientes(terapeuta_id):
+    try:
+        cache.incr(_chave_versao_pacientes(terapeuta_id))
+    except ValueError:
+        cache.set(_chave_versao_pacientes(terapeuta_id), 1, None)
+
+
+def pacientes_sem_sessao(terapeuta_id, dias=DIAS_SEM_SESSAO_PADRAO):
+    """Pacientes sem sessão nos últimos `dias` dias (via ResumoPaciente), em cache."""
+    versao = cache.get_or_set(_chave_versao_pacientes(terapeuta_id), 1, None)
+    hoje = timezone.localdate()
+    chave = f"painel:{terapeuta_id}:sem_sessao:{dias}:{hoje.isoformat()}:{versao}"
+    resultado = cache.get(chave)
+    if resultado is None:
+        limite, _ = _limites_do_dia(hoje - timedelta(days=dias - 1))
+        pacientes = (
+            Paciente.objects.filter(terapeuta_id=terapeuta_id)
+            .filter(Q(resumo__isnull=True) | Q(resumo__ultima_sessao__lt=limite))
+            .order_by("resumo__ultima_sessao", "nome")
+            .values("id", "nome", "resumo__ultima_sessao")
+        )
+        resultado = {
+            "total": pacientes.count(),
+            "pacientes": [
+                {"id": p["id"], "nome": p["nome"], "ultima_sessao": p["resumo__ultima_sessao"]}
+                for p in pacientes[:LIMITE_LISTA]
+            ],
+        }
+        cache.set(chave, resultado, TIMEOUT)
+    return resultado
+
+
+def resumo_do_terapeuta(terapeuta_id, dias=DIAS_SEM_SESSAO_PADRAO):
+    contadores = contadores_do_dia(terapeuta_id)
+    respostas = contadores["positivas"] + contadores["negativas"]
+    return {
+        "dia": timezone.localdate(),
+        **contadores,
+        "taxa_positiva": round(contadores["positivas"] / respostas, 3) if respostas else None,
+        "dias_sem_sessao": dias,
+        "sem_sessao": pacientes_sem_sessao(terapeuta_id, dias),
+    }
@@ -0,0 +1,215 @@
+"""
+Métricas de progresso por paciente e atividade: taxa de acerto móvel nas
+últimas N sessões, sequências de sessões acima do critério, critério de
+domínio (ex.: >= 80% de positivas em 3 sessões seguidas) e tendência.
+
+A série de cada (paciente, atividade) é um ponto por sessão (positivas e
+negativas), obtida com uma única consulta agregada para todas as atividades
+que faltam no cache. As métricas saem de somas acumuladas sobre essa série,
+sem voltar ao banco. Os sinais de AtividadeSessao atualizam no cache só o
+ponto da sessão alterada; mudanças na sessão (data, exclusão) trocam a versão
+do paciente inteiro.
+"""
+from bisect import bisect_left
+from itertools import accumulate, groupby
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from . import catalogo
+from .models import AtividadeModelo, AtividadeSessao, ResumoDiarioAtividade
+
+JANELA_PADRAO = 5
+CRITERIO_PADRAO = 0.8
+SESSOES_CONSECUTIVAS_PADRAO = 3
+VARIACAO_TENDENCIA = 0.1
+TIMEOUT = 60 * 60 * 24 * 7
+
+
+def _chave_versao(paciente_id):
+    return f"progresso:{paciente_id}:versao"
+
+
+def _chave_serie(paciente_id, versao, atividade_modelo_id):
+    return f"progresso:{paciente_id}:{versao}:{atividade_modelo_id}"
+
+
+def _versao(paciente_id):
+    return cache.get_or_set(_chave_versao(paciente_id), 1, None)
+
+
+def invalidar_paciente(paciente_id):
+    """Descarta todas as séries do paciente (ordem/datas das sessões mudaram)."""
+    try:
+        cache.incr(_chave_versao(paciente_id))
+    except ValueError:
+        cache.set(_chave_versao(paciente_id), 1, None)
+
+
+def invalidar_series(paciente_id, atividade_modelo_ids):
+    """Descarta só as séries das atividades alteradas; as demais continuam valendo."""
+    versao = _versao(paciente_id)
+    cache.delete_many([_chave_serie(paciente_id, versao, a) for a in atividade_modelo_ids])
+
+
+def atualizar_ponto(paciente_id, atividade_modelo_id, sessao_id, data_inicio, positivas, negativas):
+    """
+    Soma `positivas` e `negativas` (negativos numa exclusão) ao ponto da sessão
+    na série em cache, sem voltar ao banco. Série fora do cache: nada a fazer,
+    ela é calculada na próxima leitura.
+    """
+    versao = _versao(paciente_id)
+    chave = _chave_serie(paciente_id, versao, atividade_modelo_id)
+    trava = f"{chave}:trava"
+    if not cache.add(trava, 1, 10):
+        # outra escrita alterando a mesma série: um dos incrementos se perderia
+        invalidar_paciente(paciente_id)
+        return
+    try:
+        serie = cache.get(chave)
+        if serie is None:
+            return
+        serie = list(serie)
+        posicao = bisect_left(serie, (data_inicio, sessao_id), key=lambda ponto: (ponto[1], ponto[0]))
+        if posicao < len(serie) and serie[posicao][0] == sessao_id:
+            _, _, positivas_antes, negativas_antes = serie.pop(posicao)
+            positivas += positivas_antes
+            negativas += negativas_antes
+        if positivas < 0 or negativas < 0:
+            cache.delete(chave)  # o cache não tinha o ponto descontado: recalcula na leitura
+            return
+        if positivas or negativas:
+            serie.insert(posicao, (sessao_id, data_inicio, positivas, negativas))
+        cache.set(chave, serie, TIMEOUT)
+    finally:
+        cache.delete(trava)
+
+
+def _calcular_series(paciente_id, atividade_modelo_ids):
+    """Uma consulta: positivas/negativas por (atividade, sessão), em ordem cronológica."""
+    linhas = (
+        AtividadeSessao.objects.filter(
+            sessao__paciente_id=paciente_id, atividade_modelo_id__in=atividade_modelo_ids
+        )
+        .values("atividade_modelo_id", "sessao_id", "sessao__data_inicio")
+        .annotate(
+            positivas=Count("id", filter=Q(resposta="positiva")),
+            negativas=Count("id", filter=Q(resposta="negativa")),
+        )
+        .order_by("atividade_modelo_id", "sessao__data_inicio", "sessao_id")
+    )
+    series = {atividade_modelo_id: [] for atividade_modelo_id in atividade_modelo_ids}
+    for atividade_modelo_id, pontos in groupby(linhas, key=lambda l: l["atividade_modelo_id"]):
+        series[atividade_modelo_id] = [
+            (p["sessao_id"], p["sessao__data_inicio"], p["positivas"], p["negativas"]) for p in pontos
+        ]
+    return series
+
+
+def series_do_paciente(paciente_id):
+    """{atividade_modelo_id: [(sessao_id, data_inicio, positivas, negativas), ...]}."""
+    atividades = set(
+        ResumoDiarioAtividade.objects.filter(paciente_id=paciente_id)
+        .values_list("atividade_modelo_id", flat=True)
+        .distinct()
+    )
+    versao = _versao(paciente_id)
+    chaves = {_chave_serie(paciente_id, versao, a): a for a in atividades}
+    series = {chaves[chave]: serie for chave, serie in cache.get_many(chaves).items()}
+
+    faltando = atividades - series.keys()
+    if faltando:
+        calculadas = _calcular_series(paciente_id, faltando)
+        cache.set_many(
+            {_chave_serie(paciente_id, versao, a): serie for a, serie in calculadas.items()}, TIMEOUT
+        )
+        series.update(calculadas)
+    return series
+
+
+def _janela(acumulado, fim, janela):
+    return acumulado[fim] - acumulado[max(fim - janela, 0)]
+
+
+def metricas_da_serie(
+    serie,
+    janela=JANELA_PADRAO,
+    criterio=CRITERIO_PADRAO,
+    consecutivas=SESSOES_CONSECUTIVAS_PADRAO,
+):
+    """Taxas (geral e móvel), sequências, domínio e tendência de uma série."""
+    positivas = [p for _, _, p, _ in serie]
+    totais = [p + n for _, _, p, n in serie]
+    acum_positivas = [0, *accumulate(positivas)]
+    acum_totais = [0, *accumulate(totais)]
+
+    taxas = [p / t if t else None for p, t in zip(positivas, totais)]
+    moveis = [
+        _janela(acum_positivas, i, janela) / _janela(acum_totais, i, janela)
+        for i in range(1, len(serie) + 1)
+    ]
+    atingiu = [taxa is not None and taxa >= criterio for taxa in taxas]
+
+    # sequências de sessões seguidas acima do critério: (índice final, tamanho)
+    sequencias, inicio = [], 0
+    for acima, grupo in groupby(atingiu):
+        tamanho = len(list(grupo))
+        if acima:
+            sequencias.append((inicio + tamanho - 1, tamanho))
+        inicio += tamanho
+    sequencia_atual = sequencias[-1][1] if sequencias and sequencias[-1][0] == len(serie) - 1 else 0
+    dominio = next(
+        (fim - tamanho + consecutivas for fim, tamanho in sequencias if tamanho >= consecutivas), None
+    )
+
+    tendencia = None
+    if len(moveis) > janela:
+        variacao = moveis[-1] - moveis[-1 - janela]
+        tendencia = (
+            "subindo" if variacao >= VARIACAO_TENDENCIA
+            else "caindo" if variacao <= -VARIACAO_TENDENCIA
+            else "estavel"
+        )
+
+    return {
+        "sessoes": len(serie),
+        "respostas": acum_totais[-1],
+        "taxa_geral": round(acum_positivas[-1] / acum_totais[-1], 3) if serie else None,
+        "taxa_movel": round(moveis[-1], 3) if moveis else None,
+        "sequencia_atual": sequencia_atual,
+        "maior_sequencia": max((tamanho for _, tamanho in sequencias), default=0),
+        "dominada": dominio is not None,
+        "dominada_em": serie[dominio][1] if dominio is not None else None,
+        "tendencia": tendencia,
+        "serie": [
+            {
+                "sessao": sessao_id,
+                "data": data,
+                "positivas": p,
+                "negativas": n,
+                "taxa": round(taxa, 3) if taxa is not None else None,
+                "taxa_movel": round(movel, 3),
+            }
+            for (sessao_id, data, p, n), taxa, movel in zip(serie, taxas, moveis)
+        ],
+    }
+
+
+def progresso_do_paciente(paciente, **parametros):
+    """Métricas de todas as atividades já registradas para o paciente, por descrição."""
+    series = series_do_paciente(paciente.id)
+    descricoes = catalogo.catalogo_do_terapeuta(paciente.terapeuta_id).descricoes
+    faltando = series.keys() - descricoes.keys()
+    if faltando:
+        # atividade de outro terapeuta (paciente transferido): vai ao banco
+        descricoes = {
+            **descricoes,
+            **dict(AtividadeModelo.objects.filter(id__in=faltando).values_list("id", "descricao")),
+        }
+    progresso = [
+        {"atividade_modelo": atividade_id, "descricao": descricoes.get(atividade_id, ""),
+         **metricas_da_serie(serie, **parametros)}
+        for atividade_id, serie in series.items()
+        if serie
+    ]
+    return sorted(progresso, key=lambda item: item["descricao"])
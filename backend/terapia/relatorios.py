@@ -0,0 +1,102 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import AtividadeSessao, ResumoDiarioAtividade
+
+
+def atividades_do_paciente(paciente, data_inicio=None, data_fim=None):
+    """Registros de AtividadeSessao do paciente, filtrados pelo período (se informado)."""
+    atividades = AtividadeSessao.objects.filter(sessao__paciente=paciente)
+    if data_inicio and data_fim:
+        atividades = atividades.filter(data_registro__date__range=[data_inicio, data_fim])
+    return atividades
+
+
+def _contagem_da_sessao(**filtros):
+    contagem = (
+        AtividadeSessao.objects.filter(sessao=OuterRef("pk"), **filtros)
+        .order_by()
+        .values("sessao")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    return Coalesce(Subquery(contagem, output_field=IntegerField()), Value(0))
+
+
+def com_contagens(sessoes):
+    """
+    Anota em cada sessão `positivas`, `negativas` e `total_atividades`.
+    São subconsultas correlacionadas (índice por sessão): só as sessões
+    realmente retornadas, por exemplo as de uma página, são contadas.
+    """
+    return sessoes.annotate(
+        total_atividades=_contagem_da_sessao(),
+        positivas=_contagem_da_sessao(resposta="positiva"),
+        negativas=_contagem_da_sessao(resposta="negativa"),
+    )
+
+
+def resumo_do_paciente(paciente, data_inicio=None, data_fim=None):
+    """Linhas do resumo diário do paciente, filtradas pelo período (se informado)."""
+    resumo = ResumoDiarioAtividade.objects.filter(paciente=paciente)
+    if data_inicio and data_fim:
+        resumo = resumo.filter(dia__range=[data_inicio, data_fim])
+    return resumo
+
+
+def _linhas_por_atividade(resumo):
+    return (
+        resumo.values("atividade_modelo__descricao")
+        .annotate(total_positivas=Sum("positivas"), total_negativas=Sum("negativas"))
+        .order_by("atividade_modelo__descricao")
+    )
+
+
+def _linhas_por_dia(resumo):
+    return (
+        resumo.values("dia")
+        .annotate(total_positivas=Sum("positivas"), total_negativas=Sum("negativas"))
+        .order_by("dia")
+    )
+
+
+def resumo_por_atividade(resumo):
+    """
+    Contagem de respostas positivas/negativas por atividade, somando o resumo
+    diário em uma única consulta. Retorna (labels, positivas, negativas).
+    """
+    return _pivotar(_linhas_por_atividade(resumo), "atividade_modelo__descricao")
+
+
+def resumo_por_dia(resumo):
+    """
+    Contagem de respostas positivas/negativas por dia, em ordem cronológica.
+    Retorna (labels "dd/mm/aaaa", positivas, negativas).
+    """
+    return _formatar_dias(*_pivotar(_linhas_por_dia(resumo), "dia"))
+
+
+async def aresumo_por_atividade(resumo):
+    """Versão async de resumo_por_atividade (views ASGI)."""
+    linhas = [linha async for linha in _linhas_por_atividade(resumo)]
+    return _pivotar(linhas, "atividade_modelo__descricao")
+
+
+async def aresumo_por_dia(resumo):
+    """Versão async de resumo_por_dia (views ASGI)."""
+    linhas = [linha async for linha in _linhas_por_dia(resumo)]
+    return _formatar_dias(*_pivotar(linhas, "dia"))
+
+
+def _formatar_dias(labels, positivas, negativas):
+    return [dia.strftime("%d/%m/%Y") for dia in labels], positivas, negativas
+
+
+def _pivotar(linhas, chave):
+    """Transforma as linhas agregadas em três listas paralelas, em uma única passada."""
+    labels, positivas, negativas = [], [], []
+    for linha in linhas:
+        labels.append(linha[chave])
+        positivas.append(linha["total_positivas"])
+        negativas.append(linha["total_negativas"])
+    return labels, positivas, negativas
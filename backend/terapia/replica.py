@@ -0,0 +1,130 @@
+"""
+Leitura em réplica para views somente leitura (relatórios, exportações e
+listagens da API).
+
+O roteador só manda leituras para a réplica dentro de `usar_replica` (via o
+decorator `ler_da_replica` ou `ListaNaReplicaMixin`); o resto continua no
+banco principal. Depois de uma escrita o usuário fica "fixado" no principal
+por REPLICA_FIXAR_SEGUNDOS (cookie e marca no cache por id de usuário,
+gravados por FixarPrimarioMiddleware; a marca cobre clientes Bearer sem
+cookies), para sempre ver o que acabou de gravar mesmo com atraso de
+replicação. Com vários processos a marca pede um cache compartilhado.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+ALIAS = "replica"
+COOKIE_FIXAR = "fixar_primario"
+APPS_REPLICADOS = {"terapia"}  # sessão e usuário sempre do principal
+METODOS_SEGUROS = {"GET", "HEAD", "OPTIONS"}
+
+_alias_leitura = ContextVar("alias_leitura", default=None)
+
+
+def replica_configurada():
+    return ALIAS in connections
+
+
+def segundos_fixado():
+    return getattr(settings, "REPLICA_FIXAR_SEGUNDOS", 5)
+
+
+def _chave_fixar(usuario_id):
+    return f"replica:fixar:{usuario_id}"
+
+
+def fixar_usuario(usuario):
+    """Marca o usuário para ler do principal pelos próximos segundos (ver segundos_fixado)."""
+    if usuario is not None and usuario.is_authenticated:
+        cache.set(_chave_fixar(usuario.pk), 1, segundos_fixado())
+
+
+def pode_usar_replica(request, usuario=None):
+    """
+    GET de quem não escreveu nada nos últimos segundos (COOKIE_FIXAR ou a
+    marca do usuário no cache). `usuario`: o já autenticado, se request.user
+    não puder ser lido (views async).
+    """
+    if not (
+        replica_configurada()
+        and request.method in METODOS_SEGUROS
+        and COOKIE_FIXAR not in request.COOKIES
+    ):
+        return False
+    usuario = usuario or getattr(request, "user", None)
+    return not (usuario is not None and usuario.is_authenticated and cache.get(_chave_fixar(usuario.pk)))
+
+
+@contextmanager
+def usar_replica(request, usuario=None):
+    """Durante o bloco, leituras dos modelos replicados vão para a réplica (se permitido)."""
+    token = _alias_leitura.set(ALIAS if pode_usar_replica(request, usuario) else None)
+    try:
+        yield
+    finally:
+        _alias_leitura.reset(token)
+
+
+def _iterar_na_replica(request, conteudo):
+    # respostas em streaming consultam o banco depois que a view retorna
+    with usar_replica(request):
+        yield from conteudo
+
+
+def ler_da_replica(view):
+    """Decorator para views somente leitura (sync ou async); cobre também respostas em streaming."""
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def envolvida_async(request, *args, **kwargs):
+            # o ContextVar acompanha o sync_to_async que executa as consultas;
+            # request.user (lazy) não pode ser avaliado aqui, auser sim
+            with usar_replica(request, await request.auser()):
+                return await view(request, *args, **kwargs)
+
+        return envolvida_async
+
+    @wraps(view)
+    def envolvida(request, *args, **kwargs):
+        with usar_replica(request):
+            response = view(request, *args, **kwargs)
+        if response.streaming and pode_usar_replica(request):
+            response.streaming_content = _iterar_na_replica(request, response.streaming_content)
+        return response
+
+    return envolvida
+
+
+class ListaNaReplicaMixin:
+    """Para ViewSets do DRF: a ação `list` lê da réplica."""
+
+    def list(self, request, *args, **kwargs):
+        with usar_replica(request):
+            return super().list(request, *args, **kwargs)
+
+
+class RoteadorReplica:
+    """DATABASE_ROUTERS: leitura na réplica só dentro de `usar_replica`."""
+
+    def db_for_read(self, model, **hints):
+        alias = _alias_leitura.get()
+        if alias and model._meta.app_label in APPS_REPLICADOS:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # réplica e principal têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # a réplica recebe o schema pela replicação do próprio banco
+        return db != ALIAS
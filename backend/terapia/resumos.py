@@ -0,0 +1,142 @@
+"""
+Manutenção das tabelas de resumo (ResumoDiarioAtividade e ResumoPaciente).
+
+Cada escrita em AtividadeSessao/Sessao recalcula apenas o "balde" afetado
+(paciente + atividade + dia, ou o paciente), então o custo não cresce com o
+histórico. `reconstruir_resumos` refaz tudo a partir dos registros brutos.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import AtividadeSessao, Sessao, ResumoDiarioAtividade, ResumoPaciente
+
+POSITIVA = Q(resposta="positiva")
+NEGATIVA = Q(resposta="negativa")
+
+
+def dia_do_registro(data_registro):
+    """Dia (no fuso atual) em que o registro é contabilizado, igual ao TruncDate."""
+    return timezone.localdate(data_registro)
+
+
+def atualizar_resumo_diario(paciente_id, atividade_modelo_id, dia):
+    """Recalcula um único balde (paciente, atividade, dia) do resumo diário."""
+    totais = AtividadeSessao.objects.filter(
+        sessao__paciente_id=paciente_id,
+        atividade_modelo_id=atividade_modelo_id,
+        data_registro__date=dia,
+    ).aggregate(
+        positivas=Count("id", filter=POSITIVA),
+        negativas=Count("id", filter=NEGATIVA),
+    )
+    chave = {"paciente_id": paciente_id, "atividade_modelo_id": atividade_modelo_id, "dia": dia}
+
+    # Balde vazio é apagado em vez de zerado (também evita recriar linhas
+    # durante a exclusão em cascata de um paciente ou atividade).
+    if not totais["positivas"] and not totais["negativas"]:
+        ResumoDiarioAtividade.objects.filter(**chave).delete()
+        return
+    ResumoDiarioAtividade.objects.update_or_create(defaults=totais, **chave)
+
+
+def atualizar_resumo_paciente(paciente_id):
+    """Recalcula o total de sessões e a data da última sessão do paciente."""
+    totais = Sessao.objects.filter(paciente_id=paciente_id).aggregate(
+        sessoes_count=Count("id"),
+        ultima_sessao=Max("data_inicio"),
+    )
+    if not totais["sessoes_count"]:
+        ResumoPaciente.objects.filter(paciente_id=paciente_id).delete()
+        return
+    ResumoPaciente.objects.update_or_create(paciente_id=paciente_id, defaults=totais)
+
+
+@transaction.atomic
+def reconstruir_resumos():
+    """Apaga e recria todos os resumos a partir de AtividadeSessao e Sessao."""
+    ResumoDiarioAtividade.objects.all().delete()
+    ResumoPaciente.objects.all().delete()
+
+    diarios = (
+        AtividadeSessao.objects.annotate(dia=TruncDate("data_registro"))
+        .values("sessao__paciente_id", "atividade_modelo_id", "dia")
+        .annotate(
+            positivas=Count("id", filter=POSITIVA),
+            negativas=Count("id", filter=NEGATIVA),
+        )
+        .order_by()
+    )
+    ResumoDiarioAtividade.objects.bulk_create(
+        (
+            ResumoDiarioAtividade(
+                paciente_id=d["sessao__paciente_id"],
+                atividade_modelo_id=d["atividade_modelo_id"],
+                dia=d["dia"],
+                positivas=d["positivas"],
+                negativas=d["negativas"],
+            )
+            for d in diarios.iterator()
+        ),
+        batch_size=1000,
+    )
+
+    pacientes = (
+        Sessao.objects.values("paciente_id")
+        .annotate(sessoes_count=Count("id"), ultima_sessao=Max("data_inicio"))
+        .order_by()
+    )
+    ResumoPaciente.objects.bulk_create(
+        (ResumoPaciente(**p) for p in pacientes.iterator()),
+        batch_size=1000,
+    )
+    return ResumoDiarioAtividade.objects.count(), ResumoPaciente.objects.count()
+
+
+def atualizar_resumos_diarios(paciente_id, dia, atividade_modelo_ids):
+    """
+    Recalcula vários baldes do mesmo paciente e dia com uma agregação e um
+    upsert, para caminhos que usam bulk_create (e portanto não disparam sinais).
+    """
+    totais = (
+        AtividadeSessao.objects.filter(
+            sessao__paciente_id=paciente_id,
+            atividade_modelo_id__in=atividade_modelo_ids,
+            data_registro__date=dia,
+        )
+        .values("atividade_modelo_id")
+        .annotate(
+            positivas=Count("id", filter=POSITIVA),
+            negativas=Count("id", filter=NEGATIVA),
+        )
+        .order_by()
+    )
+    ResumoDiarioAtividade.objects.bulk_create(
+        [
+            ResumoDiarioAtividade(paciente_id=paciente_id, dia=dia, **t)
+            for t in totais
+        ],
+        update_conflicts=True,
+        unique_fields=["paciente", "atividade_modelo", "dia"],
+        update_fields=["positivas", "negativas"],
+    )
+
+
+def recalcular_baldes(baldes):
+    """
+    Recalcula um conjunto de baldes (paciente, atividade, dia), apagando os
+    que ficaram vazios: duas consultas por paciente e dia, em vez de uma
+    agregação por registro (ex.: exclusão de uma sessão inteira).
+    """
+    por_dia = defaultdict(set)
+    for paciente_id, atividade_modelo_id, dia in baldes:
+        por_dia[(paciente_id, dia)].add(atividade_modelo_id)
+    with transaction.atomic():
+        for (paciente_id, dia), atividade_modelo_ids in por_dia.items():
+            ResumoDiarioAtividade.objects.filter(
+                paciente_id=paciente_id, dia=dia, atividade_modelo_id__in=atividade_modelo_ids
+            ).delete()
+            atualizar_resumos_diarios(paciente_id, dia, atividade_modelo_ids)
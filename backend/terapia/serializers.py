@@ -1,26 +1,78 @@
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from . import catalogo
 from .models import Paciente, Sessao, AtividadeModelo, AtividadeSessao
 
-class PacienteSerializer(serializers.ModelSerializer):
+
+class CamposDinamicosMixin:
+    """
+    Permite escolher os campos da resposta com ?fields=id,nome (sparse fieldset).
+    Em leituras os campos saem do serializer (e do select_related); em
+    escritas todos continuam valendo na validação e só a resposta é filtrada.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        campos = request.query_params.get("fields") if request is not None else None
+        self.campos_pedidos = {c.strip() for c in campos.split(",") if c.strip()} if campos else None
+        if self.campos_pedidos and request.method in SAFE_METHODS:
+            for nome in set(self.fields) - self.campos_pedidos:
+                self.fields.pop(nome)
+
+    def to_representation(self, instance):
+        dados = super().to_representation(instance)
+        if self.campos_pedidos:
+            return {nome: valor for nome, valor in dados.items() if nome in self.campos_pedidos}
+        return dados
+
+
+def relacoes_do_serializer(serializer):
+    """
+    Caminhos para select_related a partir das fontes pontuadas do serializer
+    (ex.: source='paciente.nome' -> 'paciente'), evitando N+1 na listagem.
+    """
+    relacoes = set()
+    for campo in serializer.fields.values():
+        if isinstance(campo, serializers.BaseSerializer):
+            relacoes.add(campo.source.replace(".", "__"))
+        elif "." in campo.source:
+            relacoes.add(campo.source.rsplit(".", 1)[0].replace(".", "__"))
+    return sorted(relacoes)
+
+
+class PacienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     terapeuta = serializers.ReadOnlyField(source='terapeuta.username')
     class Meta:
         model = Paciente
         fields = ['id', 'nome', 'data_nascimento', 'terapeuta']
 
-class SessaoSerializer(serializers.ModelSerializer):
+class SessaoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     terapeuta = serializers.ReadOnlyField(source='terapeuta.username')
     paciente_nome = serializers.ReadOnlyField(source='paciente.nome')
     class Meta:
         model = Sessao
         fields = ['id', 'paciente', 'paciente_nome', 'terapeuta', 'data_inicio', 'encerrada']
 
-class AtividadeModeloSerializer(serializers.ModelSerializer):
+class AtividadeModeloSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = AtividadeModelo
         fields = ['id', 'descricao', 'terapeuta']
 
-class AtividadeSessaoSerializer(serializers.ModelSerializer):
-    atividade_nome = serializers.ReadOnlyField(source='atividade_modelo.descricao')
+class AtividadeSessaoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    # do catálogo em cache do terapeuta (sem join com atividade_modelo)
+    atividade_nome = serializers.SerializerMethodField()
     class Meta:
         model = AtividadeSessao
         fields = ['id', 'sessao', 'atividade_modelo', 'atividade_nome', 'detalhes', 'resposta', 'data_registro']
+
+    def get_atividade_nome(self, obj):
+        if "descricoes" not in self.context:
+            request = self.context.get("request")
+            usuario = getattr(request, "user", None)
+            self.context["descricoes"] = (
+                catalogo.catalogo_do_terapeuta(usuario.id).descricoes
+                if usuario is not None and usuario.is_authenticated else {}
+            )
+        descricao = self.context["descricoes"].get(obj.atividade_modelo_id)
+        return descricao if descricao is not None else obj.atividade_modelo.descricao
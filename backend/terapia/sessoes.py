@@ -0,0 +1,258 @@
+"""Operações de escrita em lote sobre as atividades de uma sessão."""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache_relatorios, fragmentos, painel, progresso, resumos
+from .models import AtividadeModelo, AtividadeSessao, Sessao
+
+
+class AtividadesInvalidas(Exception):
+    """Ids de AtividadeModelo que não existem ou não pertencem ao terapeuta."""
+
+    def __init__(self, ids):
+        self.ids = ids
+        super().__init__(f"Atividades inválidas: {', '.join(ids)}")
+
+
+def validar_atividades(terapeuta, ids):
+    """
+    Valida todos os ids em uma única consulta e devolve a lista de ints
+    (sem repetições, na ordem recebida). Levanta AtividadesInvalidas com os
+    ids estranhos ao terapeuta.
+    """
+    pedidos = list(dict.fromkeys(str(i).strip() for i in ids))
+    numericos = {i: int(i) for i in pedidos if i.isdigit()}
+    validos = set(
+        AtividadeModelo.objects.filter(terapeuta=terapeuta, id__in=numericos.values())
+        .values_list("id", flat=True)
+    )
+    invalidos = [i for i in pedidos if numericos.get(i) not in validos]
+    if invalidos:
+        raise AtividadesInvalidas(invalidos)
+    return [numericos[i] for i in pedidos]
+
+
+@transaction.atomic
+def vincular_atividades(sessao, atividade_modelo_ids):
+    """
+    Vincula as atividades à sessão com um único bulk_create, ignorando as que
+    já estão vinculadas. Devolve os AtividadeSessao criados.
+    """
+    ja_vinculadas = set(
+        AtividadeSessao.objects.filter(
+            sessao=sessao, atividade_modelo_id__in=atividade_modelo_ids
+        ).values_list("atividade_modelo_id", flat=True)
+    )
+    novas = AtividadeSessao.objects.bulk_create(
+        [
+            AtividadeSessao(sessao=sessao, atividade_modelo_id=atividade_id)
+            for atividade_id in atividade_modelo_ids
+            if atividade_id not in ja_vinculadas
+        ]
+    )
+    if novas:
+        apos_escrita_em_lote(novas, {sessao.id: sessao.paciente_id}, sessao.terapeuta_id)
+    return novas
+
+
+def apos_escrita_em_lote(atividades, pacientes_por_sessao, terapeuta_id):
+    """
+    bulk_create/bulk_update não disparam sinais: aplica aqui o que os sinais
+    de AtividadeSessao fariam (resumo diário, progresso, relatórios, fragmentos
+    de template e painel).
+    `pacientes_por_sessao` mapeia sessao_id -> paciente_id.
+    """
+    baldes = defaultdict(set)
+    for atividade in atividades:
+        chave = (
+            pacientes_por_sessao[atividade.sessao_id],
+            resumos.dia_do_registro(atividade.data_registro),
+        )
+        baldes[chave].add(atividade.atividade_modelo_id)
+    for (paciente_id, dia), atividade_modelo_ids in baldes.items():
+        resumos.atualizar_resumos_diarios(paciente_id, dia, atividade_modelo_ids)
+        progresso.invalidar_series(paciente_id, atividade_modelo_ids)
+    cache_relatorios.invalidar_relatorios({a.sessao_id for a in atividades})
+    fragmentos.invalidar("registros", {paciente_id for paciente_id, _ in baldes})
+    painel.invalidar(terapeuta_id)
+
+
+# =========================
+# Lote de operações (API offline)
+# =========================
+
+LIMITE_LOTE = 1000
+CAMPOS_EDITAVEIS = ("resposta", "detalhes")
+RESPOSTAS = {valor for valor, _ in AtividadeSessao.RESPOSTAS_CHOICES}
+
+
+@transaction.atomic
+def aplicar_lote(terapeuta, operacoes):
+    """
+    Aplica uma lista de operações sobre AtividadeSessao em uma transação.
+
+    Cada operação é um dict com "op" ("criar" ou "atualizar") e "chave"
+    (chave de idempotência gerada pelo cliente):
+      - criar: sessao, atividade_modelo, resposta?, detalhes?
+      - atualizar: id ou chave do registro, resposta?, detalhes?
+    Reenviar uma criação com a mesma chave não duplica o registro. Como na
+    tela de registro, sessões encerradas não recebem atividades novas, mas os
+    registros delas podem ser atualizados. As chaves são procuradas só entre
+    os registros do terapeuta. Devolve um
+    resultado por operação, na mesma ordem; operações inválidas não impedem
+    as demais.
+    """
+    resultados = [None] * len(operacoes)
+    criar, atualizar = [], []
+    for indice, operacao in enumerate(operacoes):
+        erro = _validar_operacao(operacao)
+        if erro:
+            resultados[indice] = _resultado(indice, operacao, "erro", erro=erro)
+        elif operacao["op"] == "criar":
+            criar.append((indice, operacao))
+        else:
+            atualizar.append((indice, operacao))
+
+    # Uma consulta para cada tipo de referência
+    sessoes, encerradas = {}, set()
+    for sessao_id, paciente_id, encerrada in Sessao.objects.filter(
+        terapeuta=terapeuta, id__in={op["sessao"] for _, op in criar}
+    ).values_list("id", "paciente_id", "encerrada"):
+        sessoes[sessao_id] = paciente_id
+        if encerrada:
+            encerradas.add(sessao_id)
+    modelos = set(
+        AtividadeModelo.objects.filter(
+            terapeuta=terapeuta, id__in={op["atividade_modelo"] for _, op in criar}
+        ).values_list("id", flat=True)
+    )
+    existentes = dict(
+        AtividadeSessao.objects.filter(
+            sessao__terapeuta=terapeuta, chave_idempotencia__in=[op["chave"] for _, op in criar]
+        ).values_list("chave_idempotencia", "id")
+    )
+
+    novas, concorrentes = {}, {}
+    for indice, operacao in criar:
+        chave = operacao["chave"]
+        if chave in existentes:
+            resultados[indice] = _resultado(indice, operacao, "existente", id=existentes[chave])
+        elif operacao["sessao"] not in sessoes:
+            resultados[indice] = _resultado(indice, operacao, "erro", erro="Sessão inválida.")
+        elif operacao["sessao"] in encerradas:
+            resultados[indice] = _resultado(indice, operacao, "erro", erro="Sessão encerrada.")
+        elif operacao["atividade_modelo"] not in modelos:
+            resultados[indice] = _resultado(indice, operacao, "erro", erro="Atividade inválida.")
+        elif chave in novas:
+            resultados[indice] = _resultado(indice, operacao, "erro", erro="Chave repetida no lote.")
+        else:
+            novas[chave] = (indice, AtividadeSessao(
+                sessao_id=operacao["sessao"],
+                atividade_modelo_id=operacao["atividade_modelo"],
+                resposta=operacao.get("resposta", "positiva"),
+                detalhes=operacao.get("detalhes"),
+                chave_idempotencia=chave,
+            ))
+    if novas:
+        concorrentes = _inserir_novas(novas)
+        for chave, (indice, obj) in novas.items():
+            if chave not in concorrentes:
+                resultados[indice] = _resultado(indice, {"chave": chave}, "criado", id=obj.pk)
+            elif concorrentes[chave][1] == terapeuta.pk:
+                # reenvio simultâneo com a mesma chave: a outra requisição criou o registro
+                resultados[indice] = _resultado(indice, {"chave": chave}, "existente", id=concorrentes[chave][0])
+            else:
+                # a chave (única no banco) já é de um registro de outro terapeuta
+                resultados[indice] = _resultado(indice, {"chave": chave}, "erro", erro="Chave já utilizada.")
+
+    alteradas = []
+    if atualizar:
+        alvos = AtividadeSessao.objects.filter(sessao__terapeuta=terapeuta).filter(
+            Q(id__in=[op["id"] for _, op in atualizar if op.get("id")])
+            | Q(chave_idempotencia__in=[op["chave"] for _, op in atualizar if not op.get("id")])
+        ).select_related("sessao")
+        por_id = {a.id: a for a in alvos}
+        por_chave = {a.chave_idempotencia: a for a in por_id.values() if a.chave_idempotencia}
+        agora = timezone.now()
+        for indice, operacao in atualizar:
+            alvo = por_id.get(operacao["id"]) if operacao.get("id") else por_chave.get(operacao["chave"])
+            if alvo is None:
+                resultados[indice] = _resultado(indice, operacao, "erro", erro="Registro não encontrado.")
+                continue
+            for campo in CAMPOS_EDITAVEIS:
+                if campo in operacao:
+                    setattr(alvo, campo, operacao[campo])
+            alvo.atualizado_em = agora  # bulk_update não aplica auto_now
+            alteradas.append(alvo)
+            resultados[indice] = _resultado(indice, operacao, "atualizado", id=alvo.id)
+        AtividadeSessao.objects.bulk_update(
+            {a.id: a for a in alteradas}.values(), [*CAMPOS_EDITAVEIS, "atualizado_em"]
+        )
+        sessoes.update({a.sessao_id: a.sessao.paciente_id for a in alteradas})
+
+    escritas = [obj for chave, (_, obj) in novas.items() if chave not in concorrentes] + alteradas
+    if escritas:
+        apos_escrita_em_lote(escritas, sessoes, terapeuta.pk)
+    return resultados
+
+
+def _inserir_novas(novas):
+    """
+    Insere as atividades de `novas` (chave -> (indice, objeto)) e devolve as
+    chaves que outra requisição gravou depois da consulta de existentes,
+    {chave: (id, terapeuta_id)}. Os objetos inseridos aqui ficam com pk.
+    """
+    ocupadas = {}
+    while True:
+        pendentes = [obj for chave, (_, obj) in novas.items() if chave not in ocupadas]
+        try:
+            with transaction.atomic():
+                AtividadeSessao.objects.bulk_create(pendentes)
+            return ocupadas
+        except IntegrityError:
+            for obj in pendentes:
+                obj.pk = None
+            relidas = {
+                chave: (id, terapeuta_id)
+                for chave, id, terapeuta_id in AtividadeSessao.objects.filter(
+                    chave_idempotencia__in=novas
+                ).values_list("chave_idempotencia", "id", "sessao__terapeuta_id")
+            }
+            if relidas.keys() <= ocupadas.keys():
+                raise  # o conflito não foi de chave
+            ocupadas = relidas
+
+
+def _validar_operacao(operacao):
+    if not isinstance(operacao, dict):
+        return "Operação deve ser um objeto."
+    if operacao.get("op") not in ("criar", "atualizar"):
+        return 'Campo "op" deve ser "criar" ou "atualizar".'
+    chave = operacao.get("chave")
+    if not isinstance(chave, str) or not chave or len(chave) > 64:
+        return 'Campo "chave" obrigatório (texto de até 64 caracteres).'
+    if "resposta" in operacao and operacao["resposta"] not in RESPOSTAS:
+        return f'Resposta inválida. Use: {", ".join(sorted(RESPOSTAS))}.'
+    if "detalhes" in operacao and not isinstance(operacao["detalhes"], (str, type(None))):
+        return 'Campo "detalhes" deve ser texto.'
+    campos_id = ("sessao", "atividade_modelo") if operacao["op"] == "criar" else ("id",)
+    for campo in campos_id:
+        valor = operacao.get(campo)
+        if campo == "id" and valor is None:
+            continue  # atualizar pela chave
+        if not isinstance(valor, int) or isinstance(valor, bool):
+            return f'Campo "{campo}" deve ser um id inteiro.'
+    return None
+
+
+def _resultado(indice, operacao, status, id=None, erro=None):
+    chave = operacao.get("chave") if isinstance(operacao, dict) else None
+    resultado = {"indice": indice, "chave": chave, "status": status}
+    if id is not None:
+        resultado["id"] = id
+    if erro:
+        resultado["erro"] = erro
+    return resultado
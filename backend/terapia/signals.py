@@ -0,0 +1,406 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import busca, cache_relatorios, catalogo, fragmentos, painel, progresso, resumos
+from .models import AtividadeModelo, AtividadeSessao, Exclusao, Paciente, Sessao
+
+
+# =========================
+# Exclusões em cascata
+# =========================
+
+class _ExclusaoEmCurso:
+    """
+    Estado de um delete() compartilhado pelos receivers (mesmo `origin`).
+
+    Todos os pre_delete rodam antes de qualquer post_delete e o Collector
+    apaga os registros antes das sessões, então no post_delete de cada
+    AtividadeSessao já se sabe se a sessão (ou o paciente) vai junto. Assim
+    os dados da sessão são lidos uma vez por sessão, e não por registro, e o
+    trabalho por registro de uma cascata fica para o post_delete da sessão.
+    """
+
+    def __init__(self):
+        self.sessoes = {}  # sessao_id -> (paciente_id, terapeuta_id, data_inicio)
+        self.sessoes_excluidas = set()
+        self.pacientes_excluidos = set()
+        self.modelos_excluidos = set()
+        self.baldes = set()  # resumos diários a recalcular em lote
+        self.exclusoes = []  # tombstones de AtividadeSessao a gravar em lote
+        self._feitos = set()
+
+    def sessao(self, sessao_id):
+        """(paciente_id, terapeuta_id, data_inicio) da sessão, consultado no máximo uma vez."""
+        if sessao_id not in self.sessoes:
+            self.sessoes[sessao_id] = (
+                Sessao.objects.filter(pk=sessao_id)
+                .values_list("paciente_id", "terapeuta_id", "data_inicio")
+                .first()
+            )
+        return self.sessoes[sessao_id]
+
+    def uma_vez(self, *chave):
+        """True na primeira chamada com esta chave (invalidações repetidas viram uma só)."""
+        if chave in self._feitos:
+            return False
+        self._feitos.add(chave)
+        return True
+
+
+def _exclusao(origin):
+    if origin is None:
+        return _ExclusaoEmCurso()
+    estado = getattr(origin, "_exclusao_em_curso", None)
+    if estado is None:
+        estado = _ExclusaoEmCurso()
+        origin._exclusao_em_curso = estado
+    return estado
+
+
+@receiver(pre_delete, sender=Paciente)
+@receiver(pre_delete, sender=Sessao)
+@receiver(pre_delete, sender=AtividadeModelo)
+def marcar_exclusao(sender, instance, origin=None, **kwargs):
+    estado = _exclusao(origin)
+    if sender is Paciente:
+        estado.pacientes_excluidos.add(instance.pk)
+    elif sender is AtividadeModelo:
+        estado.modelos_excluidos.add(instance.pk)
+    else:
+        estado.sessoes_excluidas.add(instance.pk)
+        estado.sessoes[instance.pk] = (instance.paciente_id, instance.terapeuta_id, instance.data_inicio)
+
+
+# =========================
+# Resumos (rollup)
+# =========================
+
+def _chave_resumo(atividade_sessao):
+    return (
+        atividade_sessao.sessao.paciente_id,
+        atividade_sessao.atividade_modelo_id,
+        resumos.dia_do_registro(atividade_sessao.data_registro),
+    )
+
+
+@receiver(pre_save, sender=AtividadeSessao)
+def guardar_chave_anterior(sender, instance, raw=False, **kwargs):
+    """Guarda o balde, a resposta e o ponto da série antigos para recalcular resumo, painel e progresso."""
+    instance._chave_resumo_anterior = None
+    instance._resposta_anterior = None
+    instance._ponto_anterior = None
+    if raw or instance.pk is None:
+        return
+    anterior = (
+        AtividadeSessao.objects.filter(pk=instance.pk)
+        .values_list(
+            "sessao__paciente_id", "atividade_modelo_id", "data_registro", "resposta",
+            "sessao_id", "sessao__data_inicio",
+        )
+        .first()
+    )
+    if anterior:
+        paciente_id, atividade_modelo_id, data_registro, resposta, sessao_id, data_inicio = anterior
+        instance._chave_resumo_anterior = (
+            paciente_id, atividade_modelo_id, resumos.dia_do_registro(data_registro)
+        )
+        instance._resposta_anterior = resposta
+        instance._ponto_anterior = (paciente_id, atividade_modelo_id, sessao_id, data_inicio)
+
+
+@receiver(post_save, sender=AtividadeSessao)
+def atualizar_resumo_atividade(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    chave = _chave_resumo(instance)
+    resumos.atualizar_resumo_diario(*chave)
+    anterior = getattr(instance, "_chave_resumo_anterior", None)
+    if anterior and anterior != chave:
+        resumos.atualizar_resumo_diario(*anterior)
+
+
+@receiver(post_delete, sender=AtividadeSessao)
+def remover_do_resumo_atividade(sender, instance, origin=None, **kwargs):
+    estado = _exclusao(origin)
+    dados = estado.sessao(instance.sessao_id)
+    if dados is None:
+        return
+    paciente_id = dados[0]
+    if paciente_id in estado.pacientes_excluidos or instance.atividade_modelo_id in estado.modelos_excluidos:
+        return  # o balde é apagado na mesma cascata
+    balde = (paciente_id, instance.atividade_modelo_id, resumos.dia_do_registro(instance.data_registro))
+    if instance.sessao_id in estado.sessoes_excluidas:
+        estado.baldes.add(balde)  # recalculado em lote no post_delete da sessão
+    elif estado.uma_vez("resumo", balde):
+        resumos.atualizar_resumo_diario(*balde)
+
+
+@receiver(post_save, sender=Sessao)
+def atualizar_resumo_sessao(sender, instance, raw=False, **kwargs):
+    if not raw:
+        resumos.atualizar_resumo_paciente(instance.paciente_id)
+
+
+@receiver(post_delete, sender=Sessao)
+def remover_do_resumo_sessao(sender, instance, origin=None, **kwargs):
+    estado = _exclusao(origin)
+    if estado.baldes:
+        resumos.recalcular_baldes(estado.baldes)
+        estado.baldes.clear()
+    if instance.paciente_id not in estado.pacientes_excluidos and estado.uma_vez("paciente", instance.paciente_id):
+        resumos.atualizar_resumo_paciente(instance.paciente_id)
+
+
+# =========================
+# Cache do relatório da sessão
+# =========================
+
+@receiver(post_save, sender=AtividadeSessao)
+def invalidar_relatorio_atividade(sender, instance, **kwargs):
+    cache_relatorios.invalidar_relatorios([instance.sessao_id])
+
+
+@receiver(post_delete, sender=AtividadeSessao)
+def remover_do_relatorio(sender, instance, origin=None, **kwargs):
+    estado = _exclusao(origin)
+    if instance.sessao_id not in estado.sessoes_excluidas and estado.uma_vez("relatorio", instance.sessao_id):
+        cache_relatorios.invalidar_relatorios([instance.sessao_id])
+
+
+@receiver(post_save, sender=Sessao)
+def invalidar_relatorio_sessao(sender, instance, **kwargs):
+    cache_relatorios.invalidar_relatorios([instance.pk])
+
+
+@receiver(post_save, sender=Paciente)
+def invalidar_relatorios_paciente(sender, instance, created=False, **kwargs):
+    # o nome do paciente aparece no cabeçalho de todos os relatórios dele
+    if not created:
+        cache_relatorios.invalidar_relatorios(
+            Sessao.objects.filter(paciente=instance).values_list("id", flat=True)
+        )
+
+
+# =========================
+# Tombstones (sincronização)
+# =========================
+
+@receiver(post_delete, sender=Paciente)
+@receiver(post_delete, sender=Sessao)
+@receiver(post_delete, sender=AtividadeModelo)
+def registrar_exclusao(sender, instance, origin=None, **kwargs):
+    estado = _exclusao(origin)
+    if estado.exclusoes:
+        # registros das sessões excluídas nesta cascata
+        Exclusao.objects.bulk_create(estado.exclusoes, batch_size=500)
+        estado.exclusoes.clear()
+    modelo = {Paciente: "paciente", Sessao: "sessao", AtividadeModelo: "atividade_modelo"}[sender]
+    Exclusao.objects.create(modelo=modelo, objeto_id=instance.pk, terapeuta_id=instance.terapeuta_id)
+
+
+@receiver(post_delete, sender=AtividadeSessao)
+def registrar_exclusao_atividade_sessao(sender, instance, origin=None, **kwargs):
+    estado = _exclusao(origin)
+    dados = estado.sessao(instance.sessao_id)
+    if dados is None:
+        return
+    exclusao = Exclusao(modelo="atividade_sessao", objeto_id=instance.pk, terapeuta_id=dados[1])
+    if instance.sessao_id in estado.sessoes_excluidas:
+        estado.exclusoes.append(exclusao)  # gravado em lote no post_delete da sessão
+    else:
+        exclusao.save()
+
+
+# =========================
+# Painel do terapeuta (contadores do dia)
+# =========================
+
+@receiver(post_save, sender=Sessao)
+def contar_sessao(sender, instance, created=False, raw=False, **kwargs):
+    if raw or not created:
+        return
+    painel.alterar_contador(instance.terapeuta_id, instance.data_inicio, "sessoes", 1)
+    painel.invalidar_pacientes(instance.terapeuta_id)
+
+
+@receiver(post_delete, sender=Sessao)
+def descontar_sessao(sender, instance, **kwargs):
+    painel.alterar_contador(instance.terapeuta_id, instance.data_inicio, "sessoes", -1)
+    painel.invalidar_pacientes(instance.terapeuta_id)
+
+
+@receiver(post_save, sender=AtividadeSessao)
+def contar_resposta(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, "_resposta_anterior", None)
+    if not created and anterior == instance.resposta:
+        return
+    terapeuta_id = instance.sessao.terapeuta_id
+    if anterior and not created:
+        painel.alterar_contador(terapeuta_id, instance.data_registro, f"{anterior}s", -1)
+    painel.alterar_contador(terapeuta_id, instance.data_registro, f"{instance.resposta}s", 1)
+
+
+@receiver(post_delete, sender=AtividadeSessao)
+def descontar_resposta(sender, instance, origin=None, **kwargs):
+    if timezone.localdate(instance.data_registro) != timezone.localdate():
+        return
+    dados = _exclusao(origin).sessao(instance.sessao_id)
+    if dados is not None:
+        painel.alterar_contador(dados[1], instance.data_registro, f"{instance.resposta}s", -1)
+
+
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+def invalidar_painel_pacientes(sender, instance, raw=False, **kwargs):
+    if not raw:
+        painel.invalidar_pacientes(instance.terapeuta_id)
+
+
+# =========================
+# Progresso por atividade (séries em cache)
+# =========================
+
+def _respostas(resposta, sinal):
+    """(positivas, negativas) que um registro soma (sinal 1) ou desconta (-1) no ponto da série."""
+    return (sinal, 0) if resposta == "positiva" else (0, sinal)
+
+
+@receiver(post_save, sender=AtividadeSessao)
+def atualizar_progresso_atividade(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    sessao = instance.sessao
+    ponto = (sessao.paciente_id, instance.atividade_modelo_id, sessao.id, sessao.data_inicio)
+    anterior = getattr(instance, "_ponto_anterior", None)
+    if anterior:
+        resposta_anterior = instance._resposta_anterior
+        if anterior[:3] == ponto[:3] and resposta_anterior == instance.resposta:
+            return  # só detalhes mudaram
+        progresso.atualizar_ponto(*anterior, *_respostas(resposta_anterior, -1))
+    progresso.atualizar_ponto(*ponto, *_respostas(instance.resposta, 1))
+
+
+@receiver(post_delete, sender=AtividadeSessao)
+def remover_do_progresso(sender, instance, origin=None, **kwargs):
+    estado = _exclusao(origin)
+    if instance.sessao_id in estado.sessoes_excluidas:
+        return  # invalidar_progresso_sessao descarta o paciente inteiro
+    dados = estado.sessao(instance.sessao_id)
+    if dados is None:
+        return
+    paciente_id, _, data_inicio = dados
+    if instance.atividade_modelo_id in estado.modelos_excluidos:
+        # a série inteira deixa de existir
+        if estado.uma_vez("progresso", paciente_id, instance.atividade_modelo_id):
+            progresso.invalidar_series(paciente_id, [instance.atividade_modelo_id])
+        return
+    progresso.atualizar_ponto(
+        paciente_id, instance.atividade_modelo_id, instance.sessao_id, data_inicio,
+        *_respostas(instance.resposta, -1),
+    )
+
+
+@receiver(post_save, sender=Sessao)
+@receiver(post_delete, sender=Sessao)
+def invalidar_progresso_sessao(sender, instance, created=False, raw=False, **kwargs):
+    # sessão nova ainda não tem registros; edição pode mudar data e ordem da série
+    if not raw and not created:
+        progresso.invalidar_paciente(instance.paciente_id)
+
+
+# =========================
+# Fragmentos de template em cache
+# =========================
+
+@receiver(post_save, sender=Paciente)
+@receiver(post_delete, sender=Paciente)
+def invalidar_fragmentos_paciente(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fragmentos.invalidar("pacientes", [instance.terapeuta_id])
+
+
+@receiver(post_save, sender=Sessao)
+@receiver(post_delete, sender=Sessao)
+def invalidar_fragmentos_sessao(sender, instance, raw=False, **kwargs):
+    # a lista de pacientes mostra contagem e data da última sessão
+    if not raw:
+        fragmentos.invalidar("pacientes", [instance.terapeuta_id])
+        fragmentos.invalidar("registros", [instance.paciente_id])
+
+
+@receiver(post_save, sender=AtividadeModelo)
+@receiver(post_delete, sender=AtividadeModelo)
+def invalidar_fragmentos_atividade_modelo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fragmentos.invalidar("atividades", [instance.terapeuta_id])
+
+
+@receiver(post_save, sender=AtividadeSessao)
+def invalidar_fragmentos_registro(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    pacientes = {instance.sessao.paciente_id}
+    anterior = getattr(instance, "_chave_resumo_anterior", None)
+    if anterior:
+        pacientes.add(anterior[0])
+    fragmentos.invalidar("registros", pacientes)
+
+
+@receiver(post_delete, sender=AtividadeSessao)
+def remover_fragmentos_registro(sender, instance, origin=None, **kwargs):
+    estado = _exclusao(origin)
+    if instance.sessao_id in estado.sessoes_excluidas:
+        return  # invalidar_fragmentos_sessao cobre o paciente
+    dados = estado.sessao(instance.sessao_id)
+    if dados is not None and estado.uma_vez("fragmentos", dados[0]):
+        fragmentos.invalidar("registros", [dados[0]])
+
+
+# =========================
+# Índice de busca
+# =========================
+
+@receiver(post_save, sender=Paciente)
+def indexar_paciente(sender, instance, raw=False, **kwargs):
+    if not raw:
+        busca.indexar("paciente", instance.pk, instance.terapeuta_id, instance.nome)
+
+
+@receiver(post_save, sender=AtividadeModelo)
+def indexar_atividade_modelo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        busca.indexar("atividade_modelo", instance.pk, instance.terapeuta_id, instance.descricao)
+
+
+@receiver(post_delete, sender=Paciente)
+@receiver(post_delete, sender=AtividadeModelo)
+def remover_da_busca(sender, instance, **kwargs):
+    busca.remover("paciente" if sender is Paciente else "atividade_modelo", instance.pk)
+
+
+# =========================
+# Catálogo de atividades modelo
+# =========================
+
+@receiver(post_save, sender=AtividadeModelo)
+@receiver(post_delete, sender=AtividadeModelo)
+def invalidar_catalogo(sender, instance, raw=False, **kwargs):
+    if not raw:
+        catalogo.invalidar(instance.terapeuta_id)
+
+
+# =========================
+# Fim da exclusão (deve ficar por último)
+# =========================
+
+@receiver(post_delete, sender=Paciente)
+@receiver(post_delete, sender=Sessao)
+@receiver(post_delete, sender=AtividadeModelo)
+@receiver(post_delete, sender=AtividadeSessao)
+def encerrar_exclusao(sender, instance, origin=None, **kwargs):
+    # o objeto de origem é o último a ser apagado: descarta o estado guardado nele
+    if origin is instance:
+        origin.__dict__.pop("_exclusao_em_curso", None)
@@ -0,0 +1,161 @@
+"""
+Sincronização incremental para o app móvel.
+
+O cliente envia o token recebido na sincronização anterior e recebe apenas
+as linhas criadas/alteradas (atualizado_em) e os ids excluídos (Exclusao)
+desde então. O token guarda, para cada tabela (e para as exclusões), a
+posição (atualizado_em, id) a partir da qual a próxima chamada deve buscar:
+'<microssegundos desde a época>.<id>' por tabela, separados por '_'. Muitas
+linhas com o mesmo instante (ex.: o preenchimento de atualizado_em na
+migração) são paginadas pelo id, sem repetir o mesmo lote.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AtividadeModelo, AtividadeSessao, Exclusao, Paciente, Sessao
+
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 2000
+# Transações ainda abertas podem gravar atualizado_em um pouco antes do
+# instante da consulta; a margem faz a próxima chamada cobri-las (o cliente
+# recebe algumas linhas repetidas, o que é inofensivo).
+MARGEM = timedelta(seconds=2)
+
+# nome na resposta -> (queryset do terapeuta, campos enviados)
+TABELAS = {
+    "pacientes": (
+        lambda terapeuta: Paciente.objects.filter(terapeuta=terapeuta),
+        ("id", "nome", "data_nascimento"),
+    ),
+    "sessoes": (
+        lambda terapeuta: Sessao.objects.filter(terapeuta=terapeuta),
+        ("id", "paciente_id", "data_inicio", "encerrada"),
+    ),
+    "atividades_modelo": (
+        lambda terapeuta: AtividadeModelo.objects.filter(terapeuta=terapeuta),
+        ("id", "descricao"),
+    ),
+    "atividades_sessao": (
+        lambda terapeuta: AtividadeSessao.objects.filter(sessao__terapeuta=terapeuta),
+        ("id", "sessao_id", "atividade_modelo_id", "resposta", "detalhes", "data_registro"),
+    ),
+}
+
+# Exclusao.modelo -> nome na resposta
+EXCLUSOES = {
+    "paciente": "pacientes",
+    "sessao": "sessoes",
+    "atividade_modelo": "atividades_modelo",
+    "atividade_sessao": "atividades_sessao",
+}
+
+
+class TokenInvalido(ValueError):
+    pass
+
+
+def ler_token(token):
+    """Converte o token em datetime (None = sincronização completa)."""
+    if not token:
+        return None
+    try:
+        micros = int(token)
+    except ValueError:
+        raise TokenInvalido("Token de sincronização inválido.")
+    return datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=micros)
+
+
+def gerar_token(instante):
+    delta = instante - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    return str((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+
+def ler_posicoes(token):
+    """
+    Posições (instante, id) de cada tabela e das exclusões, na ordem de
+    TABELAS; None = sincronização completa.
+    """
+    if not token:
+        return None
+    partes = token.split("_")
+    if len(partes) != len(TABELAS) + 1:
+        raise TokenInvalido("Token de sincronização inválido.")
+    posicoes = []
+    for parte in partes:
+        instante, _, pk = parte.partition(".")
+        try:
+            posicoes.append((ler_token(instante), int(pk)))
+        except ValueError:
+            raise TokenInvalido("Token de sincronização inválido.")
+    return posicoes
+
+
+def gerar_token_posicoes(posicoes):
+    return "_".join(f"{gerar_token(instante)}.{pk}" for instante, pk in posicoes)
+
+
+def _depois_de(linhas, campo, posicao):
+    instante, pk = posicao
+    return linhas.filter(Q(**{f"{campo}__gt": instante}) | Q(**{campo: instante, "id__gt": pk}))
+
+
+def _lote(linhas, campo, posicao, campos, limite, retomar):
+    """
+    Até `limite` linhas (campo, *campos; `campos` começa por "id") depois de
+    `posicao`, em ordem (campo, id), e a posição seguinte: a última linha se
+    o lote foi cortado, senão `retomar`.
+    """
+    if posicao is not None:
+        linhas = _depois_de(linhas, campo, posicao)
+    linhas = list(linhas.order_by(campo, "id").values_list(campo, *campos)[: limite + 1])
+    if len(linhas) > limite:
+        linhas = linhas[:limite]
+        return linhas, (linhas[-1][0], linhas[-1][1]), True
+    if posicao is not None and posicao > retomar:
+        retomar = posicao
+    return linhas, retomar, False
+
+
+def sincronizar(terapeuta, token=None, limite=LIMITE_PADRAO):
+    """
+    Monta o lote de alterações desde `token`. Cada tabela traz no máximo
+    `limite` linhas; se alguma tabela passar disso, `mais` é True e o token
+    devolvido continua cada tabela de onde ela parou.
+    """
+    posicoes = ler_posicoes(token)
+    # tabelas em dia recomeçam um pouco antes de agora (MARGEM), id 0 inclusive
+    retomar = (timezone.now() - MARGEM, 0)
+    resposta = {}
+    proximas = []
+    mais = False
+
+    for indice, (nome, (queryset, campos)) in enumerate(TABELAS.items()):
+        linhas, proxima, cortada = _lote(
+            queryset(terapeuta), "atualizado_em", posicoes and posicoes[indice], campos, limite, retomar
+        )
+        proximas.append(proxima)
+        mais = mais or cortada
+        resposta[nome] = {"campos": list(campos), "linhas": [linha[1:] for linha in linhas]}
+
+    excluidos = {nome: [] for nome in EXCLUSOES.values()}
+    if posicoes is None:
+        # sincronização completa: o cliente não tem nada a excluir
+        proximas.append(retomar)
+    else:
+        exclusoes, proxima, cortada = _lote(
+            Exclusao.objects.filter(terapeuta=terapeuta),
+            "excluido_em", posicoes[-1], ("id", "modelo", "objeto_id"), limite, retomar,
+        )
+        proximas.append(proxima)
+        mais = mais or cortada
+        for _, _, modelo, objeto_id in exclusoes:
+            excluidos[EXCLUSOES[modelo]].append(objeto_id)
+
+    return {
+        "token": gerar_token_posicoes(proximas),
+        "mais": mais,
+        **resposta,
+        "excluidos": excluidos,
+    }
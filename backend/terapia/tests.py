@@ -1,3 +1,1658 @@
-from django.test import TestCase
+import importlib.util
+import json
+import random
+import re
+import shutil
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, time, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.http import HttpResponse
+from django.template.backends.django import Template as DjangoTemplate
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, resolve, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+
+from . import (
+    analise,
+    autenticacao,
+    busca,
+    catalogo,
+    fragmentos,
+    instrumentacao,
+    painel,
+    progresso,
+    relatorios,
+    replica,
+    sessoes,
+    versoes,
+    views_async,
+)
+from .fila_relatorios import enfileirar_relatorio
+from .middleware import InstrumentacaoMiddleware
+from .models import (
+    AtividadeModelo,
+    AtividadeSessao,
+    EntradaBusca,
+    Exclusao,
+    Paciente,
+    RelatorioSessaoJob,
+    ResumoDiarioAtividade,
+    ResumoPaciente,
+    Sessao,
+    TrigramaBusca,
+)
+from .paginacao import TAMANHO_PAGINA_HISTORICO
+
+
+class BaseTerapia(TestCase):
+    """Terapeuta logado com um paciente; o cache é limpo a cada teste (versões, fragmentos)."""
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = User.objects.create_user("terapeuta", password="senha-de-teste-1")
+        self.paciente = Paciente.objects.create(nome="Ana", terapeuta=self.terapeuta)
+        self.client.force_login(self.terapeuta)
+
+    def criar_modelos(self, quantidade, terapeuta=None):
+        return AtividadeModelo.objects.bulk_create(
+            AtividadeModelo(descricao=f"Atividade {n:03}", terapeuta=terapeuta or self.terapeuta)
+            for n in range(quantidade)
+        )
+
+    def criar_sessao(self, modelos, paciente=None, **kwargs):
+        sessao = Sessao.objects.create(
+            paciente=paciente or self.paciente, terapeuta=self.terapeuta, **kwargs
+        )
+        for n, modelo in enumerate(modelos):
+            AtividadeSessao.objects.create(
+                sessao=sessao, atividade_modelo=modelo, resposta="positiva" if n % 2 else "negativa"
+            )
+        return sessao
+
+    def contar_consultas(self, url, **kwargs):
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url, **kwargs)
+        self.assertEqual(resposta.status_code, 200)
+        return len(consultas)
+
+
+# =========================
+# Relatórios
+# =========================
+
+class RelatorioPacienteTests(BaseTerapia):
+    def test_consultas_nao_crescem_com_atividades_e_sessoes(self):
+        url = reverse("relatorio_paciente", args=[self.paciente.id])
+        self.criar_sessao(self.criar_modelos(2))
+        poucas = self.contar_consultas(url)
+
+        modelos = self.criar_modelos(30)
+        for _ in range(5):
+            self.criar_sessao(modelos)
+        self.assertEqual(self.contar_consultas(url), poucas)
+
+    def test_agregacao_em_uma_passada(self):
+        # sessão, usuário, paciente, gráfico por atividade, gráfico por dia,
+        # atividades e séries do progresso, catálogo e histórico
+        self.criar_sessao(self.criar_modelos(10))
+        cache.clear()
+        with self.assertNumQueries(9):
+            resposta = self.client.get(reverse("relatorio_paciente", args=[self.paciente.id]))
+        self.assertEqual(sum(resposta.context["positivas"]) + sum(resposta.context["negativas"]), 10)
+
+    def semear_resumo(self, dias, atividades):
+        modelos = self.criar_modelos(atividades)
+        inicio = timezone.localdate() - timedelta(days=dias)
+        ResumoDiarioAtividade.objects.bulk_create(
+            ResumoDiarioAtividade(
+                paciente=self.paciente, atividade_modelo=modelo, dia=inicio + timedelta(days=n), positivas=2, negativas=1
+            )
+            for n in range(dias)
+            for modelo in modelos
+        )
+
+    def test_agregacao_escala_linearmente_com_o_historico(self):
+        # uma consulta por gráfico e uma passada pelas linhas agregadas em
+        # qualquer tamanho de histórico (sem o antigo next() por rótulo)
+        for dias, atividades in ((5, 3), (200, 30)):
+            ResumoDiarioAtividade.objects.all().delete()
+            self.semear_resumo(dias, atividades)
+            resumo = relatorios.resumo_do_paciente(self.paciente)
+            with self.assertNumQueries(1):
+                labels, positivas, negativas = relatorios.resumo_por_atividade(resumo)
+            self.assertEqual(
+                (len(labels), sum(positivas), sum(negativas)), (atividades, 2 * dias * atividades, dias * atividades)
+            )
+            with self.assertNumQueries(1):
+                labels, positivas, _ = relatorios.resumo_por_dia(resumo)
+            self.assertEqual((len(labels), positivas[-1]), (dias, 2 * atividades))
+
+            linhas = list(relatorios._linhas_por_dia(resumo))
+            lidas = []
+            relatorios._pivotar((lidas.append(linha) or linha for linha in linhas), "dia")
+            self.assertEqual(len(lidas), len(linhas))
+
+
+class CarimbosDeVersaoTests(BaseTerapia):
+    def test_troca_sempre_avanca(self):
+        inicial = versoes.atual("teste:versao")
+        versoes.trocar(["teste:versao"])
+        versoes.trocar(["teste:versao"])
+        self.assertEqual(versoes.atual("teste:versao"), inicial + 2)
+
+    def test_cache_limpo_nao_reaproveita_carimbo(self):
+        versoes.trocar(["teste:versao"] * 3)
+        antigo = versoes.atual("teste:versao")
+        cache.clear()
+        self.assertGreater(versoes.atual("teste:versao"), antigo)
+
+    def test_etag_do_relatorio_muda_com_a_sessao(self):
+        sessao = self.criar_sessao(self.criar_modelos(2))
+        url = reverse("relatorio_sessao", args=[sessao.id])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        for atividade in sessao.atividadesessao_set.all():
+            atividade.save()
+            resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resposta.status_code, 200)
+            etag = resposta["ETag"]
+
+    def test_last_modified_do_relatorio_vem_do_banco(self):
+        sessao = self.criar_sessao(self.criar_modelos(2))
+        url = reverse("relatorio_sessao", args=[sessao.id])
+        modificado = self.client.get(url)["Last-Modified"]
+        ultimo = AtividadeSessao.objects.latest("atualizado_em").atualizado_em
+        self.assertEqual(modificado, http_date(ultimo.timestamp()))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificado).status_code, 304)
+
+        atividade = sessao.atividadesessao_set.first()
+        AtividadeSessao.objects.filter(id=atividade.id).update(atualizado_em=timezone.now() + timedelta(seconds=5))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=modificado).status_code, 200)
+
+    def test_catalogo_ve_atividade_nova_na_hora(self):
+        self.criar_modelos(1)
+        self.assertEqual(len(catalogo.catalogo_do_terapeuta(self.terapeuta.id)), 1)
+        AtividadeModelo.objects.create(descricao="Nova", terapeuta=self.terapeuta)
+        self.assertEqual(len(catalogo.catalogo_do_terapeuta(self.terapeuta.id)), 2)
+
+    def test_fragmento_em_cache_segue_o_carimbo(self):
+        url = reverse("lista_pacientes")
+        self.assertContains(self.client.get(url), "Ana")
+        versao = fragmentos.versao(pacientes=self.terapeuta.id)
+
+        # sem sinais o carimbo não muda: o fragmento continua vindo do cache
+        Paciente.objects.filter(id=self.paciente.id).update(nome="Ana Paula")
+        self.assertNotContains(self.client.get(url), "Ana Paula")
+        self.assertEqual(fragmentos.versao(pacientes=self.terapeuta.id), versao)
+
+        Paciente.objects.create(nome="Bia", terapeuta=self.terapeuta)
+        self.assertNotEqual(fragmentos.versao(pacientes=self.terapeuta.id), versao)
+        resposta = self.client.get(url)
+        self.assertContains(resposta, "Ana Paula")
+        self.assertContains(resposta, "Bia")
+
+    def test_renomear_atividade_invalida_os_dois_niveis_do_catalogo(self):
+        modelo = AtividadeModelo.objects.create(descricao="Contato visual", terapeuta=self.terapeuta)
+        terapeuta_id = self.terapeuta.id
+        url = reverse("iniciar_sessao", args=[self.paciente.id])
+        self.assertContains(self.client.get(url), "Contato visual")
+        catalogo.catalogo_do_terapeuta(terapeuta_id)
+        em_outro_processo = catalogo._locais[terapeuta_id]
+        with self.assertNumQueries(0):
+            catalogo.catalogo_do_terapeuta(terapeuta_id)
+
+        modelo.descricao = "Contato ocular"
+        modelo.save()
+        # outro processo ainda guarda em memória o catálogo montado antes da troca
+        catalogo._locais[terapeuta_id] = em_outro_processo
+        with self.assertNumQueries(1):
+            self.assertEqual(catalogo.catalogo_do_terapeuta(terapeuta_id).descricoes[modelo.id], "Contato ocular")
+        # o nível compartilhado já tem a versão nova: um processo sem cópia local não consulta o banco
+        catalogo._locais.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(catalogo.catalogo_do_terapeuta(terapeuta_id).descricoes[modelo.id], "Contato ocular")
+
+        resposta = self.client.get(url)
+        self.assertContains(resposta, "Contato ocular")
+        self.assertNotContains(resposta, "Contato visual")
+
+
+class HistoricoPaginadoTests(BaseTerapia):
+    def ids_por_pagina(self):
+        url, parametros, paginas = reverse("historico_sessoes", args=[self.paciente.id]), {}, []
+        while True:
+            resposta = self.client.get(url, parametros)
+            paginas.append([sessao.id for sessao in resposta.context["sessoes"]])
+            if not resposta.context["proximo_cursor"]:
+                return paginas
+            parametros = {"cursor": resposta.context["proximo_cursor"]}
+
+    def test_empates_em_data_inicio_nao_repetem_nem_pulam(self):
+        tamanho = TAMANHO_PAGINA_HISTORICO
+        ids = [self.criar_sessao([]).id for _ in range(2 * tamanho + 5)]
+        instante = timezone.now()  # com microssegundos, como o cursor
+        # blocos de datas iguais atravessando as divisas das páginas
+        Sessao.objects.filter(id__in=ids[:tamanho + 5]).update(data_inicio=instante)
+        Sessao.objects.filter(id__in=ids[tamanho + 5:2 * tamanho + 2]).update(
+            data_inicio=instante - timedelta(microseconds=1)
+        )
+        for n, sessao_id in enumerate(ids[2 * tamanho + 2:]):
+            Sessao.objects.filter(id=sessao_id).update(data_inicio=instante - timedelta(days=n + 1))
+
+        paginas = self.ids_por_pagina()
+        self.assertEqual([len(pagina) for pagina in paginas], [tamanho, tamanho, 5])
+        esperado = list(Sessao.objects.order_by("-data_inicio", "-id").values_list("id", flat=True))
+        self.assertEqual([sessao_id for pagina in paginas for sessao_id in pagina], esperado)
+
+
+# =========================
+# Sinais: exclusões em cascata
+# =========================
+
+class ExclusaoEmCascataTests(BaseTerapia):
+    def consultas_ao_excluir(self, objeto):
+        with CaptureQueriesContext(connection) as consultas:
+            objeto.delete()
+        return len(consultas)
+
+    def paciente_com_registros(self, nome, sessoes, atividades):
+        paciente = Paciente.objects.create(nome=nome, terapeuta=self.terapeuta)
+        modelos = self.criar_modelos(atividades)
+        for _ in range(sessoes):
+            self.criar_sessao(modelos, paciente=paciente)
+        return paciente
+
+    def test_excluir_paciente_nao_consulta_por_registro(self):
+        pequeno = self.paciente_com_registros("Pequeno", sessoes=2, atividades=2)
+        grande = self.paciente_com_registros("Grande", sessoes=2, atividades=20)
+        self.assertEqual(self.consultas_ao_excluir(grande), self.consultas_ao_excluir(pequeno))
+        self.assertFalse(ResumoDiarioAtividade.objects.exists())
+        self.assertEqual(Exclusao.objects.filter(modelo="atividade_sessao").count(), 44)
+
+    def test_excluir_sessao_recalcula_resumo_em_lote(self):
+        modelos = self.criar_modelos(20)
+        mantida = self.criar_sessao(modelos[:2])
+        pequena = self.criar_sessao(modelos[:2])
+        grande = self.criar_sessao(modelos)
+        self.assertEqual(self.consultas_ao_excluir(grande), self.consultas_ao_excluir(pequena))
+        resumo = ResumoDiarioAtividade.objects.filter(paciente=self.paciente)
+        self.assertEqual(
+            sorted(resumo.values_list("atividade_modelo_id", "positivas", "negativas")),
+            [(modelos[0].id, 0, 1), (modelos[1].id, 1, 0)],
+        )
+        self.assertEqual(ResumoPaciente.objects.get(paciente=self.paciente).sessoes_count, 1)
+        self.assertEqual(mantida.atividadesessao_set.count(), 2)
+
+    def test_excluir_um_registro(self):
+        modelos = self.criar_modelos(2)
+        sessao = self.criar_sessao(modelos)
+        atividade = sessao.atividadesessao_set.get(atividade_modelo=modelos[0])
+        atividade_id = atividade.id
+        atividade.delete()
+        self.assertEqual(
+            list(ResumoDiarioAtividade.objects.values_list("atividade_modelo_id", flat=True)), [modelos[1].id]
+        )
+        self.assertTrue(Exclusao.objects.filter(modelo="atividade_sessao", objeto_id=atividade_id).exists())
+
+
+
+class CustoDosSinaisTests(BaseTerapia):
+    """Consultas por escrita de AtividadeSessao: um receptor novo não pode encarecer toda gravação sem aparecer aqui."""
+
+    def setUp(self):
+        super().setUp()
+        self.modelos = self.criar_modelos(2)
+        self.sessao = self.criar_sessao(self.modelos)
+
+    def test_salvar(self):
+        atividade = self.sessao.atividadesessao_set.first()
+        # estado anterior (pre_save), UPDATE, contagem do dia e resumo diário
+        # (SAVEPOINT, SELECT, UPDATE, RELEASE); o resto é só cache
+        with self.assertNumQueries(7):
+            atividade.save()
+
+    def test_criar(self):
+        with self.assertNumQueries(6):
+            AtividadeSessao.objects.create(sessao=self.sessao, atividade_modelo=self.modelos[0])
+
+    def test_excluir(self):
+        atividade = self.sessao.atividadesessao_set.first()
+        # DELETE, sessão, contagem do dia, remoção do balde vazio e a
+        # Exclusao da sincronização
+        with self.assertNumQueries(5):
+            atividade.delete()
+
+# =========================
+# Planos de consulta (índices)
+# =========================
+
+# SQLite: "SCAN tabela" sem índice é varredura completa ("SEARCH"/"USING INDEX" são ok).
+SCAN_SQLITE = re.compile(r"\bSCAN (\w+)(?!.*USING (?:COVERING )?INDEX)")
+# PostgreSQL: "Seq Scan on tabela".
+SCAN_POSTGRES = re.compile(r"Seq Scan on (\w+)")
+
+
+class PlanosDeConsultaTests(BaseTerapia):
+    """
+    Roda as views mais acessadas, captura o SQL que elas realmente executam e
+    falha se o EXPLAIN de alguma consulta fizer varredura completa de tabela.
+    """
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest(f"Banco '{connection.vendor}' sem verificação de plano.")
+        outro = User.objects.create_user("outro")
+        Paciente.objects.bulk_create(Paciente(nome=f"Paciente {n}", terapeuta=outro) for n in range(20))
+        modelos = self.criar_modelos(10)
+        self.aberta = self.criar_sessao(modelos)
+        for _ in range(5):
+            self.criar_sessao(modelos, encerrada=True)
+        self.sem_sessao = Paciente.objects.create(nome="Bia", terapeuta=self.terapeuta)
+
+    def urls_quentes(self):
+        paciente = self.paciente.id
+        return [
+            reverse("dashboard"),
+            reverse("lista_pacientes"),
+            reverse("iniciar_sessao", args=[self.sem_sessao.id]),
+            reverse("registrar_atividades_sessao", args=[self.aberta.id]),
+            reverse("relatorio_paciente", args=[paciente]),
+            reverse("relatorio_paciente", args=[paciente]) + "?data_inicio=2024-01-01&data_fim=2030-12-31",
+            reverse("historico_sessoes", args=[paciente]),
+        ]
+
+    def planos(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+            return "\n".join(" ".join(str(coluna) for coluna in linha) for linha in cursor.fetchall())
+
+    def test_views_quentes_sem_varredura_completa(self):
+        padrao = SCAN_SQLITE if connection.vendor == "sqlite" else SCAN_POSTGRES
+        if connection.vendor == "postgresql":
+            # com tabelas pequenas o PostgreSQL prefere Seq Scan mesmo com índice;
+            # o SET é desfeito com a transação do teste
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        falhas = []
+        for url in self.urls_quentes():
+            cache.clear()  # sem fragmentos/séries em cache: todas as consultas da view
+            with CaptureQueriesContext(connection) as consultas:
+                resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200, url)
+            for consulta in consultas.captured_queries:
+                if not consulta["sql"].lstrip().upper().startswith("SELECT"):
+                    continue
+                tabelas = padrao.findall(self.planos(consulta["sql"]))
+                if tabelas:
+                    falhas.append(f"{url}: varredura completa em {', '.join(sorted(set(tabelas)))}\n  {consulta['sql']}")
+        self.assertEqual(falhas, [], "\n".join(falhas))
+
+
+# =========================
+# Progresso por atividade
+# =========================
+
+class MetricasDaSerieTests(TestCase):
+    inicio = timezone.now()
+
+    def test_serie_vazia(self):
+        self.assertEqual(progresso.metricas_da_serie([]), {
+            "sessoes": 0, "respostas": 0, "taxa_geral": None, "taxa_movel": None,
+            "sequencia_atual": 0, "maior_sequencia": 0, "dominada": False, "dominada_em": None,
+            "tendencia": None, "serie": [],
+        })
+
+    def test_um_ponto(self):
+        metricas = progresso.metricas_da_serie([(1, self.inicio, 4, 1)])
+        self.assertEqual(
+            {campo: metricas[campo] for campo in ("sessoes", "respostas", "taxa_geral", "taxa_movel")},
+            {"sessoes": 1, "respostas": 5, "taxa_geral": 0.8, "taxa_movel": 0.8},
+        )
+        self.assertEqual((metricas["sequencia_atual"], metricas["dominada"]), (1, False))
+        self.assertEqual(metricas["serie"], [
+            {"sessao": 1, "data": self.inicio, "positivas": 4, "negativas": 1, "taxa": 0.8, "taxa_movel": 0.8},
+        ])
+        dominada = progresso.metricas_da_serie([(1, self.inicio, 4, 1)], consecutivas=1)
+        self.assertEqual((dominada["dominada"], dominada["dominada_em"]), (True, self.inicio))
+
+    def test_intervalo_entre_sessoes_nao_conta(self):
+        # as métricas são por sessão: semanas sem sessão não quebram a sequência
+        datas = [self.inicio, self.inicio + timedelta(days=1), self.inicio + timedelta(days=30)]
+        serie = [
+            (1, datas[0], 1, 1), (2, datas[1], 4, 1), (3, datas[2], 5, 0),
+            (4, datas[2] + timedelta(days=45), 4, 0),
+        ]
+        metricas = progresso.metricas_da_serie(serie, janela=2)
+        self.assertEqual((metricas["sequencia_atual"], metricas["maior_sequencia"]), (3, 3))
+        self.assertEqual((metricas["dominada"], metricas["dominada_em"]), (True, serie[3][1]))
+        self.assertEqual([ponto["taxa_movel"] for ponto in metricas["serie"]], [0.5, 0.714, 0.9, 1.0])
+        self.assertEqual(metricas["tendencia"], "subindo")  # 1.0 contra 0.714 duas sessões antes
+
+
+class SeriesDeProgressoTests(BaseTerapia):
+    def series(self):
+        series = progresso.series_do_paciente(self.paciente.id)
+        return {atividade: serie for atividade, serie in series.items() if serie}
+
+    def test_sinais_atualizam_a_serie_sem_recalcular(self):
+        modelos = self.criar_modelos(2)
+        primeira = self.criar_sessao(modelos)
+        segunda = self.criar_sessao(modelos[:1])
+        self.series()  # aquece o cache
+        calcular = progresso._calcular_series
+
+        def conferir():
+            # a série em cache deve ser igual à calculada do zero
+            calculadas = calcular(self.paciente.id, {modelo.id for modelo in modelos})
+            self.assertEqual(self.series(), {a: serie for a, serie in calculadas.items() if serie})
+
+        with mock.patch.object(progresso, "_calcular_series", side_effect=AssertionError("recálculo")):
+            novo = AtividadeSessao.objects.create(sessao=segunda, atividade_modelo=modelos[1], resposta="positiva")
+            conferir()
+            self.assertEqual(self.series()[modelos[1].id][-1][2:], (1, 0))
+            novo.resposta = "negativa"
+            novo.save()
+            conferir()
+            novo.sessao = primeira  # o registro muda de ponto
+            novo.save()
+            conferir()
+            self.assertEqual(len(self.series()[modelos[1].id]), 1)
+            primeira.atividadesessao_set.filter(atividade_modelo=modelos[0]).get().delete()
+            conferir()
+            AtividadeSessao.objects.filter(sessao=primeira).delete()
+            conferir()
+            self.assertNotIn(modelos[1].id, self.series())
+
+            terceira = self.criar_sessao([])
+            AtividadeSessao.objects.create(sessao=terceira, atividade_modelo=modelos[0], resposta="positiva")
+            conferir()
+            self.assertEqual(self.series()[modelos[0].id][-1][0], terceira.id)
+
+    def test_novo_registro_atualiza_as_metricas_do_paciente(self):
+        modelo = self.criar_modelos(1)[0]
+        sessoes = [self.criar_sessao([]) for _ in range(3)]
+        for sessao in sessoes:
+            AtividadeSessao.objects.create(sessao=sessao, atividade_modelo=modelo, resposta="positiva")
+        [antes] = progresso.progresso_do_paciente(self.paciente)
+        self.assertEqual((antes["respostas"], antes["dominada"]), (3, True))
+
+        AtividadeSessao.objects.create(sessao=sessoes[-1], atividade_modelo=modelo, resposta="negativa")
+        [depois] = progresso.progresso_do_paciente(self.paciente)
+        self.assertEqual((depois["respostas"], depois["taxa_geral"]), (4, 0.75))
+        self.assertEqual(depois["sequencia_atual"], 0)  # a última sessão caiu para 50%
+
+    def test_escrita_simultanea_na_mesma_serie_descarta_o_paciente(self):
+        modelo = self.criar_modelos(1)[0]
+        sessao = self.criar_sessao([modelo])
+        self.series()
+        versao = progresso._versao(self.paciente.id)
+        cache.add(f"{progresso._chave_serie(self.paciente.id, versao, modelo.id)}:trava", 1)
+        AtividadeSessao.objects.create(sessao=sessao, atividade_modelo=modelo, resposta="positiva")
+        self.assertNotEqual(progresso._versao(self.paciente.id), versao)
+        self.assertEqual(self.series()[modelo.id][0][2:], (1, 1))
+
+
+# =========================
+# Busca (typeahead)
+# =========================
+
+class BuscaTests(BaseTerapia):
+    def setUp(self):
+        super().setUp()
+        self.joao = Paciente.objects.create(nome="João Gonçalves", terapeuta=self.terapeuta)
+        self.maria = Paciente.objects.create(nome="Maria Silva", terapeuta=self.terapeuta)
+        self.modelo = AtividadeModelo.objects.create(descricao="Contato visual", terapeuta=self.terapeuta)
+        outro = User.objects.create_user("outro")
+        Paciente.objects.create(nome="João Alheio", terapeuta=outro)
+
+    def nomes(self, termo, **kwargs):
+        return [r["texto"] for r in busca.buscar(self.terapeuta.id, termo, **kwargs)]
+
+    def trigramas_no_indice(self, tipo, objeto_id):
+        return set(
+            TrigramaBusca.objects.filter(entrada__tipo=tipo, entrada__objeto_id=objeto_id)
+            .values_list("trigrama", flat=True)
+        )
+
+    def test_normalizacao_e_trigramas(self):
+        self.assertEqual(busca.normalizar("  Conceição  ARAÚJO "), "conceicao araujo")
+        self.assertEqual(busca.trigramas("ana"), {" an", "ana", "na "})
+        self.assertEqual(busca.trigramas("ana", prefixo=True), {" an", "ana"})
+
+    def test_sem_acentos_e_maiusculas(self):
+        for termo in ("joao", "JOÃO", "João"):
+            self.assertEqual(self.nomes(termo), ["João Gonçalves"], termo)  # o do outro terapeuta não aparece
+
+    def test_prefixo_e_erro_de_digitacao(self):
+        self.assertEqual(self.nomes("silv"), ["Maria Silva"])  # prefixo de palavra
+        self.assertEqual(self.nomes("m"), ["Maria Silva"])  # uma letra: prefixo do texto
+        self.assertEqual(self.nomes("gonçalvs"), ["João Gonçalves"])
+        self.assertEqual(self.nomes("contto visual"), ["Contato visual"])
+        self.assertEqual(self.nomes("silva", tipos=["atividade_modelo"]), [])
+        self.assertEqual(self.nomes("xyzw"), [])
+
+    def test_prefixo_do_texto_vem_primeiro(self):
+        Paciente.objects.create(nome="Ana Maria", terapeuta=self.terapeuta)
+        self.assertEqual(self.nomes("mari"), ["Maria Silva", "Ana Maria"])
+
+    def test_indice_acompanha_alteracao_e_exclusao(self):
+        self.joao.nome = "João Pereira"
+        self.joao.save()
+        self.assertEqual(self.nomes("gonçalves"), [])
+        self.assertEqual(self.nomes("pereira"), ["João Pereira"])
+        self.assertEqual(
+            self.trigramas_no_indice("paciente", self.joao.id), busca.trigramas(busca.normalizar("João Pereira"))
+        )
+
+        # só acento/maiúscula: mesmos trigramas, rótulo novo
+        self.joao.nome = "joão pereira"
+        self.joao.save()
+        self.assertEqual(self.nomes("pereira"), ["joão pereira"])
+
+        self.modelo.descricao = "Imitação motora"
+        self.modelo.save()
+        self.assertEqual(self.nomes("imitacao"), ["Imitação motora"])
+
+        self.maria.delete()
+        self.modelo.delete()
+        self.assertEqual(self.nomes("silva"), [])
+        self.assertEqual(self.trigramas_no_indice("paciente", self.maria.id), set())
+        self.assertFalse(EntradaBusca.objects.filter(tipo="atividade_modelo", objeto_id=self.modelo.id).exists())
+
+    def test_reconstruir_indice_igual_ao_dos_sinais(self):
+        def indice():
+            return sorted(
+                (
+                    entrada.tipo, entrada.objeto_id, entrada.terapeuta_id, entrada.texto, entrada.rotulo,
+                    frozenset(t.trigrama for t in entrada.trigramas.all()),
+                )
+                for entrada in EntradaBusca.objects.prefetch_related("trigramas")
+            )
+
+        pelos_sinais = indice()
+        self.assertEqual(busca.reconstruir_indice(), 5)
+        self.assertEqual(indice(), pelos_sinais)
+
+    def test_api(self):
+        resposta = self.client.get(reverse("buscar"), {"q": "joao"})
+        self.assertEqual(resposta.json()["resultados"], [
+            {"tipo": "paciente", "id": self.joao.id, "texto": "João Gonçalves", "similaridade": 1.0},
+        ])
+        self.assertEqual(self.client.get(reverse("buscar"), {"q": "a", "tipo": "sala"}).status_code, 400)
+
+
+# =========================
+# Análises de coorte (snapshot colunar)
+# =========================
+
+class AnaliseCoorteTests(BaseTerapia):
+    def setUp(self):
+        super().setUp()
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta)
+        self.caminho = Path(pasta, "atividades.snap")
+        configuracao = self.settings(ANALISE_SNAPSHOT=self.caminho)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.hoje = timezone.localdate()
+        self.ontem = self.hoje - timedelta(days=1)
+        self.modelos = self.criar_modelos(2)
+        self.bia = Paciente.objects.create(nome="Bia", terapeuta=self.terapeuta)
+        self.registrar(self.paciente, self.ontem, [(0, "positiva"), (0, "negativa"), (1, "positiva")])
+        self.registrar(self.bia, self.hoje, [(0, "positiva"), (1, "positiva")])
+        outro = User.objects.create_user("outro")
+        modelo_alheio = AtividadeModelo.objects.create(descricao="Alheia", terapeuta=outro)
+        sessao = Sessao.objects.create(paciente=Paciente.objects.create(nome="X", terapeuta=outro), terapeuta=outro)
+        AtividadeSessao.objects.create(sessao=sessao, atividade_modelo=modelo_alheio, resposta="negativa")
+        self.outro = outro
+
+    def registrar(self, paciente, dia, respostas):
+        sessao = Sessao.objects.create(paciente=paciente, terapeuta=self.terapeuta)
+        momento = timezone.make_aware(datetime.combine(dia, time(12)))
+        for indice, resposta in respostas:
+            registro = AtividadeSessao.objects.create(
+                sessao=sessao, atividade_modelo=self.modelos[indice], resposta=resposta
+            )
+            AtividadeSessao.objects.filter(id=registro.id).update(data_registro=momento)
+
+    def consultar(self, **parametros):
+        return self.client.get(reverse("analise_coorte"), parametros)
+
+    def test_snapshot_ida_e_volta(self):
+        self.assertEqual(analise.gerar_snapshot(), 6)
+        snapshot = analise.Snapshot(self.caminho)
+        registros = AtividadeSessao.objects.order_by("sessao__terapeuta_id", "data_registro", "id")
+        self.assertEqual(snapshot.linhas, 6)
+        self.assertEqual(list(snapshot.colunas["terapeuta"]), [r.sessao.terapeuta_id for r in registros])
+        self.assertEqual(list(snapshot.colunas["paciente"]), [r.sessao.paciente_id for r in registros])
+        self.assertEqual(list(snapshot.colunas["atividade_modelo"]), [r.atividade_modelo_id for r in registros])
+        self.assertEqual(
+            list(snapshot.colunas["dia"]), [timezone.localdate(r.data_registro).toordinal() for r in registros]
+        )
+        self.assertEqual(list(snapshot.colunas["positiva"]), [r.resposta == "positiva" for r in registros])
+        self.assertEqual(
+            [snapshot.descricoes[codigo] for codigo in snapshot.colunas["descricao"]],
+            [r.atividade_modelo.descricao for r in registros],
+        )
+        self.assertFalse(self.caminho.with_suffix(".snap.tmp").exists())
+
+    def test_agrupamentos_do_terapeuta(self):
+        analise.gerar_snapshot()
+        grupos = self.consultar(agrupar="atividade").json()["grupos"]
+        self.assertEqual(grupos, [
+            {"grupo": "Atividade 001", "respostas": 2, "positivas": 2, "taxa_positiva": 1.0, "pacientes": 2},
+            {"grupo": "Atividade 000", "respostas": 3, "positivas": 2, "taxa_positiva": 0.667, "pacientes": 2},
+        ])
+        por_paciente = {g["grupo"]: g["respostas"] for g in self.consultar(agrupar="paciente").json()["grupos"]}
+        self.assertEqual(por_paciente, {self.paciente.id: 3, self.bia.id: 2})
+        por_dia = self.consultar(agrupar="dia").json()["grupos"]
+        self.assertEqual([(g["grupo"], g["respostas"]) for g in por_dia], [
+            (self.ontem.isoformat(), 3), (self.hoje.isoformat(), 2),
+        ])
+        so_hoje = self.consultar(agrupar="paciente", data_inicio=self.hoje.isoformat()).json()["grupos"]
+        self.assertEqual([g["grupo"] for g in so_hoje], [self.bia.id])
+        minimo = self.consultar(agrupar="atividade", minimo=3).json()["grupos"]
+        self.assertEqual([g["grupo"] for g in minimo], ["Atividade 000"])
+        self.assertEqual(self.consultar(agrupar="sala").status_code, 400)
+
+    def test_supervisor_ve_a_clinica(self):
+        analise.gerar_snapshot()
+        User.objects.filter(id=self.terapeuta.id).update(is_staff=True)
+        por_terapeuta = {g["grupo"]: g["respostas"] for g in self.consultar(agrupar="terapeuta").json()["grupos"]}
+        self.assertEqual(por_terapeuta, {self.terapeuta.id: 5, self.outro.id: 1})
+        so_outro = self.consultar(agrupar="terapeuta", terapeuta=self.outro.id).json()["grupos"]
+        self.assertEqual([g["grupo"] for g in so_outro], [self.outro.id])
+
+    def test_snapshot_ausente_ou_invalido(self):
+        self.assertEqual(self.consultar().status_code, 503)
+        for conteudo in (b"", b"outro formato de arquivo"):
+            self.caminho.write_bytes(conteudo)
+            self.assertEqual(self.consultar().status_code, 503)
+
+    def test_snapshot_antigo_ate_ser_regerado(self):
+        analise.gerar_snapshot()
+        primeiro = self.consultar(agrupar="paciente").json()
+        self.registrar(self.bia, self.hoje, [(0, "negativa")])
+        # o snapshot não acompanha o banco...
+        self.assertEqual(self.consultar(agrupar="paciente").json(), primeiro)
+        # ...até ser regerado: o arquivo trocado é reaberto
+        analise.gerar_snapshot()
+        atual = self.consultar(agrupar="paciente").json()
+        self.assertGreaterEqual(atual["gerado_em"], primeiro["gerado_em"])
+        self.assertEqual({g["grupo"]: g["respostas"] for g in atual["grupos"]}, {self.paciente.id: 3, self.bia.id: 3})
+
+
+# =========================
+# Painel do terapeuta
+# =========================
+
+class PainelTests(BaseTerapia):
+    # referência guardada antes do mock.patch de test_contadores_acompanham_criacoes_e_exclusoes
+    contar_no_banco = staticmethod(painel._contar_no_banco)
+
+    def conferir(self, sessoes, positivas, negativas):
+        """Confere o painel da API com os valores esperados e com uma contagem direta no banco."""
+        resumo = self.client.get(reverse("resumo_painel")).json()
+        obtido = {contador: resumo[contador] for contador in painel.CONTADORES}
+        self.assertEqual(obtido, {"sessoes": sessoes, "positivas": positivas, "negativas": negativas})
+        self.assertEqual(obtido, self.contar_no_banco(self.terapeuta.id, timezone.localdate()))
+        return resumo
+
+    def test_contadores_acompanham_criacoes_e_exclusoes(self):
+        modelos = self.criar_modelos(3)
+        self.conferir(0, 0, 0)  # aquece os contadores
+        # daqui em diante o painel só pode vir dos incrementos dos sinais
+        with mock.patch.object(painel, "_contar_no_banco", side_effect=AssertionError("recontagem")):
+            sessao = self.criar_sessao(modelos)
+            self.conferir(1, 1, 2)
+            registro = sessao.atividadesessao_set.filter(resposta="negativa").first()
+            registro.resposta = "positiva"
+            registro.save()
+            self.conferir(1, 2, 1)
+            registro.delete()
+            self.conferir(1, 1, 1)
+
+            outro = Paciente.objects.create(nome="Bia", terapeuta=self.terapeuta)
+            self.criar_sessao(modelos[:2], paciente=outro)
+            self.conferir(2, 2, 2)
+            sessao.delete()
+            self.conferir(1, 1, 1)
+            outro.delete()
+            self.conferir(0, 0, 0)
+
+    def test_pacientes_sem_sessao(self):
+        url = reverse("resumo_painel")
+        self.assertEqual([p["nome"] for p in self.client.get(url).json()["sem_sessao"]["pacientes"]], ["Ana"])
+        self.criar_sessao([])
+        self.assertEqual(self.client.get(url).json()["sem_sessao"], {"total": 0, "pacientes": []})
+        outro = Paciente.objects.create(nome="Bia", terapeuta=self.terapeuta)
+        self.assertEqual([p["nome"] for p in self.client.get(url).json()["sem_sessao"]["pacientes"]], ["Bia"])
+        outro.delete()
+        self.assertEqual(self.client.get(url).json()["sem_sessao"]["total"], 0)
+
+    def test_consultas_nao_crescem_com_o_historico(self):
+        modelos = self.criar_modelos(2)
+        urls = [reverse("resumo_painel"), reverse("dashboard")]
+        # cache frio: sessão, usuário, sessões do dia, respostas do dia, total e lista
+        # de pacientes sem sessão (+ sessões ativas no dashboard)
+        frio = [self.contar_consultas(url) for url in urls]
+        self.assertEqual(frio, [6, 7])
+        for n in range(5):
+            paciente = Paciente.objects.create(nome=f"Paciente {n}", terapeuta=self.terapeuta)
+            self.criar_sessao(modelos, paciente=paciente)
+            self.criar_sessao(modelos, paciente=paciente, encerrada=True)
+        self.assertEqual([self.contar_consultas(url) for url in urls], frio)
+
+        # cache quente: só sessão e usuário
+        self.client.get(urls[0])
+        with self.assertNumQueries(2):
+            self.client.get(urls[0])
+
+
+# =========================
+# Sessões: vínculo de atividades em lote
+# =========================
+
+class VincularAtividadesTests(BaseTerapia):
+    def postar(self, url, ids):
+        cache.clear()
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.post(url, {"atividades": [str(i) for i in ids]})
+        return resposta, len(consultas)
+
+    def iniciar(self, ids):
+        paciente = Paciente.objects.create(nome=f"Paciente {len(ids)}", terapeuta=self.terapeuta)
+        return self.postar(reverse("iniciar_sessao", args=[paciente.id]), ids)
+
+    def test_iniciar_sessao_consultas_independem_do_numero_de_atividades(self):
+        modelos = self.criar_modelos(30)
+        resposta, uma = self.iniciar([modelos[0].id])
+        self.assertEqual(resposta.status_code, 302)
+        resposta, trinta = self.iniciar([m.id for m in modelos])
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(trinta, uma)
+        self.assertEqual(AtividadeSessao.objects.filter(sessao__paciente__nome="Paciente 30").count(), 30)
+
+    def test_registrar_atividades_consultas_independem_do_numero_de_atividades(self):
+        modelos = self.criar_modelos(31)
+        url_uma = reverse("registrar_atividades_sessao", args=[self.criar_sessao([]).id])
+        outra = Paciente.objects.create(nome="Bia", terapeuta=self.terapeuta)
+        sessao = self.criar_sessao([], paciente=outra)
+        url_trinta = reverse("registrar_atividades_sessao", args=[sessao.id])
+        _, uma = self.postar(url_uma, [modelos[0].id])
+        resposta, trinta = self.postar(url_trinta, [m.id for m in modelos[1:]])
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(trinta, uma)
+        self.assertEqual(sessao.atividadesessao_set.count(), 30)
+
+    def test_ids_de_outro_terapeuta_sao_recusados_sem_gravar(self):
+        meus = self.criar_modelos(29)
+        alheio = self.criar_modelos(1, terapeuta=User.objects.create_user("outro"))[0]
+        ids = [m.id for m in meus] + [alheio.id, "abc"]
+        # sessão, usuário, paciente, sessão aberta, catálogo (cache frio) e a
+        # validação: uma consulta para todos os ids
+        with self.assertNumQueries(6):
+            resposta = self.client.post(reverse("iniciar_sessao", args=[self.paciente.id]), {"atividades": ids})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertContains(resposta, str(alheio.id), status_code=400)
+        self.assertFalse(Sessao.objects.exists())
+
+        sessao = self.criar_sessao([])
+        resposta, _ = self.postar(reverse("registrar_atividades_sessao", args=[sessao.id]), ids)
+        self.assertEqual(resposta.status_code, 302)
+        self.assertFalse(AtividadeSessao.objects.exists())
+
+
+# =========================
+# Exportações
+# =========================
+
+class ExportarSessoesTests(BaseTerapia):
+    def baixar(self, url):
+        resposta = self.client.get(url)
+        corpo = b"".join(resposta.streaming_content) if resposta.streaming else resposta.content
+        return resposta, corpo.decode()
+
+    def test_filtros(self):
+        agora = timezone.now()
+        Sessao.objects.create(paciente=self.paciente, terapeuta=self.terapeuta)
+        antiga = Sessao.objects.create(paciente=self.paciente, terapeuta=self.terapeuta)
+        Sessao.objects.filter(pk=antiga.pk).update(data_inicio=agora - timedelta(days=40))
+        ontem = (agora - timedelta(days=1)).date().isoformat()
+        resposta, corpo = self.baixar(f"{reverse('exportar_sessoes')}?data_inicio={ontem}&paciente={self.paciente.id}")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(corpo.strip().splitlines()), 2)  # cabeçalho + a sessão recente
+
+    def test_parametros_invalidos_respondem_400(self):
+        for consulta in ("data_inicio=ontem", "data_fim=2024-13-01", "paciente=abc"):
+            resposta = self.client.get(f"{reverse('exportar_sessoes')}?{consulta}")
+            self.assertEqual(resposta.status_code, 400, consulta)
+
+    def pico_de_memoria(self, quantidade):
+        Sessao.objects.all().delete()
+        Sessao.objects.bulk_create(
+            Sessao(paciente=self.paciente, terapeuta=self.terapeuta) for _ in range(quantidade)
+        )
+        tracemalloc.start()
+        try:
+            resposta = self.client.get(reverse("exportar_sessoes"))
+            linhas = sum(parte.count(b"\n") for parte in resposta.streaming_content)
+            _, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(linhas, quantidade + 1)
+        return pico
+
+    def test_memoria_nao_cresce_com_o_volume(self):
+        # Pico de alocações Python (tracemalloc) com 2 mil e 20 mil sessões, e
+        # não RSS com 1 milhão: o RSS mal se move por alguns MB (alocador,
+        # páginas já reservadas) e semear 1M linhas deixaria a suíte lenta.
+        # O pico é dominado por um lote do iterator (TAMANHO_LOTE), não pelo
+        # total: com 10x mais linhas, uma lista completa também ocuparia ~10x
+        pequeno = self.pico_de_memoria(2_000)
+        grande = self.pico_de_memoria(20_000)
+        self.assertLess(grande, pequeno * 3)
+
+
+class ExportarAtividadesTests(BaseTerapia):
+    def test_parametros_invalidos_respondem_400(self):
+        url = reverse("exportar_atividades")
+        for consulta in ("formato=xml", "formato=csv&data_inicio=bad", "data_fim=31/12/2024", "sessao=1x", "paciente=abc"):
+            self.assertEqual(self.client.get(f"{url}?{consulta}").status_code, 400, consulta)
+
+    def test_escopo_e_formatos(self):
+        modelos = self.criar_modelos(3)
+        sessao = self.criar_sessao(modelos)
+        outro = Paciente.objects.create(nome="Bia", terapeuta=self.terapeuta)
+        self.criar_sessao(modelos[:1], paciente=outro)
+        url = reverse("exportar_atividades")
+        for consulta, esperadas in ((f"sessao={sessao.id}", 3), (f"paciente={outro.id}", 1), ("", 4)):
+            resposta = self.client.get(f"{url}?formato=ndjson&{consulta}")
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual(len(b"".join(resposta.streaming_content).splitlines()), esperadas, consulta)
+        alheio = Paciente.objects.create(nome="X", terapeuta=User.objects.create_user("outro"))
+        self.assertEqual(self.client.get(f"{url}?paciente={alheio.id}").status_code, 404)
+
+
+# =========================
+# Fila de relatórios
+# =========================
+
+class FilaRelatoriosTests(BaseTerapia):
+    def setUp(self):
+        super().setUp()
+        self.sessao = self.criar_sessao(self.criar_modelos(2))
+
+    def encerrar(self):
+        self.client.post(reverse("encerrar_sessao", args=[self.sessao.id]))
+        return RelatorioSessaoJob.objects.filter(sessao=self.sessao).order_by("-criado_em", "-id").first()
+
+    def test_sem_mudanca_reaproveita_o_pedido(self):
+        job = self.encerrar()
+        RelatorioSessaoJob.objects.filter(id=job.id).update(status="concluido")
+        self.assertEqual(self.encerrar().id, job.id)
+        self.assertEqual(enfileirar_relatorio(self.sessao).id, job.id)
+
+    def test_erro_volta_para_a_fila(self):
+        job = self.encerrar()
+        RelatorioSessaoJob.objects.filter(id=job.id).update(status="erro", tentativas=3)
+        job = enfileirar_relatorio(self.sessao)
+        self.assertEqual((job.status, job.tentativas), ("pendente", 0))
+        self.assertEqual(RelatorioSessaoJob.objects.count(), 1)
+
+    def test_sessao_alterada_depois_de_gerado_gera_de_novo(self):
+        for status in ("concluido", "processando"):
+            job = self.encerrar()
+            RelatorioSessaoJob.objects.filter(id=job.id).update(status=status)
+            AtividadeSessao.objects.filter(sessao=self.sessao).first().save()
+            novo = self.encerrar()
+            self.assertNotEqual(novo.id, job.id, status)
+            self.assertEqual(novo.status, "pendente")
+            self.assertEqual(RelatorioSessaoJob.objects.get(id=job.id).status, status)
+
+    def test_pedido_pendente_apenas_acompanha_a_versao(self):
+        job = self.encerrar()
+        AtividadeSessao.objects.filter(sessao=self.sessao).first().save()
+        self.assertEqual(self.encerrar().id, job.id)
+        self.assertEqual(RelatorioSessaoJob.objects.count(), 1)
+
+
+# =========================
+# API: campos dinâmicos (?fields=)
+# =========================
+
+class CamposDinamicosTests(BaseTerapia):
+    def test_escrita_valida_todos_os_campos_e_filtra_a_resposta(self):
+        url = reverse("paciente-list")
+        resposta = self.client.post(
+            f"{url}?fields=id", {"nome": "Caio", "data_nascimento": "2019-05-01"}, content_type="application/json"
+        )
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(set(resposta.json()), {"id"})
+        paciente = Paciente.objects.get(id=resposta.json()["id"])
+        self.assertEqual((paciente.nome, str(paciente.data_nascimento)), ("Caio", "2019-05-01"))
+
+        url = reverse("paciente-detail", args=[paciente.id])
+        resposta = self.client.patch(f"{url}?fields=id", {"nome": "Caio S."}, content_type="application/json")
+        self.assertEqual(resposta.json(), {"id": paciente.id})
+        paciente.refresh_from_db()
+        self.assertEqual(paciente.nome, "Caio S.")
+
+    def test_leitura_devolve_so_os_campos_pedidos(self):
+        self.criar_sessao([])
+        resposta = self.client.get(reverse("sessao-list") + "?fields=id,paciente_nome")
+        self.assertEqual(set(resposta.json()["results"][0]), {"id", "paciente_nome"})
+
+    def test_consultas_por_pagina_nao_crescem(self):
+        modelos = self.criar_modelos(3)
+        self.criar_sessao(modelos)
+        urls = [
+            reverse("sessao-list") + "?fields=id,paciente_nome,terapeuta",
+            reverse("sessao-list"),
+            reverse("atividade_sessao-list") + "?fields=id,atividade_nome",
+            reverse("atividade_sessao-list"),
+        ]
+        poucas = [self.contar_consultas(url) for url in urls]
+        for _ in range(15):
+            self.criar_sessao(modelos, paciente=Paciente.objects.create(nome="Outro", terapeuta=self.terapeuta))
+        self.assertEqual([self.contar_consultas(url) for url in urls], poucas)
+
+
+# =========================
+# API: sincronização incremental
+# =========================
+
+class SincronizacaoTests(BaseTerapia):
+    def sincronizar(self, token="", limite=10):
+        resposta = self.client.get(reverse("sincronizar"), {"token": token, "limite": limite})
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    def percorrer(self, token=""):
+        """Repete a sincronização enquanto houver "mais"; devolve os lotes e o último token."""
+        lotes = []
+        while True:
+            dados = self.sincronizar(token)
+            lotes.append(dados)
+            token = dados["token"]
+            if not dados["mais"]:
+                return lotes, token
+            self.assertLess(len(lotes), 10, "a sincronização não avança")
+
+    def test_linhas_com_o_mesmo_instante_sao_paginadas_pelo_id(self):
+        sessao = self.criar_sessao(self.criar_modelos(30))
+        instante = timezone.now() - timedelta(hours=1)
+        for modelo in (Paciente, Sessao, AtividadeModelo, AtividadeSessao):
+            modelo.objects.update(atualizado_em=instante)
+
+        lotes, _ = self.percorrer()
+        ids = [linha[0] for dados in lotes for linha in dados["atividades_sessao"]["linhas"]]
+        self.assertEqual(len(lotes), 3)
+        self.assertEqual(sorted(ids), sorted(sessao.atividadesessao_set.values_list("id", flat=True)))
+        modelos = [linha[0] for dados in lotes for linha in dados["atividades_modelo"]["linhas"]]
+        self.assertEqual(len(modelos), len(set(modelos)), 30)
+
+    def test_exclusoes_com_o_mesmo_instante_sao_paginadas(self):
+        sessao = self.criar_sessao(self.criar_modelos(25))
+        for modelo in (Paciente, Sessao, AtividadeModelo, AtividadeSessao):
+            modelo.objects.update(atualizado_em=timezone.now() - timedelta(hours=2))
+        _, token = self.percorrer()
+        ids = set(sessao.atividadesessao_set.values_list("id", flat=True))
+        sessao.atividadesessao_set.all().delete()
+        Exclusao.objects.update(excluido_em=timezone.now())
+
+        lotes, _ = self.percorrer(token)
+        excluidos = [i for dados in lotes for i in dados["excluidos"]["atividades_sessao"]]
+        self.assertEqual(len(excluidos), len(ids))
+        self.assertEqual(set(excluidos), ids)
+
+    def test_token_invalido(self):
+        instante = str(int((timezone.now() - timedelta(minutes=1)).timestamp() * 1_000_000))
+        for token in ("abc", instante, f"{instante}.0", "1.2_3", "1.x_1_1_1_1"):
+            self.assertEqual(self.client.get(reverse("sincronizar"), {"token": token}).status_code, 400, token)
+
+
+# =========================
+# API: lote de operações
+# =========================
+
+class LoteDeOperacoesTests(BaseTerapia):
+    def aplicar(self, *operacoes):
+        resposta = self.client.post(
+            reverse("atividade_sessao-lote"), {"operacoes": list(operacoes)}, content_type="application/json"
+        )
+        self.assertEqual(resposta.status_code, 200)
+        return [(r["status"], r.get("id"), r.get("erro")) for r in resposta.json()["resultados"]]
+
+    def test_chave_de_outro_terapeuta_nao_vaza(self):
+        outro = User.objects.create_user("outro")
+        paciente = Paciente.objects.create(nome="X", terapeuta=outro)
+        sessao = Sessao.objects.create(paciente=paciente, terapeuta=outro)
+        alheia = AtividadeSessao.objects.create(
+            sessao=sessao, atividade_modelo=self.criar_modelos(1, terapeuta=outro)[0],
+            resposta="negativa", chave_idempotencia="k1",
+        )
+        minha = self.criar_sessao([])
+        modelo = self.criar_modelos(1)[0]
+        resultados = self.aplicar(
+            {"op": "criar", "chave": "k1", "sessao": minha.id, "atividade_modelo": modelo.id},
+            {"op": "atualizar", "chave": "k1", "resposta": "positiva"},
+        )
+        self.assertEqual(resultados, [
+            ("erro", None, "Chave já utilizada."),
+            ("erro", None, "Registro não encontrado."),
+        ])
+        alheia.refresh_from_db()
+        self.assertEqual((alheia.sessao_id, alheia.resposta), (sessao.id, "negativa"))
+        self.assertFalse(minha.atividadesessao_set.exists())
+
+    def test_sessao_encerrada_nao_recebe_atividades_novas(self):
+        modelos = self.criar_modelos(2)
+        sessao = self.criar_sessao([])
+        criar = {"op": "criar", "chave": "k1", "sessao": sessao.id, "atividade_modelo": modelos[0].id}
+        [(status, registro_id, _)] = self.aplicar(criar)
+        self.assertEqual(status, "criado")
+        Sessao.objects.filter(id=sessao.id).update(encerrada=True)
+
+        resultados = self.aplicar(
+            criar,
+            {"op": "criar", "chave": "k2", "sessao": sessao.id, "atividade_modelo": modelos[1].id},
+            {"op": "atualizar", "chave": "k1", "resposta": "positiva"},
+        )
+        self.assertEqual(resultados, [
+            ("existente", registro_id, None),
+            ("erro", None, "Sessão encerrada."),
+            ("atualizado", registro_id, None),
+        ])
+        self.assertEqual(sessao.atividadesessao_set.count(), 1)
+
+    def test_reenvio_simultaneo_que_perde_a_corrida_e_existente(self):
+        modelos = self.criar_modelos(2)
+        sessao = self.criar_sessao([])
+        inserir_novas = sessoes._inserir_novas
+        vencedora = []
+
+        def outra_requisicao_antes(novas):
+            # simula o outro reenvio gravando "k1" entre a consulta de existentes e o insert
+            vencedora.append(AtividadeSessao.objects.create(
+                sessao=sessao, atividade_modelo=modelos[0], chave_idempotencia="k1"
+            ))
+            return inserir_novas(novas)
+
+        with mock.patch.object(sessoes, "_inserir_novas", side_effect=outra_requisicao_antes):
+            resultados = self.aplicar(
+                {"op": "criar", "chave": "k1", "sessao": sessao.id, "atividade_modelo": modelos[0].id},
+                {"op": "criar", "chave": "k2", "sessao": sessao.id, "atividade_modelo": modelos[1].id},
+            )
+        criada = sessao.atividadesessao_set.get(chave_idempotencia="k2")
+        self.assertEqual(resultados, [
+            ("existente", vencedora[0].id, None),
+            ("criado", criada.id, None),
+        ])
+        self.assertEqual(sessao.atividadesessao_set.count(), 2)
+
+
+# =========================
+# API: tokens de acesso e renovação
+# =========================
+
+class AutenticacaoApiTests(BaseTerapia):
+    def entrar(self, senha="senha-de-teste-1"):
+        return self.client.post(
+            reverse("emitir_token"), {"username": "terapeuta", "password": senha}, content_type="application/json"
+        )
+
+    def renovar(self, renovacao):
+        return self.client.post(reverse("renovar_token"), {"renovacao": renovacao}, content_type="application/json")
+
+    def painel(self, acesso):
+        return self.client.get(reverse("resumo_painel"), HTTP_AUTHORIZATION=f"Bearer {acesso}")
+
+    def test_login_emite_par_e_o_acesso_dispensa_a_sessao(self):
+        self.assertEqual(self.entrar("errada").status_code, 400)
+        par = self.entrar().json()
+        self.assertEqual((par["tipo"], par["expira_em"]), ("Bearer", autenticacao.segundos_acesso()))
+        self.client.logout()
+
+        resposta = self.painel(par["acesso"])
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([p["nome"] for p in resposta.json()["sem_sessao"]["pacientes"]], ["Ana"])
+
+    def test_acesso_expirado_ou_forjado_e_401(self):
+        with mock.patch("django.core.signing.time.time", return_value=timezone.now().timestamp() - 301):
+            expirado = autenticacao.emitir_acesso(self.terapeuta)
+        forjado = autenticacao.emitir_acesso(self.terapeuta) + "x"
+        for acesso, detalhe in ((expirado, "Token de acesso expirado."), (forjado, "Token de acesso inválido.")):
+            resposta = self.painel(acesso)
+            self.assertEqual(resposta.status_code, 401)
+            self.assertEqual(resposta.json()["detail"], detalhe)
+            self.assertEqual(resposta["WWW-Authenticate"], 'Bearer realm="api"')
+
+    def test_bearer_tem_prioridade_sobre_a_sessao(self):
+        # a sessão do setUp continua ativa: o cabeçalho decide quem é o usuário
+        self.assertEqual(self.painel("forjado").status_code, 401)
+        outro = User.objects.create_user("outro")
+        Paciente.objects.create(nome="Bia", terapeuta=outro)
+        resposta = self.painel(autenticacao.emitir_acesso(outro))
+        self.assertEqual([p["nome"] for p in resposta.json()["sem_sessao"]["pacientes"]], ["Bia"])
+
+    def test_renovacao_troca_o_token_e_o_anterior_deixa_de_valer(self):
+        par = self.entrar().json()
+        novo = self.renovar(par["renovacao"])
+        self.assertEqual(novo.status_code, 200)
+        self.assertNotEqual(novo.json()["renovacao"], par["renovacao"])
+        self.assertEqual(self.painel(novo.json()["acesso"]).status_code, 200)
+
+        self.assertEqual(self.renovar(par["renovacao"]).status_code, 401)
+        self.assertEqual(self.renovar(novo.json()["renovacao"]).status_code, 200)
+
+    def test_novo_login_invalida_a_renovacao_anterior(self):
+        anterior = self.entrar().json()["renovacao"]
+        self.entrar()
+        self.assertEqual(self.renovar(anterior).status_code, 401)
+
+    def test_renovacao_vencida_ou_de_usuario_inativo_e_401(self):
+        renovacao = self.entrar().json()["renovacao"]
+        Token.objects.filter(key=renovacao).update(
+            created=timezone.now() - timedelta(seconds=autenticacao.segundos_renovacao() + 1)
+        )
+        self.assertEqual(self.renovar(renovacao).status_code, 401)
+        self.assertFalse(Token.objects.filter(key=renovacao).exists())
+
+        renovacao = self.entrar().json()["renovacao"]
+        User.objects.filter(id=self.terapeuta.id).update(is_active=False)
+        self.assertEqual(self.renovar(renovacao).status_code, 401)
+        for chave in (None, 123, ["x"]):
+            self.assertEqual(self.renovar(chave).status_code, 401, chave)
+
+    def test_corpo_que_nao_e_objeto_e_400(self):
+        for nome in ("emitir_token", "renovar_token"):
+            resposta = self.client.post(reverse(nome), [1], content_type="application/json")
+            self.assertEqual(resposta.status_code, 400, nome)
+
+
+# =========================
+# Concorrência de escrita
+# =========================
+
+class EscritasConcorrentesTests(TransactionTestCase):
+    """
+    Várias threads, cada uma com a própria conexão, gravando ao mesmo tempo
+    em registrar_detalhes_atividade: nenhuma escrita pode falhar com
+    "database is locked" (WAL, timeout e transações IMMEDIATE no SQLite).
+    """
+
+    ESCRITORES = 8
+    REQUISICOES = 10
+
+    def setUp(self):
+        cache.clear()
+        self.terapeuta = User.objects.create_user("terapeuta", password="senha-de-teste-1")
+        paciente = Paciente.objects.create(nome="Ana", terapeuta=self.terapeuta)
+        modelo = AtividadeModelo.objects.create(descricao="Atividade", terapeuta=self.terapeuta)
+        sessao = Sessao.objects.create(paciente=paciente, terapeuta=self.terapeuta)
+        self.ids = [
+            AtividadeSessao.objects.create(sessao=sessao, atividade_modelo=modelo).id for _ in range(5)
+        ]
+
+    def escritor(self, client, semente, largada, resultados):
+        aleatorio = random.Random(semente)
+        largada.wait()
+        try:
+            for n in range(self.REQUISICOES):
+                url = reverse("registrar_detalhes_atividade", args=[aleatorio.choice(self.ids)])
+                dados = {"resposta": aleatorio.choice(["positiva", "negativa"]), "detalhes": f"{semente}-{n}"}
+                try:
+                    resultados.append(client.post(url, dados).status_code)
+                except OperationalError as erro:
+                    resultados.append(str(erro))
+        finally:
+            connection.close()  # conexão própria da thread
+
+    def test_nenhuma_escrita_falha(self):
+        resultados = []
+        largada = threading.Barrier(self.ESCRITORES, timeout=30)
+        threads = []
+        for semente in range(self.ESCRITORES):
+            client = self.client_class()
+            client.force_login(self.terapeuta)
+            threads.append(threading.Thread(target=self.escritor, args=(client, semente, largada, resultados)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(resultados, [302] * self.ESCRITORES * self.REQUISICOES)
+        resumo = ResumoDiarioAtividade.objects.get()
+        self.assertEqual(resumo.positivas + resumo.negativas, len(self.ids))
+
+
+# =========================
+# Réplica de leitura
+# =========================
+
+class ReplicaTests(TestCase):
+    """
+    Dois bancos SQLite locais: o principal do teste e uma "réplica" com
+    dados diferentes, para ver de qual deles cada leitura veio. A réplica só
+    existe durante a classe: o executor dos testes não a conhece, então ela
+    entra em `databases` no setUpClass.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pasta = tempfile.mkdtemp()
+        configuracao = {"ENGINE": "django.db.backends.sqlite3", "NAME": f"{cls.pasta}/replica.sqlite3"}
+        connections.settings[replica.ALIAS] = connections.configure_settings(
+            {"default": connections.settings["default"], replica.ALIAS: configuracao}
+        )[replica.ALIAS]
+        # o roteador não migra a réplica (allow_migrate): o schema é criado aqui
+        with connections[replica.ALIAS].schema_editor() as editor:
+            for modelo in [User, *apps.get_app_config("terapia").get_models()]:
+                editor.create_model(modelo)
+        cls.databases = {"default", replica.ALIAS}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[replica.ALIAS].close()
+        del connections[replica.ALIAS]
+        del connections.settings[replica.ALIAS]
+        shutil.rmtree(cls.pasta)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.terapeuta = User.objects.create_user("terapeuta", password="senha-de-teste-1")
+        Paciente.objects.create(nome="Ana", terapeuta=cls.terapeuta)
+        # na réplica, sem sinais (que gravariam no principal)
+        User.objects.using(replica.ALIAS).bulk_create([User(id=cls.terapeuta.id, username="terapeuta")])
+        [paciente] = Paciente.objects.using(replica.ALIAS).bulk_create(
+            [Paciente(nome="Ana (réplica)", terapeuta_id=cls.terapeuta.id)]
+        )
+        Sessao.objects.using(replica.ALIAS).bulk_create([Sessao(paciente=paciente, terapeuta_id=cls.terapeuta.id)])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.terapeuta)
+
+    def nomes_na_api(self):
+        resposta = self.client.get(reverse("paciente-list"))
+        self.assertEqual(resposta.status_code, 200)
+        return [p["nome"] for p in resposta.json()["results"]]
+
+    def test_roteador(self):
+        fabrica = RequestFactory()
+        self.assertEqual(Paciente.objects.all().db, "default")
+        with replica.usar_replica(fabrica.get("/")):
+            self.assertEqual(Paciente.objects.all().db, replica.ALIAS)
+            self.assertEqual(User.objects.all().db, "default")  # sessão e usuário, sempre do principal
+        with replica.usar_replica(fabrica.post("/")):
+            self.assertEqual(Paciente.objects.all().db, "default")
+        get_fixado = fabrica.get("/")
+        get_fixado.COOKIES[replica.COOKIE_FIXAR] = "1"
+        with replica.usar_replica(get_fixado):
+            self.assertEqual(Paciente.objects.all().db, "default")
+
+    def test_listagem_da_api_le_da_replica(self):
+        self.assertEqual(self.nomes_na_api(), ["Ana (réplica)"])
+
+    def test_exportacao_em_streaming_le_da_replica(self):
+        resposta = self.client.get(reverse("exportar_sessoes"))
+        self.assertIn("Ana (réplica)", b"".join(resposta.streaming_content).decode())
+
+    def test_escrita_fixa_o_usuario_no_principal(self):
+        resposta = self.client.post(reverse("paciente-list"), {"nome": "Bia"}, content_type="application/json")
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.cookies[replica.COOKIE_FIXAR]["max-age"], replica.segundos_fixado())
+        self.assertEqual(self.nomes_na_api(), ["Ana", "Bia"])
+
+        # cookie e marca do usuário expirados
+        self.client.cookies.pop(replica.COOKIE_FIXAR)
+        cache.delete(f"replica:fixar:{self.terapeuta.id}")
+        self.assertEqual(self.nomes_na_api(), ["Ana (réplica)"])
+
+    def test_escrita_com_bearer_fixa_o_usuario_sem_cookies(self):
+        self.client.logout()
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {autenticacao.emitir_acesso(self.terapeuta)}"
+        resposta = self.client.post(reverse("paciente-list"), {"nome": "Bia"}, content_type="application/json")
+        self.assertEqual(resposta.status_code, 201)
+        self.client.cookies.clear()  # cliente da API não guarda cookies
+        self.assertEqual(self.nomes_na_api(), ["Ana", "Bia"])
+
+        cache.delete(f"replica:fixar:{self.terapeuta.id}")  # marca expirada
+        self.assertEqual(self.nomes_na_api(), ["Ana (réplica)"])
+
+
+# =========================
+# Tela de registro: SSE × polling
+# =========================
+
+class LinhasDaSessaoTests(BaseTerapia):
+    def test_perfil_wsgi_usa_polling(self):
+        sessao = self.criar_sessao(self.criar_modelos(1))
+        resposta = self.client.get(reverse("registrar_atividades_sessao", args=[sessao.id]))
+        self.assertContains(resposta, f'hx-get="{reverse("linhas_sessao", args=[sessao.id])}"')
+        self.assertNotContains(resposta, "data-eventos-url")
+        self.assertNotContains(resposta, "EventSource")
+        with self.assertRaises(NoReverseMatch):
+            reverse("eventos_sessao", args=[sessao.id])
+
+    def test_polling_responde_304_ate_a_sessao_mudar(self):
+        modelos = self.criar_modelos(2)
+        sessao = self.criar_sessao(modelos[:1])
+        url = reverse("linhas_sessao", args=[sessao.id])
+        resposta = self.client.get(url)
+        self.assertContains(resposta, modelos[0].descricao)
+        etag = resposta["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        AtividadeSessao.objects.create(sessao=sessao, atividade_modelo=modelos[1])
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(resposta, modelos[1].descricao)
+
+        sessao.encerrada = True
+        sessao.save()
+        self.assertEqual(self.client.get(url).status_code, 286)
+
+    def test_polling_so_de_sessoes_acompanhaveis(self):
+        outro = User.objects.create_user("outro")
+        paciente = Paciente.objects.create(nome="X", terapeuta=outro)
+        sessao = Sessao.objects.create(paciente=paciente, terapeuta=outro)
+        self.assertEqual(self.client.get(reverse("linhas_sessao", args=[sessao.id])).status_code, 404)
+
+
+# =========================
+# Instrumentação por requisição
+# =========================
+
+def consultas_repetidas():
+    for paciente_id in range(3):
+        list(Paciente.objects.filter(id=paciente_id))
+    Paciente.objects.count()
+
+
+class InstrumentacaoTests(BaseTerapia):
+    def setUp(self):
+        super().setUp()
+        with instrumentacao._lock:
+            instrumentacao._amostras.clear()
+            instrumentacao._totais.clear()
+        self.requisicao = RequestFactory().get("/teste/")
+        self.requisicao.resolver_match = mock.Mock(view_name="teste")
+
+    def conferir_amostra(self, amostra):
+        self.assertEqual((amostra["view"], amostra["status"], amostra["bytes"]), ("teste", 200, 2))
+        self.assertEqual((amostra["consultas"], amostra["duplicadas"]), (4, 2))
+        self.assertIn("terapia_paciente", amostra["padrao_duplicado"])
+        self.assertEqual(instrumentacao.amostras_recentes(), [amostra])
+
+    def test_middleware_sincrono(self):
+        def view(request):
+            consultas_repetidas()
+            return HttpResponse("ok")
+
+        with self.assertLogs("terapia.instrumentacao", "WARNING"):
+            InstrumentacaoMiddleware(view)(self.requisicao)
+        self.conferir_amostra(instrumentacao.amostras_recentes()[-1])
+        self.assertIsNone(instrumentacao.coletor_atual())
+
+    def test_middleware_assincrono(self):
+        async def view(request):
+            await sync_to_async(consultas_repetidas)()
+            return HttpResponse("ok")
+
+        middleware = InstrumentacaoMiddleware(view)
+        with self.assertLogs("terapia.instrumentacao", "WARNING"):
+            async_to_sync(middleware)(self.requisicao)
+        self.conferir_amostra(instrumentacao.amostras_recentes()[-1])
+        # o coletor sai das conexões ao fim da requisição
+        self.assertFalse(any(connections[alias].execute_wrappers for alias in connections))
+
+    def test_requisicao_real_conta_consultas_e_template(self):
+        self.assertTrue(getattr(DjangoTemplate.render, "instrumentado", False))  # instalado no ready()
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse("lista_pacientes"))
+        [amostra] = instrumentacao.amostras_recentes()
+        self.assertEqual((amostra["view"], amostra["metodo"]), ("lista_pacientes", "GET"))
+        self.assertEqual(amostra["consultas"], len(consultas))
+        self.assertEqual(amostra["duplicadas"], 0)
+        self.assertGreater(amostra["tempo_template"], 0)
+
+    def test_metricas_no_formato_prometheus(self):
+        coletor = instrumentacao.ColetorRequisicao()
+        coletor.consultas = 3
+        instrumentacao.registrar('a"b', "GET", 200, 0.5, coletor, 10)
+        instrumentacao.registrar('a"b', "GET", 200, 1.5, coletor, 10)
+
+        resposta = self.client.get(reverse("metricas"))
+        self.assertEqual(resposta["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        linhas = resposta.content.decode().splitlines()
+        amostra = re.compile(r'^[a-z_]+\{view="(?:[^"\\]|\\.)*"(,quantile="[0-9.]+")?\} [0-9.e+-]+$')
+        for linha in linhas:
+            if not linha.startswith("#"):
+                self.assertRegex(linha, amostra)
+        self.assertIn("# TYPE appaba_requisicoes_total counter", linhas)
+        self.assertIn('appaba_requisicoes_total{view="a\\"b"} 2', linhas)
+        self.assertIn('appaba_consultas_sql_total{view="a\\"b"} 6', linhas)
+        self.assertIn("# TYPE appaba_requisicao_segundos summary", linhas)
+        self.assertIn('appaba_requisicao_segundos_sum{view="a\\"b"} 2.0', linhas)
+
+        self.assertEqual(self.client.get(reverse("metricas"), REMOTE_ADDR="10.0.0.1").status_code, 403)
+
+
+# =========================
+# Comandos de gestão
+# =========================
+
+class ComandosDeGestaoTests(TransactionTestCase):
+    """
+    Cada comando roda de ponta a ponta sobre uma base mínima do
+    gerar_dados_benchmark. TransactionTestCase: o perfil WSGI do
+    benchmark_asgi usa threads, cada uma com a própria conexão.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta)
+        self.gerar_dados()
+        self.terapeuta = User.objects.get(username="bench_0")
+
+    def gerar_dados(self):
+        return self.executar(
+            "gerar_dados_benchmark", terapeutas=1, pacientes=2, modelos=3, sessoes=2, atividades=2, dias=5
+        )
+
+    def executar(self, *args, **opcoes):
+        saida = StringIO()
+        call_command(*args, stdout=saida, **opcoes)
+        return saida.getvalue()
+
+    def relatorio(self, nome):
+        return json.loads(Path(self.pasta, nome).read_text(encoding="utf-8"))
+
+    def test_gerar_dados_benchmark(self):
+        self.assertEqual(Paciente.objects.filter(terapeuta=self.terapeuta).count(), 2)
+        self.assertEqual(Sessao.objects.filter(terapeuta=self.terapeuta).count(), 4)
+        self.assertEqual(Sessao.objects.filter(terapeuta=self.terapeuta, encerrada=False).count(), 2)
+        self.assertEqual(AtividadeSessao.objects.filter(sessao__terapeuta=self.terapeuta).count(), 8)
+        self.assertEqual(ResumoPaciente.objects.filter(paciente__terapeuta=self.terapeuta).count(), 2)
+        self.assertEqual(EntradaBusca.objects.count(), 5)  # 2 pacientes + 3 atividades modelo
+
+        # uma nova rodada continua a numeração dos terapeutas
+        self.gerar_dados()
+        self.assertTrue(User.objects.filter(username="bench_1").exists())
+
+    def test_reconstrucoes_e_snapshot(self):
+        self.assertIn("2 pacientes", self.executar("reconstruir_resumos"))
+        self.assertIn("5 entradas", self.executar("reconstruir_busca"))
+        caminho = Path(self.pasta, "analise.bin")
+        self.assertIn("8 linhas", self.executar("gerar_snapshot_analise", saida=str(caminho)))
+        self.assertTrue(caminho.exists())
+
+    def test_benchmark(self):
+        for autenticacao in ("sessao", "token"):
+            saida = Path(self.pasta, f"benchmark_{autenticacao}.json")
+            self.executar("benchmark", repeticoes=1, saida=str(saida), autenticacao=autenticacao)
+            relatorio = self.relatorio(saida.name)
+            self.assertEqual(relatorio["dados"]["atividades_sessao"], 8)
+            self.assertIn("registrar_atividades_sessao_post", relatorio["resultados"])
+            for nome, resultado in relatorio["resultados"].items():
+                self.assertLess(resultado["status"], 400, f"{nome} ({autenticacao})")
+        # o POST medido é desfeito
+        self.assertEqual(AtividadeSessao.objects.filter(sessao__terapeuta=self.terapeuta).count(), 8)
+
+    def test_benchmark_templates(self):
+        self.executar("benchmark_templates", repeticoes=1, saida=str(Path(self.pasta, "templates.json")))
+        resultados = self.relatorio("templates.json")["resultados"]
+        self.assertEqual(set(resultados), {"sem_cache", "loader", "loader_fragmentos"})
+        for perfil in resultados.values():
+            self.assertEqual({medida["status"] for medida in perfil.values()}, {200})
+        # o paciente temporário do seletor de atividades é removido
+        self.assertEqual(Paciente.objects.filter(terapeuta=self.terapeuta).count(), 2)
+
+    def test_benchmark_asgi_por_perfil(self):
+        # o modo sem --perfil só dispara um processo filho por perfil contra o banco real
+        for perfil in ("wsgi", "asgi"):
+            saida = self.executar("benchmark_asgi", perfil=perfil, concorrencia=2, requisicoes=4)
+            resultados = json.loads(saida.strip().splitlines()[-1])
+            self.assertIn("historico_sessoes", resultados)
+            for nome, resultado in resultados.items():
+                self.assertEqual((resultado["requisicoes"], resultado["erros"]), (4, 0), f"{nome} ({perfil})")
+
+
+# =========================
+# Perfil ASGI: views async
+# =========================
+
+def urls_do_perfil_asgi():
+    """
+    terapia/urls.py carregado de novo com VIEWS_ASYNC ligado: as rotas das
+    views async são escolhidas na importação, como no asgi.py.
+    """
+    with override_settings(VIEWS_ASYNC=True):
+        spec = importlib.util.spec_from_file_location(
+            "terapia.urls_perfil_asgi", Path(__file__).with_name("urls.py")
+        )
+        urls = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(urls)
+    return urls
+
+
+@override_settings(ROOT_URLCONF=urls_do_perfil_asgi())
+class ViewsAsyncTests(BaseTerapia):
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.terapeuta)
+        self.modelos = self.criar_modelos(3)
+        self.sessao = self.criar_sessao(self.modelos[:1])
+
+    def test_rotas_do_perfil_asgi(self):
+        for nome, args in [
+            ("registrar_atividades_sessao", [self.sessao.id]),
+            ("encerrar_sessao", [self.sessao.id]),
+            ("historico_sessoes", [self.paciente.id]),
+            ("relatorio_paciente", [self.paciente.id]),
+            ("eventos_sessao", [self.sessao.id]),
+        ]:
+            view = resolve(reverse(nome, args=args)).func
+            self.assertTrue(iscoroutinefunction(view), nome)
+            self.assertEqual(view.__name__, getattr(views_async, nome).__name__)
+
+    async def test_registrar_atividades(self):
+        url = reverse("registrar_atividades_sessao", args=[self.sessao.id])
+        resposta = await self.async_client.get(url)
+        self.assertContains(resposta, self.modelos[1].descricao)
+        self.assertContains(resposta, "data-eventos-url")  # SSE em vez de polling
+
+        resposta = await self.async_client.post(url, {"atividades": [self.modelos[1].id, self.modelos[2].id]})
+        self.assertRedirects(resposta, url, fetch_redirect_response=False)
+        self.assertEqual(await AtividadeSessao.objects.filter(sessao=self.sessao).acount(), 3)
+
+        outro = await User.objects.acreate(username="outro")
+        alheio = await AtividadeModelo.objects.acreate(descricao="Alheia", terapeuta=outro)
+        await self.async_client.post(url, {"atividades": [alheio.id]})
+        self.assertEqual(await AtividadeSessao.objects.filter(sessao=self.sessao).acount(), 3)
+
+    async def test_registrar_detalhes(self):
+        atividade = await AtividadeSessao.objects.filter(sessao=self.sessao).aget()
+        url = reverse("registrar_detalhes_atividade", args=[atividade.id])
+        dados = {"resposta": "positiva", "detalhes": "com ajuda"}
+        resposta = await self.async_client.post(url, dados, headers={"HX-Request": "true"})
+        self.assertContains(resposta, f'id="atividade-{atividade.id}"')
+        self.assertContains(resposta, "com ajuda")
+        await atividade.arefresh_from_db()
+        self.assertEqual((atividade.resposta, atividade.detalhes), ("positiva", "com ajuda"))
+
+        resposta = await self.async_client.post(url, {**dados, "detalhes": "sem ajuda"})
+        self.assertRedirects(
+            resposta, reverse("registrar_atividades_sessao", args=[self.sessao.id]), fetch_redirect_response=False
+        )
+
+    async def test_encerrar_sessao_enfileira_o_relatorio(self):
+        url = reverse("encerrar_sessao", args=[self.sessao.id])
+        resposta = await self.async_client.post(url)
+        self.assertContains(resposta, "Sessão encerrada com sucesso.")
+        await self.sessao.arefresh_from_db()
+        self.assertTrue(self.sessao.encerrada)
+        self.assertEqual(await RelatorioSessaoJob.objects.filter(sessao=self.sessao).acount(), 1)
+        resposta = await self.async_client.post(url, headers={"HX-Request": "true"})
+        self.assertContains(resposta, f'id="status-sessao-{self.sessao.id}"')
+        self.assertContains(resposta, reverse("relatorio_sessao", args=[self.sessao.id]))
+        self.assertEqual(await RelatorioSessaoJob.objects.filter(sessao=self.sessao).acount(), 1)
+
+    async def test_eventos_sessao_ate_o_encerramento(self):
+        await Sessao.objects.filter(id=self.sessao.id).aupdate(encerrada=True)
+        resposta = await self.async_client.get(reverse("eventos_sessao", args=[self.sessao.id]), {"desde": 0})
+        self.assertEqual(resposta["Content-Type"], "text/event-stream")
+        corpo = "".join([
+            parte.decode() if isinstance(parte, bytes) else parte async for parte in resposta.streaming_content
+        ])
+        self.assertTrue(corpo.startswith("retry:"))
+        self.assertIn("event: atividade", corpo)
+        self.assertIn(self.modelos[0].descricao, corpo)
+        self.assertTrue(corpo.rstrip().splitlines()[-2].startswith("event: encerrada"))
+
+    async def test_relatorios(self):
+        url = reverse("historico_sessoes", args=[self.paciente.id])
+        resposta = await self.async_client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context["sessoes"]), 1)
+        self.assertEqual((await self.async_client.get(url, {"cursor": "invalido"})).status_code, 400)
+
+        resposta = await self.async_client.get(reverse("relatorio_paciente", args=[self.paciente.id]))
+        self.assertContains(resposta, self.modelos[0].descricao)
+        self.assertEqual([item["descricao"] for item in resposta.context["progresso"]], [self.modelos[0].descricao])
+
+    async def test_so_do_proprio_terapeuta(self):
+        outro = await User.objects.acreate(username="outro")
+        paciente = await Paciente.objects.acreate(nome="X", terapeuta=outro)
+        sessao = await Sessao.objects.acreate(paciente=paciente, terapeuta=outro)
+        for url in [
+            reverse("registrar_atividades_sessao", args=[sessao.id]),
+            reverse("eventos_sessao", args=[sessao.id]),
+            reverse("historico_sessoes", args=[paciente.id]),
+            reverse("relatorio_paciente", args=[paciente.id]),
+        ]:
+            self.assertEqual((await self.async_client.get(url)).status_code, 404, url)
+
+        await self.async_client.alogout()
+        resposta = await self.async_client.get(reverse("registrar_atividades_sessao", args=[self.sessao.id]))
+        self.assertEqual(resposta.status_code, 302)
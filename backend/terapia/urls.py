@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, views_async
+
+# registro de sessão e relatórios: views async no perfil ASGI
+sessao_views = views_async if settings.VIEWS_ASYNC else views
 
 router = DefaultRouter()
 router.register(r'pacientes', views.PacienteViewSet, basename='paciente')
@@ -18,20 +22,23 @@ urlpatterns = [
     path("pacientes/adicionar/", views.adicionar_paciente, name="adicionar_paciente"),
     path("pacientes/<int:paciente_id>/editar/", views.editar_paciente, name="editar_paciente"),
     path("pacientes/<int:paciente_id>/excluir/", views.excluir_paciente, name="excluir_paciente"),
-    path("paciente/<int:paciente_id>/relatorio/", views.relatorio_paciente, name="relatorio_paciente"),
+    path("paciente/<int:paciente_id>/relatorio/", sessao_views.relatorio_paciente, name="relatorio_paciente"),
 
     # Sessões
     path('iniciar_sessao/<int:paciente_id>/', views.iniciar_sessao, name='iniciar_sessao'),
-    path('sessao/<int:sessao_id>/registrar/', views.registrar_atividades_sessao, name='registrar_atividades_sessao'),
-    path('atividade_sessao/<int:atividade_sessao_id>/detalhes/', views.registrar_detalhes_atividade, name='registrar_detalhes_atividade'),
-    path('sessao/<int:sessao_id>/encerrar/', views.encerrar_sessao, name='encerrar_sessao'),
+    path('sessao/<int:sessao_id>/registrar/', sessao_views.registrar_atividades_sessao, name='registrar_atividades_sessao'),
+    path('atividade_sessao/<int:atividade_sessao_id>/detalhes/', sessao_views.registrar_detalhes_atividade, name='registrar_detalhes_atividade'),
+    path('sessao/<int:sessao_id>/encerrar/', sessao_views.encerrar_sessao, name='encerrar_sessao'),
+    path('sessao/<int:sessao_id>/linhas/', views.linhas_sessao, name='linhas_sessao'),
     path('sessao/<int:sessao_id>/relatorio/', views.relatorio_sessao, name='relatorio_sessao'),
-    path('pacientes/<int:paciente_id>/historico/', views.historico_sessoes, name='historico_sessoes'),
+    path('relatorios/fila/<int:job_id>/', views.status_relatorio, name='status_relatorio'),
+    path('pacientes/<int:paciente_id>/historico/', sessao_views.historico_sessoes, name='historico_sessoes'),
     path("sessao/<int:sessao_id>/", views.detalhes_sessao, name="detalhes_sessao"),
 
     # Exportar relatórios
     path("relatorios/sessoes/", views.exportar_sessoes_csv, name="exportar_sessoes"),
     path("relatorios/atividades/", views.exportar_atividades_csv, name="exportar_atividades"),
+    path("sessao/<int:sessao_id>/atividades/exportar/", views.exportar_atividades_csv, name="exportar_atividades_sessao"),
 
     # Editar / Excluir
     path("sessao/<int:sessao_id>/editar/", views.editar_sessao, name="editar_sessao"),
@@ -52,6 +59,22 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
 
+    # Métricas (Prometheus)
+    path('metricas/', views.metricas, name='metricas'),
+
     # API
+    path('api/token/', views.emitir_token, name='emitir_token'),
+    path('api/token/renovar/', views.renovar_token, name='renovar_token'),
+    path('api/sync/', views.sincronizar, name='sincronizar'),
+    path('api/painel/', views.resumo_painel, name='resumo_painel'),
+    path('api/analise/', views.analise_coorte, name='analise_coorte'),
+    path('api/busca/', views.buscar, name='buscar'),
     path('api/', include(router.urls)),
 ]
+
+# SSE só no perfil ASGI: no WSGI cada conexão aberta prenderia uma thread
+# (a tela de registro usa polling em linhas_sessao)
+if settings.VIEWS_ASYNC:
+    urlpatterns.append(
+        path('sessao/<int:sessao_id>/eventos/', views_async.eventos_sessao, name='eventos_sessao')
+    )
@@ -0,0 +1,46 @@
+"""
+Carimbos de versão no cache, usados para invalidar por troca de chave
+(cache_relatorios, fragmentos, catalogo): o conteúdo fica sob uma chave
+que inclui o carimbo, e os sinais só trocam o carimbo.
+
+A troca é um cache.incr, então duas alterações seguidas sempre dão
+carimbos diferentes. O valor inicial vem do relógio (microssegundos): se o
+cache for limpo ou a chave expirar, o carimbo recomeça acima dos valores
+antigos e não coincide com um ETag ou uma cópia local já emitidos.
+
+Com vários processos o cache precisa ser compartilhado (DJANGO_CACHE_DIR):
+num cache local (locmem) a troca feita em um processo não chega aos outros.
+"""
+import time
+
+from django.core.cache import cache
+
+TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _inicial():
+    return time.time_ns() // 1000
+
+
+def atuais(chaves):
+    """Carimbos das chaves ({chave: carimbo}) em uma ida ao cache; os ausentes são criados."""
+    valores = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in valores:
+            cache.add(chave, _inicial(), TIMEOUT)
+            valores[chave] = cache.get(chave) or _inicial()
+    return valores
+
+
+def atual(chave):
+    return atuais([chave])[chave]
+
+
+def trocar(chaves):
+    """Avança o carimbo de cada chave (recomeça pelo relógio se ela não existe)."""
+    for chave in set(chaves):
+        try:
+            cache.incr(chave)
+        except ValueError:
+            if not cache.add(chave, _inicial(), TIMEOUT):
+                cache.incr(chave)
@@ -1,29 +1,48 @@
-import os
-from pathlib import Path
-import csv
+from datetime import date
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template.loader import render_to_string
-from django.utils.text import slugify
-from django.db.models import Count, Max
-from django.db.models.functions import TruncMonth, TruncDate
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from .models import Paciente
 
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
-
-from .forms import PacienteForm, AtividadeSessaoForm, AtividadeModeloForm, SelecionarAtividadeForm, DetalheAtividadeSessaoForm
-from .models import Paciente, Sessao, AtividadeModelo, AtividadeSessao
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+
+from .forms import PacienteForm, AtividadeModeloForm, DetalheAtividadeSessaoForm
+from .models import Paciente, Sessao, AtividadeModelo, AtividadeSessao, RelatorioSessaoJob
+from . import analise, autenticacao, busca, cache_relatorios, catalogo, fragmentos, instrumentacao, painel, progresso, relatorios, sincronizacao
+from .sincronizacao import LIMITE_MAXIMO, LIMITE_PADRAO, TokenInvalido
+from .fila_relatorios import enfileirar_relatorio, url_relatorio
+from .exportacao import FORMATOS, TAMANHO_LOTE, ParametroInvalido, filtrar_periodo, ler_id, linhas_csv
+from .replica import ListaNaReplicaMixin, ler_da_replica
+from .sessoes import LIMITE_LOTE, AtividadesInvalidas, aplicar_lote, validar_atividades, vincular_atividades
 from .serializers import (
     PacienteSerializer,
     SessaoSerializer,
     AtividadeModeloSerializer,
     AtividadeSessaoSerializer,
+    relacoes_do_serializer,
+)
+from .paginacao import (
+    TAMANHO_PAGINA_HISTORICO,
+    CursorInvalido,
+    apos_cursor,
+    fechar_pagina,
+    PacientePaginacao,
+    SessaoPaginacao,
+    AtividadeModeloPaginacao,
+    AtividadeSessaoPaginacao,
 )
 
 # =========================
@@ -33,13 +52,28 @@ from .serializers import (
 
 @login_required
 def dashboard(request):
-    """Mostra sessões ativas do terapeuta."""
+    """Mostra sessões ativas do terapeuta e o resumo do dia."""
     sessoes_ativas = (
         Sessao.objects.filter(terapeuta=request.user, encerrada=False)
         .select_related("paciente")
         .order_by("-data_inicio")
     )
-    return render(request, "terapia/dashboard.html", {"sessoes_ativas": sessoes_ativas})
+    return render(
+        request,
+        "terapia/dashboard.html",
+        {
+            "sessoes_ativas": sessoes_ativas,
+            "resumo": painel.resumo_do_terapeuta(request.user.id, _dias_sem_sessao(request.GET)),
+        },
+    )
+
+
+def _dias_sem_sessao(parametros):
+    try:
+        dias = int(parametros.get("dias", painel.DIAS_SEM_SESSAO_PADRAO))
+    except ValueError:
+        dias = painel.DIAS_SEM_SESSAO_PADRAO
+    return min(max(dias, 1), 365)
 
 
 @login_required
@@ -48,12 +82,17 @@ def lista_pacientes(request):
         Paciente.objects
         .filter(terapeuta=request.user)
         .annotate(
-            sessoes_count=Count("sessao"),
-            ultima_sessao=Max("sessao__data_inicio")
+            sessoes_count=Coalesce(F("resumo__sessoes_count"), 0),
+            ultima_sessao=F("resumo__ultima_sessao"),
         )
         .order_by("nome")
     )
-    return render(request, "terapia/lista_pacientes.html", {"pacientes": pacientes})
+    # com o fragmento em cache, a consulta (lazy) nem chega a rodar
+    return render(
+        request,
+        "terapia/lista_pacientes.html",
+        {"pacientes": pacientes, "versao_fragmento": fragmentos.versao(pacientes=request.user.id)},
+    )
 
 @login_required
 def adicionar_paciente(request):
@@ -156,14 +195,29 @@ def adicionar_atividade_sessao(request, sessao_id):
         })
 
 @login_required
+@ler_da_replica
 def historico_sessoes(request, paciente_id):
+    """
+    Sessões do paciente, mais recentes primeiro, em páginas por keyset
+    (?cursor=) com as contagens de respostas de cada sessão. Com HTMX
+    devolve só as linhas da página seguinte (rolagem infinita).
+    """
     paciente = get_object_or_404(Paciente, id=paciente_id, terapeuta=request.user)
-    sessoes = Sessao.objects.filter(paciente=paciente).order_by("-data_inicio")
-    return render(
-        request,
-        "terapia/historico_sessoes.html",
-        {"paciente": paciente, "sessoes": sessoes},
+    try:
+        sessoes = apos_cursor(
+            relatorios.com_contagens(Sessao.objects.filter(paciente=paciente)),
+            "data_inicio",
+            request.GET.get("cursor"),
+        )
+    except CursorInvalido as erro:
+        return HttpResponseBadRequest(str(erro))
+    sessoes, proximo = fechar_pagina(
+        list(sessoes[:TAMANHO_PAGINA_HISTORICO + 1]), "data_inicio", TAMANHO_PAGINA_HISTORICO
     )
+    context = {"paciente": paciente, "sessoes": sessoes, "proximo_cursor": proximo}
+    if request.headers.get("HX-Request"):
+        return render(request, "terapia/_historico_linhas.html", context)
+    return render(request, "terapia/historico_sessoes.html", context)
 
 
 # -------------------------
@@ -193,9 +247,12 @@ def iniciar_sessao(request, paciente_id):
         messages.warning(request, "Já existe uma sessão ativa para este paciente.")
         return redirect("registrar_atividades_sessao", sessao_id=sessao_ativa.id)
 
-    atividades_modelo = AtividadeModelo.objects.filter(
-        terapeuta=request.user
-    ).order_by("descricao")
+    atividades_modelo = catalogo.catalogo_do_terapeuta(request.user.id).ordenadas
+    contexto_seletor = {
+        "paciente": paciente,
+        "atividades_modelo": atividades_modelo,
+        "versao_fragmento": fragmentos.versao(atividades=request.user.id),
+    }
 
     if request.method == "POST":
         ids = request.POST.getlist("atividades")  # checkboxes name="atividades"
@@ -204,18 +261,24 @@ def iniciar_sessao(request, paciente_id):
             return render(
                 request,
                 "terapia/selecionar_atividades_sessao.html",
-                {"paciente": paciente, "atividades_modelo": atividades_modelo},
+                contexto_seletor,
             )
 
-        # cria a sessão aqui (somente no POST)
-        sessao = Sessao.objects.create(paciente=paciente, terapeuta=request.user, encerrada=False)
-
-        # vincula cada atividade selecionada
-        for atividade_id in ids:
-            atividade_modelo = get_object_or_404(
-                AtividadeModelo, id=atividade_id, terapeuta=request.user
+        try:
+            ids = validar_atividades(request.user, ids)
+        except AtividadesInvalidas as erro:
+            messages.error(request, f"Atividades inválidas ou de outro terapeuta: {', '.join(erro.ids)}.")
+            return render(
+                request,
+                "terapia/selecionar_atividades_sessao.html",
+                contexto_seletor,
+                status=400,
             )
-            AtividadeSessao.objects.create(sessao=sessao, atividade_modelo=atividade_modelo)
+
+        # cria a sessão aqui (somente no POST) e vincula tudo de uma vez
+        with transaction.atomic():
+            sessao = Sessao.objects.create(paciente=paciente, terapeuta=request.user, encerrada=False)
+            vincular_atividades(sessao, ids)
 
         messages.success(request, "Sessão iniciada com atividades selecionadas.")
         return redirect("registrar_atividades_sessao", sessao_id=sessao.id)
@@ -224,7 +287,7 @@ def iniciar_sessao(request, paciente_id):
     return render(
         request,
         "terapia/selecionar_atividades_sessao.html",
-        {"paciente": paciente, "atividades_modelo": atividades_modelo},
+        contexto_seletor,
     )
 
 # DETALHES DA SESSÃO + ATIVIDADES
@@ -250,32 +313,31 @@ def registrar_atividades_sessao(request, sessao_id):
         messages.warning(request, "Sessão já encerrada.")
         return redirect("dashboard")
 
-    # já na sessão
-    atividades_sessao = AtividadeSessao.objects.filter(sessao=sessao).select_related("atividade_modelo").order_by("-data_registro")
-    ids_ja_vinculados = list(atividades_sessao.values_list("atividade_modelo_id", flat=True))
-
-    # disponíveis p/ adicionar (exclui as que já estão)
-    atividades_disponiveis = AtividadeModelo.objects.filter(
-        terapeuta=request.user
-    ).exclude(id__in=ids_ja_vinculados).order_by("descricao")
-
     if request.method == "POST":
         ids = request.POST.getlist("atividades")
         if not ids:
             messages.info(request, "Selecione ao menos uma atividade.")
             return redirect("registrar_atividades_sessao", sessao_id=sessao.id)
 
-        for atividade_id in ids:
-            atividade_modelo = get_object_or_404(
-                AtividadeModelo, id=atividade_id, terapeuta=request.user
-            )
-            AtividadeSessao.objects.get_or_create(
-                sessao=sessao, atividade_modelo=atividade_modelo
-            )
+        try:
+            vincular_atividades(sessao, validar_atividades(request.user, ids))
+        except AtividadesInvalidas as erro:
+            messages.error(request, f"Atividades inválidas ou de outro terapeuta: {', '.join(erro.ids)}.")
+            return redirect("registrar_atividades_sessao", sessao_id=sessao.id)
 
         messages.success(request, "Atividades adicionadas à sessão.")
         return redirect("registrar_atividades_sessao", sessao_id=sessao.id)
 
+    # já na sessão
+    atividades_sessao = list(
+        AtividadeSessao.objects.filter(sessao=sessao).select_related("atividade_modelo").order_by("-data_registro")
+    )
+
+    # disponíveis p/ adicionar (exclui as que já estão), do catálogo em cache
+    atividades_disponiveis = catalogo.catalogo_do_terapeuta(request.user.id).disponiveis(
+        atividade.atividade_modelo_id for atividade in atividades_sessao
+    )
+
     return render(
         request,
         "terapia/registrar_atividade.html",
@@ -289,7 +351,9 @@ def registrar_atividades_sessao(request, sessao_id):
 @login_required
 def registrar_detalhes_atividade(request, atividade_sessao_id):
     atividade_sessao = get_object_or_404(
-        AtividadeSessao, id=atividade_sessao_id, sessao__terapeuta=request.user
+        AtividadeSessao.objects.select_related("atividade_modelo"),
+        id=atividade_sessao_id,
+        sessao__terapeuta=request.user,
     )
 
     if request.method == "POST":
@@ -298,15 +362,13 @@ def registrar_detalhes_atividade(request, atividade_sessao_id):
             form.save()
             messages.success(request, "Detalhes da atividade atualizados.")
             if request.headers.get("HX-Request"):
-                atividades = AtividadeSessao.objects.filter(
-                    sessao=atividade_sessao.sessao
-                ).order_by("-data_registro")
+                # só a linha alterada; as outras telas da sessão recebem pelo SSE
                 return render(
                     request,
-                    "terapia/_lista_atividades.html",
-                    {"atividades": atividades},
+                    "terapia/_atividade_sessao.html",
+                    {"atividade": atividade_sessao},
                 )
-            return redirect("registrar_atividades_sessao", sessao_id=atividade_sessao.sessao.id)
+            return redirect("registrar_atividades_sessao", sessao_id=atividade_sessao.sessao_id)
 
     else:
         form = DetalheAtividadeSessaoForm(instance=atividade_sessao)
@@ -328,43 +390,89 @@ def encerrar_sessao(request, sessao_id):
     else:
         messages.info(request, "Sessão já está encerrada.")
 
+    # O relatório é gerado em segundo plano (comando processar_relatorios)
+    relatorio = enfileirar_relatorio(sessao, gerado_por=request.user)
+
     if request.headers.get("HX-Request"):
         return render(request, "terapia/_status_sessao.html", {"sessao": sessao})
 
-    atividades = AtividadeSessao.objects.filter(sessao=sessao).order_by("-data_registro")
-
-    media_root = getattr(settings, "MEDIA_ROOT", os.path.join(os.getcwd(), "media"))
-    reports_dir = os.path.join(media_root, "reports")
-    Path(reports_dir).mkdir(parents=True, exist_ok=True)
+    return render(
+        request,
+        "terapia/dashboard.html",
+        {
+            "sessao": sessao,
+            "relatorio": relatorio,
+            "report_url": url_relatorio(relatorio),
+            "resumo": painel.resumo_do_terapeuta(request.user.id),
+        },
+    )
 
-    paciente_nome = sessao.paciente.nome if sessao.paciente else "paciente"
-    safe_nome = slugify(f"sessao-{sessao.id}-{paciente_nome}")
-    filename = f"{safe_nome}.html"
-    filepath = os.path.join(reports_dir, filename)
+def sessoes_acompanhaveis(usuario):
+    """Sessões que o usuário pode acompanhar ao vivo: as próprias; supervisores (staff), todas."""
+    sessoes = Sessao.objects.all()
+    return sessoes if usuario.is_staff else sessoes.filter(terapeuta=usuario)
 
-    html_string = render_to_string(
-        "terapia/relatorio_sessao.html",
-        {"sessao": sessao, "atividades": atividades, "gerado_por": request.user},
+@login_required
+@condition(etag_func=lambda request, sessao_id: cache_relatorios.etag_relatorio(sessao_id))
+def linhas_sessao(request, sessao_id):
+    """
+    Linhas da sessão para o polling (HTMX) da tela de registro no perfil WSGI,
+    onde não há SSE: 304 enquanto a sessão não muda; 286 (fim do polling)
+    depois de encerrada.
+    """
+    sessao = get_object_or_404(sessoes_acompanhaveis(request.user), id=sessao_id)
+    atividades_sessao = (
+        AtividadeSessao.objects.filter(sessao=sessao).select_related("atividade_modelo").order_by("-data_registro")
     )
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(html_string)
-
-    media_url = getattr(settings, "MEDIA_URL", "/media/")
-    report_url = os.path.join(media_url, "reports", filename)
+    response = render(request, "terapia/_linhas_sessao.html", {"atividades_sessao": atividades_sessao})
+    if sessao.encerrada:
+        response.status_code = 286
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-    return render(
-        request,
-        "terapia/dashboard.html",
-        {"sessao": sessao, "atividades": atividades, "report_url": report_url},
+@login_required
+def status_relatorio(request, job_id):
+    """Consulta (polling) do andamento da geração de um relatório de sessão."""
+    job = get_object_or_404(RelatorioSessaoJob, id=job_id, sessao__terapeuta=request.user)
+    return JsonResponse(
+        {
+            "id": job.id,
+            "sessao": job.sessao_id,
+            "status": job.status,
+            "tentativas": job.tentativas,
+            "url": url_relatorio(job),
+            "erro": job.erro or None,
+        }
     )
 
 @login_required
+@ler_da_replica
+@condition(
+    etag_func=lambda request, sessao_id: cache_relatorios.etag_relatorio(sessao_id),
+    last_modified_func=lambda request, sessao_id: cache_relatorios.ultima_modificacao(sessao_id),
+)
 def relatorio_sessao(request, sessao_id):
-    sessao = get_object_or_404(Sessao, id=sessao_id, terapeuta=request.user)
-    atividades = AtividadeSessao.objects.filter(sessao=sessao).order_by("-data_registro")
-    return render(request, "terapia/relatorio_sessao.html", {"sessao": sessao, "atividades": atividades})
+    """Relatório da sessão, servido do cache enquanto a sessão não muda (ETag/304)."""
+    sessao = get_object_or_404(
+        Sessao.objects.select_related("paciente", "terapeuta"), id=sessao_id, terapeuta=request.user
+    )
+
+    def renderizar():
+        atividades = (
+            AtividadeSessao.objects.filter(sessao=sessao)
+            .select_related("atividade_modelo")
+            .order_by("-data_registro")
+        )
+        return render_to_string(
+            "terapia/relatorio_sessao.html", {"sessao": sessao, "atividades": atividades}
+        )
+
+    response = HttpResponse(cache_relatorios.html_relatorio(sessao.id, renderizar))
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @login_required
+@ler_da_replica
 def relatorio_paciente(request, paciente_id):
     paciente = get_object_or_404(Paciente, id=paciente_id, terapeuta=request.user)
 
@@ -372,67 +480,49 @@ def relatorio_paciente(request, paciente_id):
     data_inicio = request.GET.get("data_inicio")
     data_fim = request.GET.get("data_fim")
 
-    atividades = AtividadeSessao.objects.filter(sessao__paciente=paciente)
-
-    if data_inicio and data_fim:
-        atividades = atividades.filter(data_registro__date__range=[data_inicio, data_fim])
+    # Gráficos: lidos do resumo diário, sem reagregar os registros brutos
+    resumo = relatorios.resumo_do_paciente(paciente, data_inicio, data_fim)
+    atividades_labels, positivas, negativas = relatorios.resumo_por_atividade(resumo)
+    dias_labels, positivos_dia, negativos_dia = relatorios.resumo_por_dia(resumo)
 
-    # Agrupar por atividade e resposta
-    dados = (
-        atividades.values("atividade_modelo__descricao", "resposta")
-        .annotate(total=Count("id"))
-        .order_by("atividade_modelo__descricao")
-    )
-
-    # Preparar para gráfico
-    atividades_labels = sorted(set(d["atividade_modelo__descricao"] for d in dados))
-    positivas = []
-    negativas = []
-
-    for atividade in atividades_labels:
-        pos = next((d["total"] for d in dados if d["atividade_modelo__descricao"] == atividade and d["resposta"] == "positiva"), 0)
-        neg = next((d["total"] for d in dados if d["atividade_modelo__descricao"] == atividade and d["resposta"] == "negativa"), 0)
-        positivas.append(pos)
-        negativas.append(neg)
-
-    # Histórico detalhado (dia a dia)
+    # Histórico detalhado (dia a dia); lazy: não consulta se a tabela estiver em cache
     historico = (
-        atividades.annotate(dia=TruncDate("data_registro"))
-        .values("dia", "atividade_modelo__descricao", "resposta")
-        .order_by("dia")
+        relatorios.atividades_do_paciente(paciente, data_inicio, data_fim)
+        .select_related("atividade_modelo")
+        .order_by("data_registro")
     )
 
-    evolucao = (
-        atividades.annotate(dia=TruncDate("data_registro"))
-        .values("dia", "resposta")
-        .annotate(total=Count("id"))
-        .order_by("dia")
-    )
-
-    dias_labels = sorted(set([e["dia"].strftime("%d/%m/%Y") for e in evolucao]))
-    positivos_dia = []
-    negativos_dia = []
-
-    for dia in dias_labels:
-        pos = next((e["total"] for e in evolucao if e["dia"].strftime("%d/%m/%Y") == dia and e["resposta"] == "positiva"), 0)
-        neg = next((e["total"] for e in evolucao if e["dia"].strftime("%d/%m/%Y") == dia and e["resposta"] == "negativa"), 0)
-        positivos_dia.append(pos)
-        negativos_dia.append(neg)
-
     context = {
         "paciente": paciente,
+        "progresso": progresso.progresso_do_paciente(paciente, **_parametros_progresso(request.GET)),
         "data_inicio": data_inicio,
         "data_fim": data_fim,
         "atividades_labels": atividades_labels,
         "positivas": positivas,
         "negativas": negativas,
         "historico": historico,
+        "versao_fragmento": fragmentos.versao(registros=paciente.id, atividades=request.user.id),
         "dias_labels": dias_labels,
         "positivos_dia": positivos_dia,
         "negativos_dia": negativos_dia,
     }
     return render(request, "terapia/relatorio_paciente.html", context)
 
+
+def _parametros_progresso(parametros):
+    """?janela=, ?criterio= (0-1) e ?consecutivas= para as métricas de progresso."""
+    valores = {}
+    for nome, tipo, minimo, maximo in (
+        ("janela", int, 1, 50),
+        ("criterio", float, 0.0, 1.0),
+        ("consecutivas", int, 1, 20),
+    ):
+        try:
+            valores[nome] = min(max(tipo(parametros[nome]), minimo), maximo)
+        except (KeyError, ValueError):
+            pass
+    return valores
+
 # =========================
 # Atividades Modelo
 # =========================
@@ -444,9 +534,7 @@ def lista_atividades(request):
 
 @login_required
 def lista_atividades_modelo(request):
-    atividades = AtividadeModelo.objects.filter(terapeuta=request.user).order_by(
-        "descricao"
-    )
+    atividades = catalogo.catalogo_do_terapeuta(request.user.id).ordenadas
     return render(
         request, "terapia/lista_atividades_modelo.html", {"atividades": atividades}
     )
@@ -510,31 +598,109 @@ def logout_view(request):
     logout(request)
     return redirect("login")
 
+# =========================
+# Métricas
+# =========================
+
+def metricas(request):
+    """Métricas por view no formato texto do Prometheus (staff, DEBUG ou IP liberado)."""
+    permitidos = getattr(settings, "INSTRUMENTACAO_IPS_PERMITIDOS", [])
+    if not (
+        settings.DEBUG
+        or request.user.is_staff
+        or request.META.get("REMOTE_ADDR") in permitidos
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        instrumentacao.texto_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 # =========================
 # API REST Framework (ViewSets)
 # =========================
 
 @login_required
+@ler_da_replica
 def exportar_sessoes_csv(request):
-    sessoes = Sessao.objects.filter(terapeuta=request.user).select_related("paciente")
-    response = HttpResponse(content_type="text/csv")
+    """
+    Exporta as sessões em streaming: o queryset é percorrido em lotes e cada
+    linha é enviada assim que gerada. Filtros opcionais via GET:
+    data_inicio, data_fim (aaaa-mm-dd) e paciente (id).
+    """
+    sessoes = Sessao.objects.filter(terapeuta=request.user)
+    try:
+        sessoes = filtrar_periodo(
+            sessoes, "data_inicio", request.GET.get("data_inicio"), request.GET.get("data_fim")
+        )
+        paciente_id = ler_id(request.GET.get("paciente"), "paciente")
+    except ParametroInvalido as erro:
+        return HttpResponseBadRequest(str(erro))
+    if paciente_id:
+        sessoes = sessoes.filter(paciente_id=paciente_id)
+
+    linhas = (
+        sessoes.order_by("data_inicio", "id")
+        .values_list("paciente__nome", "data_inicio", "encerrada")
+        .iterator(chunk_size=TAMANHO_LOTE)
+    )
+    response = StreamingHttpResponse(
+        linhas_csv(["Paciente", "Data Início", "Encerrada"], linhas),
+        content_type="text/csv",
+    )
     response["Content-Disposition"] = 'attachment; filename="sessoes.csv"'
-    writer = csv.writer(response)
-    writer.writerow(["Paciente", "Data Início", "Encerrada"])
-    for s in sessoes:
-        writer.writerow([s.paciente.nome, s.data_inicio, s.encerrada])
     return response
 
 @login_required
-def exportar_atividades_csv(request, sessao_id):
-    sessao = get_object_or_404(Sessao, id=sessao_id, terapeuta=request.user)
-    registros = AtividadeSessao.objects.filter(sessao=sessao).select_related("atividade_modelo")
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = f'attachment; filename="sessao_{sessao_id}_atividades.csv"'
-    writer = csv.writer(response)
-    writer.writerow(["Atividade", "Resposta", "Horário"])
-    for r in registros:
-        writer.writerow([r.atividade_modelo.descricao, r.resposta, r.tempo_registro])
+@ler_da_replica
+def exportar_atividades_csv(request, sessao_id=None):
+    """
+    Exporta registros de AtividadeSessao em streaming, em lotes.
+
+    Escopo: uma sessão (sessao_id na URL ou ?sessao=), um paciente (?paciente=)
+    ou todas as sessões do terapeuta, com período opcional
+    (?data_inicio=/?data_fim=, aaaa-mm-dd).
+    Formato via ?formato=: csv (padrão), ndjson ou colunar.
+    """
+    formato = request.GET.get("formato", "csv")
+    if formato not in FORMATOS:
+        return HttpResponseBadRequest(f"Formato inválido. Use: {', '.join(FORMATOS)}.")
+    content_type, extensao, gerador = FORMATOS[formato]
+
+    registros = AtividadeSessao.objects.filter(sessao__terapeuta=request.user)
+    try:
+        sessao_id = sessao_id or ler_id(request.GET.get("sessao"), "sessao")
+        paciente_id = ler_id(request.GET.get("paciente"), "paciente")
+        registros = filtrar_periodo(
+            registros, "data_registro", request.GET.get("data_inicio"), request.GET.get("data_fim")
+        )
+    except ParametroInvalido as erro:
+        return HttpResponseBadRequest(str(erro))
+    if sessao_id:
+        sessao = get_object_or_404(Sessao, id=sessao_id, terapeuta=request.user)
+        registros = registros.filter(sessao=sessao)
+        nome_arquivo = f"sessao_{sessao.id}_atividades"
+    elif paciente_id:
+        paciente = get_object_or_404(Paciente, id=paciente_id, terapeuta=request.user)
+        registros = registros.filter(sessao__paciente=paciente)
+        nome_arquivo = f"paciente_{paciente.id}_atividades"
+    else:
+        nome_arquivo = "atividades"
+
+    colunas = ["sessao", "paciente", "atividade", "resposta", "detalhes", "data_registro"]
+    linhas = (
+        registros.order_by("data_registro", "id")
+        .values_list(
+            "sessao_id",
+            "sessao__paciente__nome",
+            "atividade_modelo__descricao",
+            "resposta",
+            "detalhes",
+            "data_registro",
+        )
+        .iterator(chunk_size=TAMANHO_LOTE)
+    )
+    response = StreamingHttpResponse(gerador(colunas, linhas), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{nome_arquivo}.{extensao}"'
     return response
 
 @login_required
@@ -550,47 +716,189 @@ def editar_sessao(request, sessao_id):
         form = SessaoForm(instance=sessao)
     return render(request, "app_aba/form_sessao.html", {"form": form})
 
-class PacienteViewSet(viewsets.ModelViewSet):
+@api_view(["POST"])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def emitir_token(request):
+    """
+    Login da API: {"username", "password"} -> token de acesso (Bearer, vida
+    curta) e token de renovação (ver autenticacao.py).
+    """
+    if not isinstance(request.data, dict):
+        return Response({"detail": 'Envie um objeto com "username" e "password".'}, status=400)
+    usuario = authenticate(
+        request, username=request.data.get("username"), password=request.data.get("password")
+    )
+    if usuario is None or not usuario.is_active:
+        return Response({"detail": "Usuário ou senha inválidos."}, status=400)
+    return Response(autenticacao.emitir_par(usuario))
+
+@api_view(["POST"])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def renovar_token(request):
+    """{"renovacao": "<token de renovação>"} -> novo par (o token de renovação enviado deixa de valer)."""
+    if not isinstance(request.data, dict):
+        return Response({"detail": 'Envie um objeto com "renovacao".'}, status=400)
+    usuario = autenticacao.usuario_da_renovacao(request.data.get("renovacao"))
+    if usuario is None:
+        return Response({"detail": "Token de renovação inválido."}, status=401)
+    return Response(autenticacao.emitir_par(usuario))
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def sincronizar(request):
+    """
+    Sincronização incremental para o app: ?token=<token anterior> (vazio na
+    primeira vez) e ?limite= (linhas por tabela). Repita enquanto "mais" for true.
+    """
+    try:
+        limite = min(int(request.query_params.get("limite", LIMITE_PADRAO)), LIMITE_MAXIMO)
+    except ValueError:
+        limite = LIMITE_PADRAO
+    try:
+        dados = sincronizacao.sincronizar(request.user, request.query_params.get("token"), max(limite, 1))
+    except TokenInvalido as erro:
+        return Response({"detail": str(erro)}, status=400)
+    return Response(dados)
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def resumo_painel(request):
+    """Totais do dia e pacientes sem sessão nos últimos ?dias= dias (padrão 7)."""
+    return Response(painel.resumo_do_terapeuta(request.user.id, _dias_sem_sessao(request.query_params)))
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def analise_coorte(request):
+    """
+    Análises entre pacientes lidas do snapshot colunar (não do banco):
+    ?agrupar=atividade|atividade_modelo|paciente|terapeuta|dia|mes,
+    ?data_inicio=/?data_fim= (aaaa-mm-dd), ?paciente=, ?atividade_modelo=,
+    ?minimo= (respostas por grupo). Supervisores (staff) veem a clínica
+    inteira ou ?terapeuta=; os demais, só os próprios pacientes.
+    """
+    parametros = request.query_params
+    try:
+        filtros = {
+            "agrupar": parametros.get("agrupar", "atividade"),
+            "data_inicio": _data_parametro(parametros.get("data_inicio")),
+            "data_fim": _data_parametro(parametros.get("data_fim")),
+            "paciente_id": _inteiro_parametro(parametros.get("paciente")),
+            "atividade_modelo_id": _inteiro_parametro(parametros.get("atividade_modelo")),
+            "minimo_respostas": _inteiro_parametro(parametros.get("minimo")) or 1,
+            "terapeuta_id": request.user.id,
+        }
+        if request.user.is_staff:
+            filtros["terapeuta_id"] = _inteiro_parametro(parametros.get("terapeuta"))
+        return Response(analise.consultar(**filtros))
+    except ValueError as erro:
+        return Response({"detail": str(erro)}, status=400)
+    except analise.SnapshotIndisponivel as erro:
+        return Response({"detail": str(erro)}, status=503)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def buscar(request):
+    """
+    Typeahead de pacientes e atividades modelo do terapeuta: ?q= (sem
+    diferença de acentos/maiúsculas, por prefixo de palavra ou aproximado),
+    ?tipo=paciente|atividade_modelo (padrão: ambos), ?limite= (até 50).
+    """
+    parametros = request.query_params
+    tipos = parametros.getlist("tipo") or None
+    if tipos and not set(tipos) <= set(busca.TIPOS):
+        return Response({"detail": f"tipo deve ser um de: {', '.join(busca.TIPOS)}."}, status=400)
+    try:
+        limite = min(max(_inteiro_parametro(parametros.get("limite")) or busca.LIMITE_PADRAO, 1), busca.LIMITE_MAXIMO)
+    except ValueError:
+        return Response({"detail": "limite inválido."}, status=400)
+    return Response({"resultados": busca.buscar(request.user.id, parametros.get("q", ""), tipos, limite)})
+
+
+def _data_parametro(valor):
+    return date.fromisoformat(valor) if valor else None
+
+
+def _inteiro_parametro(valor):
+    return int(valor) if valor else None
+
+class OtimizarConsultaMixin:
+    """Aplica select_related conforme os campos pontuados do serializer (e ?fields=)."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        relacoes = relacoes_do_serializer(self.get_serializer())
+        return queryset.select_related(*relacoes) if relacoes else queryset
+
+class PacienteViewSet(ListaNaReplicaMixin, OtimizarConsultaMixin, viewsets.ModelViewSet):
     queryset = Paciente.objects.all()
     serializer_class = PacienteSerializer
+    pagination_class = PacientePaginacao
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.queryset.filter(terapeuta=self.request.user)
+        return super().get_queryset().filter(terapeuta=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(terapeuta=self.request.user)
 
-class SessaoViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=["get"])
+    def progresso(self, request, pk=None):
+        """Taxa móvel, sequências, domínio e tendência por atividade do paciente."""
+        paciente = self.get_object()
+        return Response(
+            progresso.progresso_do_paciente(paciente, **_parametros_progresso(request.query_params))
+        )
+
+class SessaoViewSet(ListaNaReplicaMixin, OtimizarConsultaMixin, viewsets.ModelViewSet):
     queryset = Sessao.objects.all()
     serializer_class = SessaoSerializer
+    pagination_class = SessaoPaginacao
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.queryset.filter(terapeuta=self.request.user)
+        return super().get_queryset().filter(terapeuta=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(terapeuta=self.request.user)
 
-class AtividadeModeloViewSet(viewsets.ModelViewSet):
+class AtividadeModeloViewSet(ListaNaReplicaMixin, OtimizarConsultaMixin, viewsets.ModelViewSet):
     queryset = AtividadeModelo.objects.all()
     serializer_class = AtividadeModeloSerializer
+    pagination_class = AtividadeModeloPaginacao
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.queryset.filter(terapeuta=self.request.user)
+        return super().get_queryset().filter(terapeuta=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(terapeuta=self.request.user)
 
-class AtividadeSessaoViewSet(viewsets.ModelViewSet):
+class AtividadeSessaoViewSet(ListaNaReplicaMixin, OtimizarConsultaMixin, viewsets.ModelViewSet):
     queryset = AtividadeSessao.objects.all()
     serializer_class = AtividadeSessaoSerializer
+    pagination_class = AtividadeSessaoPaginacao
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.queryset.filter(sessao__terapeuta=self.request.user)
+        return super().get_queryset().filter(sessao__terapeuta=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save()
 
+    @action(detail=False, methods=["post"], url_path="lote")
+    def lote(self, request):
+        """
+        Aplica várias criações/atualizações em uma transação:
+        {"operacoes": [{"op": "criar", "chave": "...", "sessao": 1, "atividade_modelo": 2, ...}, ...]}
+        Responde com um resultado por operação, na mesma ordem.
+        """
+        operacoes = request.data.get("operacoes") if isinstance(request.data, dict) else request.data
+        if not isinstance(operacoes, list):
+            return Response({"detail": 'Envie uma lista em "operacoes".'}, status=400)
+        if len(operacoes) > LIMITE_LOTE:
+            return Response({"detail": f"Máximo de {LIMITE_LOTE} operações por lote."}, status=400)
+        return Response({"resultados": aplicar_lote(request.user, operacoes)})
+
@@ -0,0 +1,228 @@
+"""
+Versões async (ORM async do Django) das views do registro de sessão e dos
+relatórios mais lidos, usadas no perfil ASGI (VIEWS_ASYNC=1, ver asgi.py).
+
+Mesmo comportamento das views de views.py. Os querysets são materializados
+com `async for` antes do render (o template não pode consultar o banco no
+event loop); o que depende de transação ou de código síncrono compartilhado
+(vínculo em lote, fila de relatórios, painel) roda em sync_to_async. O
+relatório do paciente renderiza em sync_to_async para o histórico continuar
+lazy atrás do fragmento em cache.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest
+from django.shortcuts import aget_object_or_404, redirect, render
+
+from . import ao_vivo, catalogo, fragmentos, painel, progresso, relatorios
+from .fila_relatorios import enfileirar_relatorio, url_relatorio
+from .forms import DetalheAtividadeSessaoForm
+from .models import AtividadeSessao, Paciente, Sessao
+from .paginacao import TAMANHO_PAGINA_HISTORICO, CursorInvalido, apos_cursor, fechar_pagina
+from .replica import ler_da_replica
+from .sessoes import AtividadesInvalidas, validar_atividades, vincular_atividades
+from .views import _parametros_progresso, sessoes_acompanhaveis
+
+
+async def _usuario(request):
+    """Carrega o usuário pelo caminho async e o fixa em request.user (lido pelos templates)."""
+    request.user = await request.auser()
+    return request.user
+
+
+@sync_to_async
+def _adicionar_atividades(sessao, terapeuta, ids):
+    return vincular_atividades(sessao, validar_atividades(terapeuta, ids))
+
+
+# =========================
+# Sessões e Atividades
+# =========================
+
+@login_required
+async def registrar_atividades_sessao(request, sessao_id):
+    """Atividades já vinculadas na sessão e as que ainda podem ser adicionadas."""
+    usuario = await _usuario(request)
+    sessao = await aget_object_or_404(
+        Sessao.objects.select_related("paciente"), id=sessao_id, terapeuta=usuario
+    )
+
+    if sessao.encerrada:
+        messages.warning(request, "Sessão já encerrada.")
+        return redirect("dashboard")
+
+    if request.method == "POST":
+        ids = request.POST.getlist("atividades")
+        if not ids:
+            messages.info(request, "Selecione ao menos uma atividade.")
+            return redirect("registrar_atividades_sessao", sessao_id=sessao.id)
+
+        try:
+            await _adicionar_atividades(sessao, usuario, ids)
+        except AtividadesInvalidas as erro:
+            messages.error(request, f"Atividades inválidas ou de outro terapeuta: {', '.join(erro.ids)}.")
+            return redirect("registrar_atividades_sessao", sessao_id=sessao.id)
+
+        messages.success(request, "Atividades adicionadas à sessão.")
+        return redirect("registrar_atividades_sessao", sessao_id=sessao.id)
+
+    atividades_sessao = [
+        atividade
+        async for atividade in AtividadeSessao.objects.filter(sessao=sessao)
+        .select_related("atividade_modelo")
+        .order_by("-data_registro")
+    ]
+    catalogo_terapeuta = await sync_to_async(catalogo.catalogo_do_terapeuta)(usuario.id)
+    atividades_disponiveis = catalogo_terapeuta.disponiveis(
+        atividade.atividade_modelo_id for atividade in atividades_sessao
+    )
+    return render(
+        request,
+        "terapia/registrar_atividade.html",
+        {
+            "sessao": sessao,
+            "atividades_sessao": atividades_sessao,
+            "atividades_disponiveis": atividades_disponiveis,
+            "eventos_sse": True,  # perfil ASGI: a lista recebe as alterações por SSE
+        },
+    )
+
+
+@login_required
+async def registrar_detalhes_atividade(request, atividade_sessao_id):
+    usuario = await _usuario(request)
+    atividade_sessao = await aget_object_or_404(
+        AtividadeSessao.objects.select_related("sessao", "atividade_modelo"),
+        id=atividade_sessao_id,
+        sessao__terapeuta=usuario,
+    )
+
+    if request.method == "POST":
+        form = DetalheAtividadeSessaoForm(request.POST, instance=atividade_sessao)
+        if form.is_valid():
+            await form.instance.asave()
+            messages.success(request, "Detalhes da atividade atualizados.")
+            if request.headers.get("HX-Request"):
+                # só a linha alterada; as outras telas da sessão recebem pelo SSE
+                return render(request, "terapia/_atividade_sessao.html", {"atividade": atividade_sessao})
+            return redirect("registrar_atividades_sessao", sessao_id=atividade_sessao.sessao_id)
+    else:
+        form = DetalheAtividadeSessaoForm(instance=atividade_sessao)
+
+    return render(
+        request,
+        "terapia/form_detalhes_atividade.html",
+        {"form": form, "atividade": atividade_sessao},
+    )
+
+
+@login_required
+async def encerrar_sessao(request, sessao_id):
+    usuario = await _usuario(request)
+    sessao = await aget_object_or_404(Sessao, id=sessao_id, terapeuta=usuario)
+
+    if not sessao.encerrada:
+        sessao.encerrada = True
+        await sessao.asave()
+        messages.success(request, "Sessão encerrada com sucesso.")
+    else:
+        messages.info(request, "Sessão já está encerrada.")
+
+    # O relatório é gerado em segundo plano (comando processar_relatorios)
+    relatorio = await sync_to_async(enfileirar_relatorio)(sessao, gerado_por=usuario)
+
+    if request.headers.get("HX-Request"):
+        return render(request, "terapia/_status_sessao.html", {"sessao": sessao})
+
+    return render(
+        request,
+        "terapia/dashboard.html",
+        {
+            "sessao": sessao,
+            "relatorio": relatorio,
+            "report_url": url_relatorio(relatorio),
+            "resumo": await sync_to_async(painel.resumo_do_terapeuta)(usuario.id),
+        },
+    )
+
+
+@login_required
+async def eventos_sessao(request, sessao_id):
+    """Stream SSE com as linhas alteradas da sessão; aguarda no event loop (ver ao_vivo.py)."""
+    usuario = await _usuario(request)
+    sessao = await aget_object_or_404(sessoes_acompanhaveis(usuario), id=sessao_id)
+    estado = ao_vivo.EstadoFluxo(
+        sessao.id,
+        ao_vivo.ponto_de_partida(request.headers.get("Last-Event-ID"), request.GET.get("desde")),
+    )
+    return ao_vivo.resposta_sse(ao_vivo.afluxo(estado))
+
+
+# =========================
+# Relatórios
+# =========================
+
+@login_required
+@ler_da_replica
+async def historico_sessoes(request, paciente_id):
+    usuario = await _usuario(request)
+    paciente = await aget_object_or_404(Paciente, id=paciente_id, terapeuta=usuario)
+    try:
+        sessoes = apos_cursor(
+            relatorios.com_contagens(Sessao.objects.filter(paciente=paciente)),
+            "data_inicio",
+            request.GET.get("cursor"),
+        )
+    except CursorInvalido as erro:
+        return HttpResponseBadRequest(str(erro))
+    sessoes, proximo = fechar_pagina(
+        [sessao async for sessao in sessoes[:TAMANHO_PAGINA_HISTORICO + 1]],
+        "data_inicio",
+        TAMANHO_PAGINA_HISTORICO,
+    )
+    context = {"paciente": paciente, "sessoes": sessoes, "proximo_cursor": proximo}
+    if request.headers.get("HX-Request"):
+        return render(request, "terapia/_historico_linhas.html", context)
+    return render(request, "terapia/historico_sessoes.html", context)
+
+
+@login_required
+@ler_da_replica
+async def relatorio_paciente(request, paciente_id):
+    usuario = await _usuario(request)
+    paciente = await aget_object_or_404(Paciente, id=paciente_id, terapeuta=usuario)
+
+    data_inicio = request.GET.get("data_inicio")
+    data_fim = request.GET.get("data_fim")
+
+    resumo = relatorios.resumo_do_paciente(paciente, data_inicio, data_fim)
+    atividades_labels, positivas, negativas = await relatorios.aresumo_por_atividade(resumo)
+    dias_labels, positivos_dia, negativos_dia = await relatorios.aresumo_por_dia(resumo)
+    # lazy: só é lido se a tabela não estiver em cache (ver o render abaixo)
+    historico = (
+        relatorios.atividades_do_paciente(paciente, data_inicio, data_fim)
+        .select_related("atividade_modelo")
+        .order_by("data_registro")
+    )
+    metricas = await sync_to_async(progresso.progresso_do_paciente)(
+        paciente, **_parametros_progresso(request.GET)
+    )
+
+    context = {
+        "paciente": paciente,
+        "progresso": metricas,
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "atividades_labels": atividades_labels,
+        "positivas": positivas,
+        "negativas": negativas,
+        "historico": historico,
+        "versao_fragmento": await sync_to_async(fragmentos.versao)(registros=paciente.id, atividades=usuario.id),
+        "dias_labels": dias_labels,
+        "positivos_dia": positivos_dia,
+        "negativos_dia": negativos_dia,
+    }
+    # renderiza em thread: o histórico é consultado pelo template só quando
+    # a tabela não está em cache
+    return await sync_to_async(render)(request, "terapia/relatorio_paciente.html", context)